@@ -0,0 +1,59 @@
+"""Benchmark of worker protocols of parallel environments, over environments which
+busy-wait for a given time per step.
+Usage: python benchmarks/parallel_env.py --nworkers 8
+"""
+import time
+from functools import partial
+
+import click
+import gym
+import numpy as np
+
+from rainy.envs import EnvExt, MultiProcEnv, SpinProcEnv
+
+
+class BusyEnv(gym.Env):
+    def __init__(self, cost: float) -> None:
+        self.cost = cost
+        self.observation_space = gym.spaces.Box(-1.0, 1.0, shape=(4,))
+        self.action_space = gym.spaces.Discrete(2)
+
+    def reset(self) -> np.ndarray:
+        return np.zeros(4, dtype=np.float32)
+
+    def step(self, _action) -> tuple:
+        end = time.perf_counter() + self.cost
+        while time.perf_counter() < end:
+            pass
+        return np.ones(4, dtype=np.float32), 1.0, False, {}
+
+
+@click.command()
+@click.option("--nworkers", type=int, default=8)
+@click.option("--envs-per-worker", type=int, default=1)
+@click.option("--nsteps", type=int, default=2000)
+def main(nworkers: int, envs_per_worker: int, nsteps: int) -> None:
+    protocols = {
+        "pipe": partial(MultiProcEnv, envs_per_worker=envs_per_worker),
+        "pipe+shm": partial(
+            MultiProcEnv, shared_memory=True, envs_per_worker=envs_per_worker
+        ),
+        "spin": partial(SpinProcEnv, envs_per_worker=envs_per_worker),
+    }
+    print(f"{'cost':>10}" + "".join(f"{name:>16}" for name in protocols))
+    actions = np.zeros(nworkers, dtype=np.int64)
+    for cost in [0.0, 1e-5, 1e-4, 1e-3]:
+        times = []
+        for make_penv in protocols.values():
+            penv = make_penv(lambda: EnvExt(BusyEnv(cost)), nworkers)
+            penv.reset()
+            start = time.perf_counter()
+            for _ in range(nsteps):
+                penv.step(actions)
+            times.append((time.perf_counter() - start) / nsteps)
+            penv.close()
+        print(f"{cost * 1e6:>8.0f}us" + "".join(f"{t * 1e6:>14.1f}us" for t in times))
+
+
+if __name__ == "__main__":
+    main()
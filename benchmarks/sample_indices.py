@@ -0,0 +1,54 @@
+"""Benchmark of rainy.utils.sample_indices against the old rejection loop
+and numpy.random.Generator.choice.
+Usage: python benchmarks/sample_indices.py
+"""
+import timeit
+
+import click
+import numpy as np
+
+from rainy.utils import sample_indices
+
+
+def sample_indices_loop(n: int, k: int) -> np.ndarray:
+    """The old implementation, which runs a Python loop over k"""
+    if 3 * k >= n:
+        return np.random.choice(n, k, replace=False)
+    selected = np.repeat(False, n)
+    rands = np.random.randint(0, n, size=k * 2)
+    j = k
+    for i in range(k):
+        x = rands[i]
+        while selected[x]:
+            if j == 2 * k:
+                rands[k:] = np.random.randint(0, n, size=k)
+                j = k
+            x = rands[i] = rands[j]
+            j += 1
+        selected[x] = True
+    return rands[:k]
+
+
+@click.command()
+@click.option("--number", type=int, default=1000)
+def main(number: int) -> None:
+    rng = np.random.default_rng()
+    samplers = {
+        "sample_indices": sample_indices,
+        "loop": sample_indices_loop,
+        "generator": lambda n, k: rng.choice(n, k, replace=False),
+    }
+    print(f"{'n':>10} {'k':>6}" + "".join(f"{name:>16}" for name in samplers))
+    for n in [1000, 100000, 1000000]:
+        for k in [32, 256, 1024]:
+            if k > n:
+                continue
+            times = [
+                timeit.timeit(lambda: sampler(n, k), number=number) / number
+                for sampler in samplers.values()
+            ]
+            print(f"{n:>10} {k:>6}" + "".join(f"{t * 1e6:>14.1f}us" for t in times))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Benchmark of stepping all environments by `step` against stepping the first
+`batch_size` ready environments by `send` and `recv`, over environments whose
+resets are slow, like Atari environments with NoopResetEnv.
+Usage: python benchmarks/straggler_env.py --nworkers 8 --batch-size 4
+"""
+import time
+
+import click
+import gym
+import numpy as np
+
+from rainy.envs import EnvExt, MultiProcEnv
+
+
+class SlowResetEnv(gym.Env):
+    def __init__(self, step_cost: float, reset_cost: float, length: int) -> None:
+        self.step_cost = step_cost
+        self.reset_cost = reset_cost
+        self.length = length
+        self.rng = np.random.default_rng()
+        self.observation_space = gym.spaces.Box(-1.0, 1.0, shape=(4,))
+        self.action_space = gym.spaces.Discrete(2)
+
+    def reset(self) -> np.ndarray:
+        time.sleep(self.reset_cost)
+        return np.zeros(4, dtype=np.float32)
+
+    def step(self, _action) -> tuple:
+        time.sleep(self.step_cost)
+        # Episodes end at random, so that workers reset at different times
+        done = self.rng.random() < 1.0 / self.length
+        return np.ones(4, dtype=np.float32), 1.0, done, {}
+
+
+@click.command()
+@click.option("--nworkers", type=int, default=8)
+@click.option("--batch-size", type=int, default=4)
+@click.option("--nsteps", type=int, default=4000, help="Steps of all environments")
+@click.option("--step-cost", type=float, default=1e-4)
+@click.option("--reset-cost", type=float, default=1e-2)
+@click.option("--length", type=int, default=100, help="Mean episode length")
+def main(
+    nworkers: int,
+    batch_size: int,
+    nsteps: int,
+    step_cost: float,
+    reset_cost: float,
+    length: int,
+) -> None:
+    def make_penv() -> MultiProcEnv:
+        return MultiProcEnv(
+            lambda: EnvExt(SlowResetEnv(step_cost, reset_cost, length)), nworkers
+        )
+
+    actions = np.zeros(nworkers, dtype=np.int64)
+    penv = make_penv()
+    penv.reset()
+    start = time.perf_counter()
+    for _ in range(nsteps // nworkers):
+        penv.step(actions)
+    sync = (time.perf_counter() - start) / nsteps
+    penv.close()
+
+    penv = make_penv()
+    penv.reset()
+    start = time.perf_counter()
+    penv.send(actions)
+    for _ in range(nsteps // batch_size):
+        envids, _ = penv.recv(batch_size)
+        penv.send(actions[:batch_size], envids)
+    ready = (time.perf_counter() - start) / nsteps
+    penv.recv(nworkers)
+    penv.close()
+    print(f"{'step':>12}{'recv':>12}")
+    print(f"{sync * 1e6:>10.1f}us{ready * 1e6:>10.1f}us")
+
+
+if __name__ == "__main__":
+    main()
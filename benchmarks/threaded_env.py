@@ -0,0 +1,80 @@
+"""Benchmark of ThreadedParallelEnv against MultiProcEnv and DummyParallelEnv.
+ThreadedParallelEnv is the fastest for simulators which release the GIL (`atari`,
+`pybullet` and `sleep`, which waits in time.sleep), while MultiProcEnv is for
+simulators written in Python (`python`, which busy-waits holding the GIL).
+Usage: python benchmarks/threaded_env.py --env atari --nworkers 8
+"""
+import time
+from typing import Optional
+
+import click
+import gym
+import numpy as np
+
+from rainy.envs import (
+    Atari,
+    DummyParallelEnv,
+    EnvExt,
+    MultiProcEnv,
+    PyBullet,
+    ThreadedParallelEnv,
+)
+
+
+class WaitEnv(gym.Env):
+    def __init__(self, cost: float, release_gil: bool) -> None:
+        self.cost = cost
+        self.release_gil = release_gil
+        self.observation_space = gym.spaces.Box(-1.0, 1.0, shape=(84, 84))
+        self.action_space = gym.spaces.Discrete(2)
+
+    def reset(self) -> np.ndarray:
+        return np.zeros((84, 84), dtype=np.float32)
+
+    def step(self, _action) -> tuple:
+        if self.release_gil:
+            time.sleep(self.cost)
+        else:
+            end = time.perf_counter() + self.cost
+            while time.perf_counter() < end:
+                pass
+        return np.ones((84, 84), dtype=np.float32), 1.0, False, {}
+
+
+ENVS = {
+    "atari": lambda: Atari("Breakout"),
+    "pybullet": lambda: PyBullet("Hopper"),
+    "sleep": lambda: EnvExt(WaitEnv(1e-3, release_gil=True)),
+    "python": lambda: EnvExt(WaitEnv(1e-4, release_gil=False)),
+}
+
+
+@click.command()
+@click.option("--env", type=click.Choice(list(ENVS.keys())), default="sleep")
+@click.option("--nworkers", type=int, default=8)
+@click.option("--nsteps", type=int, default=1000)
+@click.option("--nthreads", type=int, default=None, help="CPU cores by default")
+def main(env: str, nworkers: int, nsteps: int, nthreads: Optional[int]) -> None:
+    penvs = {
+        "dummy": DummyParallelEnv,
+        "multiproc": MultiProcEnv,
+        "multiproc+shm": lambda g, n: MultiProcEnv(g, n, shared_memory=True),
+        "threaded": lambda g, n: ThreadedParallelEnv(g, n, nthreads=nthreads),
+    }
+    print("".join(f"{name:>16}" for name in penvs))
+    times = []
+    for make_penv in penvs.values():
+        penv = make_penv(ENVS[env], nworkers)
+        states = penv.reset()
+        start = time.perf_counter()
+        for _ in range(nsteps):
+            actions = penv._spec.random_actions(nworkers)
+            states = penv.step(actions).states
+            penv.extract(states)
+        times.append((time.perf_counter() - start) / nsteps)
+        penv.close()
+    print("".join(f"{t * 1e6:>14.1f}us" for t in times))
+
+
+if __name__ == "__main__":
+    main()
@@ -11,7 +11,6 @@ from rainy.net import bootstrap
 from rainy.replay import BootDQNReplayFeed, UniformReplayBuffer
 
 
-@rainy.main(BootDQNAgent, os.path.realpath(__file__))
 def main(
     max_steps: int = 100000,
     size: int = 20,
@@ -40,4 +39,5 @@ def main(
 
 
 if __name__ == "__main__":
-    main()
+    # Not decorated at import, so that bootdqn_deepsea_sweep.py can use main
+    rainy.main(BootDQNAgent, os.path.realpath(__file__))(main)
@@ -0,0 +1,71 @@
+"""Runs bootdqn_deepsea.py over a grid of sizes and seeds in a process pool, and
+reports steps to solve DeepSea, i.e., total steps until the mean return of the last
+`window` episodes exceeds 0.9.
+Usage: python bootdqn_deepsea_sweep.py --sizes 10,20,40 --nseeds 4 --nprocs 8
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Deque, Dict, Optional, Tuple
+
+import click
+import numpy as np
+import torch
+from bootdqn_deepsea import main as deepsea_config
+
+from rainy.agents import BootDQNAgent
+from rainy.utils import ExperimentLogger
+
+
+def steps_to_solve(
+    size: int, seed: int, max_steps: int, window: int, rpf: bool
+) -> Optional[int]:
+    # Parallelism comes from the pool
+    torch.set_num_threads(1)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+    c = deepsea_config(max_steps=max_steps, size=size, rpf=rpf)
+    c.seed = seed
+    c.logger = ExperimentLogger(show_summary=False)
+    c.logger.setup_from_script_path(__file__, dirname=f"size{size}-seed{seed}")
+    ag = BootDQNAgent(c)
+    returns: Deque[float] = deque(maxlen=window)
+    try:
+        for results in ag.train_episodes(max_steps):
+            returns.extend(r.return_ for r in results)
+            if len(returns) == window and np.mean(returns) > 0.9:
+                return ag.total_steps
+        return None
+    finally:
+        ag.close()
+
+
+@click.command()
+@click.option("--sizes", type=str, default="10,20,30,40")
+@click.option("--nseeds", type=int, default=4)
+@click.option("--max-steps", type=int, default=1000000)
+@click.option("--window", type=int, default=10)
+@click.option("--nprocs", type=int, default=4)
+@click.option("--rpf", is_flag=True)
+def main(
+    sizes: str, nseeds: int, max_steps: int, window: int, nprocs: int, rpf: bool
+) -> None:
+    grid = [(int(size), seed) for size in sizes.split(",") for seed in range(nseeds)]
+    results: Dict[Tuple[int, int], Optional[int]] = {}
+    with ProcessPoolExecutor(nprocs) as pool:
+        futures = {
+            key: pool.submit(steps_to_solve, *key, max_steps, window, rpf)
+            for key in grid
+        }
+        for key, future in futures.items():
+            results[key] = future.result()
+            click.echo(f"size: {key[0]} seed: {key[1]} steps to solve: {results[key]}")
+    click.echo(f"{'size':>6} {'solved':>8} {'median steps':>14}")
+    for size in sorted({size for size, _ in grid}):
+        steps = [results[size, seed] for seed in range(nseeds)]
+        solved = [s for s in steps if s is not None]
+        median = np.median(solved) if len(solved) > 0 else float("nan")
+        click.echo(f"{size:>6} {len(solved):>5}/{nseeds:<2} {median:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,7 @@ from rainy import Config, net
 from rainy.agents import DoubleDQNAgent
 from rainy.envs import Atari
 from rainy.lib.explore import EpsGreedy, LinearCooler
+from rainy.replay import DQNReplayFeed, FrameReplayBuffer
 
 
 @rainy.main(DoubleDQNAgent, script_path=os.path.realpath(__file__))
@@ -19,6 +20,7 @@ def main(envname: str = "Breakout") -> Config:
     c.set_explorer(lambda: EpsGreedy(1.0, LinearCooler(1.0, 0.1, int(1e6))))
     c.set_net_fn("dqn", net.value.dqn_conv())
     c.replay_size = int(1e6)
+    c.set_replay_buffer(lambda capacity: FrameReplayBuffer(DQNReplayFeed, capacity))
     c.replay_batch_size = 32
     c.train_start = 50000
     c.sync_freq = 10000
@@ -7,6 +7,7 @@ from rainy import Config, net
 from rainy.agents import DQNAgent
 from rainy.envs import Atari
 from rainy.lib.explore import EpsGreedy, LinearCooler
+from rainy.replay import CompressedFrameReplayBuffer, DQNReplayFeed, FrameReplayBuffer
 
 
 @rainy.main(DQNAgent, script_path=os.path.realpath(__file__))
@@ -15,6 +16,7 @@ def main(
     max_steps: int = int(2e7),
     replay_size: int = int(1e6),
     replay_batch_size: int = 32,
+    compress_replay: bool = False,
 ) -> Config:
     c = Config()
     c.set_env(lambda: Atari(envname))
@@ -24,6 +26,8 @@ def main(
     c.set_explorer(lambda: EpsGreedy(1.0, LinearCooler(1.0, 0.1, int(1e6))))
     c.set_net_fn("dqn", net.value.dqn_conv())
     c.replay_size = replay_size
+    replay_cls = CompressedFrameReplayBuffer if compress_replay else FrameReplayBuffer
+    c.set_replay_buffer(lambda capacity: replay_cls(DQNReplayFeed, capacity))
     c.replay_batch_size = replay_batch_size
     c.train_start = 50000
     c.sync_freq = 10000
@@ -4,6 +4,7 @@ from torch.optim import Adam
 
 import rainy
 from rainy.agents import SACAgent
+from rainy.replay import ArrayReplayBuffer, DQNReplayFeed
 
 
 @rainy.main(SACAgent, os.path.realpath(__file__))
@@ -22,6 +23,7 @@ def main(
     c.set_optimizer(lambda params: Adam(params, lr=3e-4), key="critic")
     c.set_optimizer(lambda params: Adam(params, lr=3e-4), key="entropy")
     c.replay_size = int(1e6)
+    c.set_replay_buffer(lambda capacity: ArrayReplayBuffer(DQNReplayFeed, capacity))
     c.train_start = int(1e4)
     c.eval_deterministic = True
     c.eval_freq = c.max_steps // 100
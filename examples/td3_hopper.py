@@ -5,6 +5,7 @@ from torch.optim import Adam
 import rainy
 from rainy.agents import TD3Agent
 from rainy.lib import explore
+from rainy.replay import DQNReplayFeed, TensorReplayBuffer
 
 
 @rainy.main(TD3Agent, os.path.realpath(__file__))
@@ -22,6 +23,9 @@ def main(
     c.set_optimizer(lambda params: Adam(params, lr=1e-3), key="actor")
     c.set_optimizer(lambda params: Adam(params, lr=1e-3), key="critic")
     c.replay_size = int(1e6)
+    c.set_replay_buffer(
+        lambda capacity: TensorReplayBuffer(DQNReplayFeed, capacity, device=c.device)
+    )
     c.train_start = int(1e4)
     c.set_explorer(lambda: explore.GaussianNoise())
     c.set_explorer(lambda: explore.Greedy(), key="eval")
@@ -76,6 +76,20 @@ class A2CAgent(A2CLikeAgent[State]):
         actions = policy.action().squeeze().cpu().numpy()
         return actions, dict(rnn_state=rnns, policy=policy, value=value)
 
+    @torch.no_grad()
+    def ready_actions(
+        self, states: Array[State], envids: Array[int]
+    ) -> Tuple[Array[Action], dict]:
+        x, rnns, masks = self._network_in(states)
+        ids = torch.as_tensor(envids, device=masks.device)
+        policy, value, rnns = self.net(x[envids], rnns[ids], masks[ids])
+        # Rows of other environments are copied from the first ready one and unused
+        rows = torch.zeros(self.config.nworkers, dtype=torch.long, device=ids.device)
+        rows[ids] = torch.arange(len(envids), device=ids.device)
+        policy = policy.take(rows)
+        actions = policy.action().squeeze().cpu().numpy()[envids]
+        return actions, dict(rnn_state=rnns[rows], policy=policy, value=value[rows])
+
     def _pre_backward(self, _policy: Policy, _value: torch.Tensor) -> None:
         pass
 
@@ -14,6 +14,7 @@ from torch import BoolTensor, LongTensor, Tensor
 from torch.nn import functional as F
 
 from ..config import Config
+from ..envs import PEnvTransition
 from ..lib.explore import EpsGreedy
 from ..net import OptionActorCriticNet, TerminationCriticNet
 from ..net.policy import BernoulliPolicy, Policy
@@ -264,7 +265,7 @@ class ACTCAgent(A2CLikeAgent[State]):
     def _one_step(self, states: Array[State]) -> Array[State]:
         actions, net_outputs = self.actions(states)
         transition = self.penv.step(actions)
-        transition = replace(transiiton, rewards=transiiton.rewards * self.reward_scale)
+        transition = replace(transition, rewards=transition.rewards * self.reward_scale)
         opt_terminals = net_outputs["opt_terminals"].cpu().numpy()
         states = self.penv.extract(transition.states)
         self.option_initial_states[opt_terminals] = states[opt_terminals]
@@ -273,9 +274,22 @@ class ACTCAgent(A2CLikeAgent[State]):
         )
         self.returns += transition.rewards
         self.episode_length += 1
-        self._report_reward(transition.terminals, transition.infos)
+        self._report_reward(transition.terminals, transition.episodes)
         return transition.states
 
+    def _push_ragged(
+        self,
+        envids: Array[int],
+        row: int,
+        transition: PEnvTransition,
+        net_outputs: dict,
+    ) -> None:
+        opt_terminals = net_outputs["opt_terminals"].cpu().numpy()[envids]
+        states = self.penv.extract(transition.states)
+        initial_ids = envids[opt_terminals]
+        self.option_initial_states[initial_ids] = states[opt_terminals]
+        super()._push_ragged(envids, row, transition, net_outputs)
+
     @torch.no_grad()
     def _next_uo(self, states: Tensor, beta_next: Tensor) -> Tensor:
         qo = self.ac_net.qo(states)
@@ -1,9 +1,11 @@
 import copy
+import inspect
 import warnings
 from abc import ABC, abstractmethod
 from dataclasses import replace
 from pathlib import Path
 from typing import (
+    Any,
     Callable,
     ClassVar,
     Dict,
@@ -20,16 +22,25 @@ import click
 import numpy as np
 import torch
 from torch import Tensor, nn
+from torch.nn import functional as F
 
 from ..config import Config
-from ..envs import EnvTransition, ParallelEnv
+from ..envs import EnvTransition, EpisodeStats, ParallelEnv, PEnvTransition
 from ..lib import mpi
 from ..net import DummyRnn, RnnState
-from ..prelude import DEFAULT_SAVEFILE_NAME, Action, Array, State
-from ..replay import ReplayFeed
+from ..prelude import DEFAULT_SAVEFILE_NAME, REPLAY_DIRNAME, Action, Array, State
+from ..replay import ReplayBatch, ReplayBuffer, ReplayFeed
 
 Netout = Dict[str, Tensor]
 
+# Save files have pickled objects like policies, which newer PyTorch doesn't load
+# by default
+_LOAD_KWARGS = (
+    dict(weights_only=False)
+    if "weights_only" in inspect.signature(torch.load).parameters
+    else {}
+)
+
 
 class EpisodeResult(NamedTuple):
     return_: np.float32
@@ -157,20 +168,33 @@ class Agent(ABC):
     def save(self, filename: str, directory: Optional[Path] = None) -> None:
         if not mpi.IS_MPI_ROOT:
             return None
+        if directory is None:
+            directory = self.logger.logdir
         save_dict = {}
         for member_str in self.SAVED_MEMBERS:
             value = getattr(self, member_str)
             if isinstance(value, nn.DataParallel):
                 save_dict[member_str] = value.module.state_dict()
+            elif isinstance(value, ReplayBuffer):
+                save_dict[member_str] = self._save_replay(value, directory, filename)
             elif hasattr(value, "state_dict"):
                 save_dict[member_str] = value.state_dict()
             else:
                 save_dict[member_str] = value
-        if directory is None:
-            directory = self.logger.logdir
         self.savedict_hook(save_dict)
         torch.save(save_dict, directory.joinpath(filename))
 
+    @staticmethod
+    def _save_replay(replay: ReplayBuffer, directory: Path, filename: str) -> Any:
+        """Replay buffers are saved as chunks in `directory/REPLAY_DIRNAME/filename`,
+        so that each save file is loaded with the replay saved with it.
+        Unchanged chunks are linked from the directory of the last save.
+        """
+        try:
+            return replay.save_chunks(directory.joinpath(REPLAY_DIRNAME, filename))
+        except NotImplementedError:
+            return replay
+
     def loaddict_hook(self, load_dict: dict) -> bool:
         pass
 
@@ -182,7 +206,9 @@ class Agent(ABC):
             return False
         if path.is_dir():
             path.joinpath(DEFAULT_SAVEFILE_NAME)
-        saved_dict = torch.load(path, map_location=self.config.device.unwrapped)
+        saved_dict = torch.load(
+            path, map_location=self.config.device.unwrapped, **_LOAD_KWARGS
+        )
         for member_str in self.SAVED_MEMBERS:
             if member_str in saved_dict:
                 saved_item = saved_dict[member_str]
@@ -191,6 +217,9 @@ class Agent(ABC):
                 continue
             self.loadmember_hook(member_str, saved_item)
             mem = getattr(self, member_str)
+            if isinstance(mem, ReplayBuffer) and isinstance(saved_item, dict):
+                mem.load_chunks(saved_item)
+                continue
             is_dataparallel = isinstance(mem, nn.DataParallel)
             if is_dataparallel or hasattr(mem, "state_dict"):
                 try:
@@ -228,45 +257,130 @@ class DQNLikeAgent(Agent, Generic[State, Action, ReplayFeed]):
     def __init__(self, config: Config) -> None:
         super().__init__(config)
         self.update_steps = 1
+        # Fractional updates carried over to the next steps, for replay_ratio
+        self._update_credit = 0.0
 
     @abstractmethod
     def action(self, state: State) -> Action:
         pass
 
     @abstractmethod
-    def train(self, replay_feed: ReplayFeed) -> None:
+    def train(self, batch: ReplayBatch) -> None:
         pass
 
     def store_transition(
         self,
         state: State,
         action: Action,
-        transiiton: EnvTransition,
+        transition: EnvTransition,
     ) -> None:
         self.replay.append(
-            state, action, transiiton.state, transition.reward, transiiton.terminal
+            state, action, transition.state, transition.reward, transition.terminal
+        )
+
+    def store_transitions(
+        self,
+        states: Array[State],
+        actions: Array[Action],
+        next_states: Array[State],
+        rewards: Array[float],
+        terminals: Array[bool],
+        envids: Optional[Array[int]] = None,
+    ) -> None:
+        """Store transitions from parallel environments `envids` at once"""
+        self.replay.append_batch(
+            states, actions, next_states, rewards, terminals, envids=envids
         )
 
+    def sample_batch(self) -> ReplayBatch:
+        return self.replay.sample_batch(self.config.replay_batch_size, self.env.extract)
+
+    def _num_updates(self, nsteps: int) -> int:
+        ratio = self.config.replay_ratio
+        if ratio is None:
+            return int(self.total_steps % self.config.update_freq == 0)
+        self._update_credit += ratio * nsteps
+        n = int(self._update_credit)
+        self._update_credit -= n
+        return n
+
+    def train_replay(self, nsteps: int = 1) -> None:
+        """Train the agent after `nsteps` environment steps.
+        The number of updates is decided by `replay_ratio` or `update_freq`, and
+        batches for all of them are sampled at once.
+        """
+        if not self.train_started:
+            return
+        n = self._num_updates(nsteps)
+        if n == 0:
+            return
+        batch_size = self.config.replay_batch_size
+        for batch in self.replay.sample_batches(n, batch_size, self.env.extract):
+            self.train(batch)
+            self.update_steps += 1
+
+    def _discounts(self, batch: ReplayBatch) -> Tensor:
+        """Discount factors for the values of next states.
+        N-step replay buffers give them per transition.
+        """
+        if batch.discounts is None:
+            terminals = self.tensor(batch.terminals).float()
+            return terminals.neg_().add_(1.0).mul_(self.config.discount_factor)
+        return self.tensor(batch.discounts)
+
+    def _td_loss(
+        self, batch: ReplayBatch, prediction: Tensor, target: Tensor
+    ) -> Tensor:
+        """MSE loss between predicted and target values.
+        If the batch is from a prioritized buffer, weights the loss by importance
+        sampling weights and sends TD errors back to the buffer.
+        """
+        if batch.weights is None:
+            return F.mse_loss(prediction, target)
+        td_error = target - prediction
+        self._update_priorities(batch, td_error)
+        return td_error.pow(2).mul(self.tensor(batch.weights)).mean()
+
+    def _update_priorities(self, batch: ReplayBatch, td_error: Tensor) -> None:
+        td_abs = td_error.detach().abs()
+        if td_abs.dim() > 1:
+            td_abs = td_abs.mean(dim=-1)
+        self.replay.update_priorities(batch.indices, td_abs.cpu().numpy())
+
     @property
     def train_started(self) -> bool:
         return self.config.train_start <= self.total_steps
 
-    def batch_actions(self, states: Array[State], penv: ParallelEnv) -> Array[Action]:
+    def network_log(self, **kwargs) -> None:
+        kwargs.update(self.replay.stats())
+        super().network_log(**kwargs)
+
+    def close(self) -> None:
+        super().close()
+        self.replay.close()
+
+    def batch_actions(
+        self,
+        states: Array[State],
+        penv: ParallelEnv,
+        envids: Optional[Array[int]] = None,
+    ) -> Array[Action]:
+        """Actions of parallel environments `envids`, or all environments if None"""
         raise NotImplementedError(f"{type(self)} does not support action_parallel!")
 
     def train_episodes(self, max_steps: int) -> Iterable[List[EpisodeResult]]:
         if self.config.seed is not None:
             self.env.seed(self.config.seed)
         state = self.env.reset()
+        self.replay.end_episode()
         return_, episode_length = 0.0, 0
         reward_scale = self.config.reward_scale
         while True:
             action = self.action(state)
-            transition = replace(transition, rewards=transition.rewards * reward_scale)
-            self.store_transition(state, action, transiiton)
-            if self.train_started and self.total_steps % self.config.update_freq == 0:
-                self.train(self.replay.sample(self.config.replay_batch_size))
-                self.update_steps += 1
+            transition = self.env.step(action)
+            transition = replace(transition, reward=transition.reward * reward_scale)
+            self.store_transition(state, action, transition)
+            self.train_replay()
             # Set next state
             state = transition.state
             # Update statistics
@@ -279,6 +393,7 @@ class DQNLikeAgent(Agent, Generic[State, Action, ReplayFeed]):
             if res is not None:
                 yield [res]
                 state = self.env.reset()
+                self.replay.end_episode()
                 return_ = 0.0
                 episode_length = 0
             if self.total_steps >= max_steps:
@@ -332,10 +447,11 @@ class A2CLikeAgent(Agent, Generic[State]):
         states = self.eval_penv.reset()
         while True:
             actions = self.eval_action_parallel(self.penv.extract(states))
-            states, rewards, done, info = self.eval_penv.step(actions)
+            transition = self.eval_penv.step(actions)
+            states = transition.states
             self.episode_length += 1
-            self.returns[:n] += rewards
-            self._report_reward(_done(done), info)
+            self.returns[:n] += transition.rewards
+            self._report_reward(_done(transition.terminals), transition.episodes)
             if n <= len(self.episode_results):
                 break
 
@@ -352,6 +468,18 @@ class A2CLikeAgent(Agent, Generic[State]):
     def actions(self, states: Array[State]) -> Tuple[Array[Action], dict]:
         pass
 
+    def ready_actions(
+        self, states: Array[State], envids: Array[int]
+    ) -> Tuple[Array[Action], dict]:
+        """Returns actions of environments `envids`, and network outputs of all
+        environments where only rows of `envids` are used.
+        By default, it runs the network on all environments, since agents with
+        per-worker states (e.g., options) update them for all rows. Agents should
+        override it to run the network only on `envids` if they can.
+        """
+        actions, net_outputs = self.actions(states)
+        return np.asarray(actions)[envids], net_outputs
+
     @abstractmethod
     def train(self, last_states: Array[State]) -> None:
         pass
@@ -367,11 +495,13 @@ class A2CLikeAgent(Agent, Generic[State]):
     def rnn_init(self) -> RnnState:
         return DummyRnn.DUMMY_STATE
 
-    def _report_reward(self, done: Array[bool], info: Array[dict]) -> None:
+    def _report_reward(
+        self, done: Array[bool], episodes: Optional[EpisodeStats]
+    ) -> None:
         if self.penv.use_reward_monitor:
-            for i in filter(lambda i: "episode" in i, info):
+            for i in np.flatnonzero(episodes.done):
                 self.episode_results.append(
-                    EpisodeResult(i["episode"]["r"], i["episode"]["l"])
+                    EpisodeResult(episodes.returns[i], episodes.lengths[i])
                 )
         else:
             for i in filter(lambda i: done[i], range(len(done))):
@@ -390,9 +520,68 @@ class A2CLikeAgent(Agent, Generic[State]):
         )
         self.returns += transition.rewards
         self.episode_length += 1
-        self._report_reward(transition.terminals, transition.infos)
+        self._report_reward(transition.terminals, transition.episodes)
         return transition.states
 
+    def _push_ragged(
+        self,
+        envids: Array[int],
+        row: int,
+        transition: PEnvTransition,
+        net_outputs: dict,
+    ) -> None:
+        self.storage.push_ragged(
+            envids,
+            row,
+            transition.states,
+            transition.rewards,
+            transition.terminals,
+            **net_outputs,
+        )
+
+    def _ragged_rollout(self) -> Array[State]:
+        """Steps each environment `nsteps` times by `ParallelEnv.send`, and computes
+        actions as soon as the first `env_batch_size` environments are ready.
+        Actions of ready environments are computed by `ready_actions` from the last
+        row of the storage.
+        """
+        nworkers, nsteps = self.config.nworkers, self.config.nsteps
+        steps = np.zeros(nworkers, dtype=np.int64)
+        sent_at = np.zeros(nworkers, dtype=np.int64)
+        busy = np.zeros(nworkers, dtype=np.bool_)
+        outputs: Dict[int, dict] = {}
+        ready, tick = np.arange(nworkers), 0
+        while True:
+            if len(ready) > 0:
+                actions, outputs[tick] = self.ready_actions(
+                    self.storage.states[-1], ready
+                )
+                self.penv.send(actions, ready)
+                sent_at[ready] = tick
+                busy[ready] = True
+                tick += 1
+            if not busy.any():
+                break
+            batch_size = min(self.config.env_batch_size, int(busy.sum()))
+            envids, transition = self.penv.recv(batch_size)
+            busy[envids] = False
+            rewards = transition.rewards * self.reward_scale
+            transition = replace(transition, rewards=rewards)
+            keys = np.stack((sent_at[envids], steps[envids]), axis=1)
+            for t, row in np.unique(keys, axis=0):
+                group = np.flatnonzero((keys == (t, row)).all(axis=1))
+                self._push_ragged(envids[group], row, transition[group], outputs[t])
+            steps[envids] += 1
+            for t in set(outputs) - set(sent_at[busy]):
+                del outputs[t]
+            self.returns[envids] += rewards
+            self.episode_length[envids] += 1
+            done = np.zeros(nworkers, dtype=np.bool_)
+            done[envids] = transition.terminals
+            self._report_reward(done, transition.episodes)
+            ready = envids[steps[envids] < nsteps]
+        return self.storage.states[-1]
+
     def initialize_rollouts(self) -> None:
         self.storage.initialize()
 
@@ -407,8 +596,11 @@ class A2CLikeAgent(Agent, Generic[State]):
         states = self.penv.reset()
         self._reset(states)
         while True:
-            for _ in range(self.config.nsteps):
-                states = self._one_step(states)
+            if self.config.env_batch_size is None:
+                for _ in range(self.config.nsteps):
+                    states = self._one_step(states)
+            else:
+                states = self._ragged_rollout()
             self.train(states)
             self.total_steps += self.step_width
             if len(self.episode_results) > 0:
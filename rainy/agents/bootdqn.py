@@ -14,14 +14,30 @@ from torch import Tensor
 from torch.nn import functional as F
 
 from ..config import Config
-from ..envs import EnvTransition
+from ..envs import EnvTransition, ParallelEnv
 from ..prelude import Action, Array, State
-from ..replay import BootDQNReplayFeed
+from ..replay import BootDQNReplayFeed, ReplayBatch
 from .base import DQNLikeAgent, Netout
 
+# Number of masks generated at once for store_transition
+MASK_POOL_SIZE = 1024
+
+
+def unpack_masks(packed: Tensor, num_ensembles: int) -> Tensor:
+    """Unpack masks packed by `np.packbits(masks, axis=-1)` on the device"""
+    shifts = torch.arange(7, -1, -1, dtype=torch.uint8, device=packed.device)
+    bits = (packed.unsqueeze(-1) >> shifts) & 1
+    return bits.flatten(start_dim=-2)[..., :num_ensembles].bool()
+
 
 class BootDQNAgent(DQNLikeAgent):
+    """Bootstrapped DQN, which acts by the Q-function of `active_head` until the
+    episode ends. With parallel environments, each environment has its own head in
+    `active_heads`, which is re-drawn only when its episode ends.
+    """
+
     SAVED_MEMBERS = "net", "policy", "total_steps", "target_net"
+    SUPPORT_PARALLEL_ENV = True
 
     def __init__(self, config: Config) -> None:
         super().__init__(config)
@@ -32,8 +48,15 @@ class BootDQNAgent(DQNLikeAgent):
         self.optimizer = config.optimizer(self.net.parameters())
         self.policy = config.explorer()
         self.eval_policy = config.explorer(key="eval")
-        self.replay = config.replay_buffer()
+        self._mask_pool = self._masks(0)
+        self._mask_index = 0
+        self.replay = config.replay_buffer(
+            self.env._spec, ensemble_mask=self._masks(1)[0]
+        )
         self.active_head = 0
+        self.active_heads = np.random.randint(
+            config.num_ensembles, size=config.nworkers
+        )
         if self.replay.feed is not BootDQNReplayFeed:
             raise RuntimeError("BootDQNAgent needs BootDQNReplayFeed")
 
@@ -52,41 +75,88 @@ class BootDQNAgent(DQNLikeAgent):
         else:
             return self.env._spec.random_action()
 
+    @torch.no_grad()
+    def batch_actions(
+        self,
+        states: Array[State],
+        penv: ParallelEnv,
+        envids: Optional[Array[int]] = None,
+    ) -> Array[Action]:
+        if self.train_started:
+            heads = self.active_heads if envids is None else self.active_heads[envids]
+            # Q-values of all heads are computed at once, and rows take their heads
+            qs = self.net(penv.extract(states))
+            rows = torch.arange(len(heads), device=qs.device)
+            qs = qs[rows, torch.as_tensor(heads, device=qs.device)]
+            return self.policy.select_from_value(qs).squeeze_().numpy()
+        else:
+            return self.env._spec.random_actions(states.shape[0])
+
+    def _masks(self, n: int) -> Array[np.uint8]:
+        """Masks some observations per ensemble, which are packed into bits"""
+        randn = np.random.uniform(0, 1, (n, self.config.num_ensembles))
+        return np.packbits(randn < self.config.replay_prob, axis=-1)
+
     def store_transition(
         self,
         state: State,
         action: Action,
         transition: EnvTransition,
     ) -> None:
-        randn = np.random.uniform(0, 1, self.config.num_ensembles)
-        # Masks some observations per ensemble
-        mask = randn < self.config.replay_prob
+        if self._mask_index == len(self._mask_pool):
+            self._mask_pool = self._masks(MASK_POOL_SIZE)
+            self._mask_index = 0
+        mask = self._mask_pool[self._mask_index]
+        self._mask_index += 1
         self.replay.append(
             state,
             action,
             transition.state,
             transition.reward,
-            transiiton.terminal,
+            transition.terminal,
             mask,
         )
         # If the episode ends, change the executing policy
-        if terminal:
+        if transition.terminal:
             self.active_head = np.random.randint(self.config.num_ensembles)
 
+    def store_transitions(
+        self,
+        states: Array[State],
+        actions: Array[Action],
+        next_states: Array[State],
+        rewards: Array[float],
+        terminals: Array[bool],
+        envids: Optional[Array[int]] = None,
+    ) -> None:
+        masks = self._masks(len(states))
+        self.replay.append_batch(
+            states, actions, next_states, rewards, terminals, masks, envids=envids
+        )
+        if envids is None:
+            envids = np.arange(len(states))
+        # Heads of environments whose episodes end are re-drawn
+        ended = envids[np.asarray(terminals, dtype=np.bool_)]
+        self.active_heads[ended] = np.random.randint(
+            self.config.num_ensembles, size=len(ended)
+        )
+
     @torch.no_grad()
     def _q_next(self, next_states: Array) -> Tensor:
         return self.net(next_states).max(axis=-1)[0]
 
-    def train(self, replay_feed: BootDQNReplayFeed) -> None:
-        obs = [ob.to_array(self.env.extract) for ob in replay_feed]
-        states, actions, next_states, rewards, done, mask = map(np.asarray, zip(*obs))
-        q_next = self._q_next(next_states)
-        r = self.tensor(rewards).unsqueeze_(-1)
-        discount = self.tensor(1.0 - done).mul_(self.config.discount_factor)
-        q_target = r + discount.unsqueeze_(-1) * q_next
-        q_current = self.net.q_s_a(states, actions)
+    def train(self, batch: ReplayBatch) -> None:
+        q_next = self._q_next(batch.next_states)
+        r = self.tensor(batch.rewards).unsqueeze_(-1)
+        q_target = r + self._discounts(batch).unsqueeze_(-1) * q_next
+        q_current = self.net.q_s_a(batch.states, batch.actions)
         loss = F.mse_loss(q_current, q_target, reduction="none")
-        masked_loss = loss.masked_select(self.tensor(mask, dtype=torch.bool)).mean()
+        if batch.weights is not None:
+            self._update_priorities(batch, q_target - q_current)
+            loss = loss.mul(self.tensor(batch.weights).unsqueeze_(-1))
+        packed = self.config.device.tensor(batch.masks, dtype=torch.uint8)
+        mask = unpack_masks(packed, self.config.num_ensembles)
+        masked_loss = loss.masked_select(mask).mean()
         self._backward(masked_loss, self.optimizer, self.net.parameters())
         self.network_log(q_value=q_current.mean().item(), value_loss=masked_loss.item())
         if self.update_steps > 0 and self.update_steps % self.config.sync_freq == 0:
@@ -6,7 +6,6 @@ This module has an simple implementation of DDPG, which is described in
 from copy import deepcopy
 from typing import Optional
 
-import numpy as np
 import torch
 from torch import Tensor
 from torch.nn import functional as F
@@ -14,7 +13,7 @@ from torch.nn import functional as F
 from ..config import Config
 from ..envs import ParallelEnv
 from ..prelude import Action, Array, State
-from ..replay import DQNReplayFeed
+from ..replay import ReplayBatch
 from .base import DQNLikeAgent, Netout
 
 
@@ -30,7 +29,7 @@ class DDPGAgent(DQNLikeAgent):
         self.critic_opt = config.optimizer(self.net.critic_params(), key="critic")
         self.explorer = config.explorer()
         self.eval_explorer = config.explorer(key="eval")
-        self.replay = config.replay_buffer()
+        self.replay = config.replay_buffer(self.env._spec)
         self.batch_indices = config.device.indices(config.replay_batch_size)
 
     def set_mode(self, train: bool = True) -> None:
@@ -52,7 +51,12 @@ class DDPGAgent(DQNLikeAgent):
             action = self.env._spec.random_action()
         return self.env._spec.clip_action(action)
 
-    def batch_actions(self, states: Array[State], penv: ParallelEnv) -> Array[Action]:
+    def batch_actions(
+        self,
+        states: Array[State],
+        penv: ParallelEnv,
+        envids: Optional[Array[int]] = None,
+    ) -> Array[Action]:
         if self.train_started:
             states = penv.extract(states)
             with torch.no_grad():
@@ -67,13 +71,11 @@ class DDPGAgent(DQNLikeAgent):
         actions = self.target_net.action(next_states)
         return self.target_net.q_value(next_states, actions)
 
-    def train(self, replay_feed: DQNReplayFeed) -> None:
-        obs = [ob.to_array(self.env.extract) for ob in replay_feed]
-        states, actions, next_states, rewards, done = map(np.asarray, zip(*obs))
-        q_next = self._q_next(next_states)
-        q_next = self._q_next(next_states).squeeze_().mul_(self.tensor(1.0 - done))
-        q_target = self.tensor(rewards).add_(q_next.mul_(self.config.discount_factor))
-        action, q_current = self.net(states, actions)
+    def train(self, batch: ReplayBatch) -> None:
+        states = batch.states
+        q_next = self._q_next(batch.next_states).squeeze_()
+        q_target = self.tensor(batch.rewards).add_(q_next.mul_(self._discounts(batch)))
+        action, q_current = self.net(states, batch.actions)
 
         #  Backward critic loss
         critic_loss = F.mse_loss(q_current.squeeze_(), q_target)
@@ -10,15 +10,13 @@ Corresponding papers:
 from copy import deepcopy
 from typing import Optional
 
-import numpy as np
 import torch
 from torch import Tensor
-from torch.nn import functional as F
 
 from ..config import Config
 from ..envs import ParallelEnv
 from ..prelude import Action, Array, State
-from ..replay import DQNReplayFeed
+from ..replay import DQNReplayFeed, ReplayBatch
 from .base import DQNLikeAgent, Netout
 
 
@@ -35,7 +33,7 @@ class DQNAgent(DQNLikeAgent):
         self.optimizer = config.optimizer(self.net.parameters())
         self.policy = config.explorer()
         self.eval_policy = config.explorer(key="eval")
-        self.replay = config.replay_buffer()
+        self.replay = config.replay_buffer(self.env._spec)
         if self.replay.feed is not DQNReplayFeed:
             raise RuntimeError("DQNAgent needs DQNReplayFeed")
         self.batch_indices = config.device.indices(config.replay_batch_size)
@@ -53,7 +51,12 @@ class DQNAgent(DQNLikeAgent):
         else:
             return self.env._spec.random_action()
 
-    def batch_actions(self, states: Array[State], penv: ParallelEnv) -> Array[Action]:
+    def batch_actions(
+        self,
+        states: Array[State],
+        penv: ParallelEnv,
+        envids: Optional[Array[int]] = None,
+    ) -> Array[Action]:
         if self.train_started:
             states = penv.extract(states)
             return self.policy.select_action(states, self.net).squeeze_().numpy()
@@ -64,14 +67,12 @@ class DQNAgent(DQNLikeAgent):
     def _q_next(self, next_states: Array) -> Tensor:
         return self.target_net(next_states).max(axis=-1)[0]
 
-    def train(self, replay_feed: DQNReplayFeed) -> None:
-        obs = [ob.to_array(self.env.extract) for ob in replay_feed]
-        states, actions, next_states, rewards, done = map(np.asarray, zip(*obs))
-        q_next = self._q_next(next_states).squeeze_()
-        discount = self.tensor(1.0 - done).mul_(self.config.discount_factor)
-        q_target = self.tensor(rewards).add_(q_next.mul_(discount))
-        q_prediction = self.net(states)[self.batch_indices, actions]
-        loss = F.mse_loss(q_prediction, q_target)
+    def train(self, batch: ReplayBatch) -> None:
+        q_next = self._q_next(batch.next_states).squeeze_()
+        q_next.mul_(self._discounts(batch))
+        q_target = self.tensor(batch.rewards).add_(q_next)
+        q_prediction = self.net(batch.states)[self.batch_indices, batch.actions]
+        loss = self._td_loss(batch, q_prediction, q_target)
         self._backward(loss, self.optimizer, self.net.parameters())
         self.network_log(q_value=q_prediction.mean().item(), value_loss=loss.item())
         if self.update_steps > 0 and self.update_steps % self.config.sync_freq == 0:
@@ -19,7 +19,7 @@ from ..config import Config
 from ..envs import ParallelEnv
 from ..net import Policy, SeparatedSACNet
 from ..prelude import Action, Array, State
-from ..replay import DQNReplayFeed
+from ..replay import ReplayBatch
 from .base import DQNLikeAgent, Netout
 
 
@@ -61,7 +61,7 @@ class SACAgent(DQNLikeAgent):
         self.target_net = self.net.get_target()
         self.actor_opt = config.optimizer(self.net.actor_params(), key="actor")
         self.critic_opt = config.optimizer(self.net.critic_params(), key="critic")
-        self.replay = config.replay_buffer()
+        self.replay = config.replay_buffer(self.env._spec)
         self.batch_indices = config.device.indices(config.replay_batch_size)
 
         if self.config.automatic_entropy_tuning:
@@ -95,7 +95,12 @@ class SACAgent(DQNLikeAgent):
             action = self.env._spec.random_action()
         return self.env._spec.clip_action(action)
 
-    def batch_actions(self, states: Array[State], penv: ParallelEnv) -> Array[Action]:
+    def batch_actions(
+        self,
+        states: Array[State],
+        penv: ParallelEnv,
+        envids: Optional[Array[int]] = None,
+    ) -> Array[Action]:
         if self.train_started:
             states = penv.extract(states)
             with torch.no_grad():
@@ -116,10 +121,9 @@ class SACAgent(DQNLikeAgent):
         q1, q2 = self.target_net.q_values(next_states, policy.action())
         return torch.min(q1, q2).squeeze_() - alpha * policy.log_prob()
 
-    def train(self, replay_feed: DQNReplayFeed) -> None:
-        obs = [ob.to_array(self.env.extract) for ob in replay_feed]
-        states, actions, next_states, rewards, done = map(np.asarray, zip(*obs))
-        q1, q2, policy = self.net(states, actions)
+    def train(self, batch: ReplayBatch) -> None:
+        states = batch.states
+        q1, q2, policy = self.net(states, batch.actions)
 
         # Backward policy loss
         log_pi, new_q = self._logpi_and_q(states, policy)
@@ -128,8 +132,8 @@ class SACAgent(DQNLikeAgent):
         self._backward(policy_loss, self.actor_opt, self.net.actor_params())
 
         #  Backward critic loss
-        q_next = self._q_next(next_states, alpha).mul_(self.tensor(1.0 - done))
-        q_target = self.tensor(rewards).add_(q_next.mul_(self.config.discount_factor))
+        q_next = self._q_next(batch.next_states, alpha)
+        q_target = self.tensor(batch.rewards).add_(q_next.mul_(self._discounts(batch)))
         q1_loss = F.mse_loss(q1.squeeze_(), q_target)
         q2_loss = F.mse_loss(q2.squeeze_(), q_target)
         self._backward(q1_loss + q2_loss, self.critic_opt, self.net.critic_params())
@@ -6,14 +6,13 @@ This module has an implementation of
 """
 from copy import deepcopy
 
-import numpy as np
 import torch
 from torch import Tensor
 from torch.nn import functional as F
 
 from ..config import Config
 from ..prelude import Array
-from ..replay import DQNReplayFeed
+from ..replay import ReplayBatch
 from .base import DQNLikeAgent
 from .ddpg import DDPGAgent
 
@@ -28,7 +27,7 @@ class TD3Agent(DDPGAgent):
         self.explorer = config.explorer()
         self.target_explorer = config.explorer(key="target")
         self.eval_explorer = config.explorer(key="eval")
-        self.replay = config.replay_buffer()
+        self.replay = config.replay_buffer(self.env._spec)
         self.batch_indices = config.device.indices(config.replay_batch_size)
         self.action_range = tuple(
             torch.from_numpy(t) for t in self.env._spec._act_range
@@ -44,12 +43,11 @@ class TD3Agent(DDPGAgent):
         q1, q2 = self.target_net.q_values(next_states, actions)
         return torch.min(q1, q2)
 
-    def train(self, replay_feed: DQNReplayFeed) -> None:
-        obs = [ob.to_array(self.env.extract) for ob in replay_feed]
-        states, actions, next_states, rewards, done = map(np.asarray, zip(*obs))
-        q_next = self._q_next(next_states).squeeze_().mul_(self.tensor(1.0 - done))
-        q_target = self.tensor(rewards).add_(q_next.mul_(self.config.discount_factor))
-        q1, q2 = self.net.q_values(states, actions)
+    def train(self, batch: ReplayBatch) -> None:
+        states = batch.states
+        q_next = self._q_next(batch.next_states).squeeze_()
+        q_target = self.tensor(batch.rewards).add_(q_next.mul_(self._discounts(batch)))
+        q1, q2 = self.net.q_values(states, batch.actions)
 
         #  Backward critic loss
         q1_loss = F.mse_loss(q1.squeeze_(), q_target)
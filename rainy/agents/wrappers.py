@@ -1,8 +1,10 @@
+import itertools
 from pathlib import Path
 from typing import Iterable, List, Optional
 
 import numpy as np
 
+from ..envs import EpisodeStats, PEnvTransition
 from ..prelude import Action, Array, State
 from .base import Agent, DQNLikeAgent, EpisodeResult, Netout
 
@@ -15,44 +17,146 @@ class DQNLikeParallel(Agent):
         super().__init__(agent.config)
         self.agent = agent
         self.penv = self.config.parallel_env()
-        self.episode_length = np.zeros(self.config.nworkers, dtype=np.int)
+        self._check_double_buffered()
+        self.episode_length = np.zeros(self.config.nworkers, dtype=np.int64)
         self.rewards = np.zeros(self.config.nworkers, dtype=np.float32)
 
-    def _results(self, terminals: Array[bool], info: Array[dict]) -> None:
+    def _check_double_buffered(self) -> None:
+        """SpinProcEnv can't step a process while it steps another half, so halves
+        must be split on process boundaries.
+        """
+        spin = self.penv.as_cls("SpinProcEnv")
+        if not self.config.double_buffered_env or spin is None:
+            return
+        half = self.config.nworkers // 2
+        if half % spin.envs_per_worker != 0:
+            self.penv.close()
+            raise ValueError(
+                f"double_buffered_env needs envs_per_worker ({spin.envs_per_worker})"
+                f" of SpinProcEnv to divide nworkers // 2 ({half})"
+            )
+
+    def _results(
+        self,
+        terminals: Array[bool],
+        episodes: Optional[EpisodeStats],
+        indices: Optional[Array[int]] = None,
+    ) -> List[EpisodeResult]:
         res = []
+        if indices is None:
+            indices = np.arange(self.config.nworkers)
         if self.penv.use_reward_monitor:
-            for i in filter(lambda i: "episode" in i, info):
-                res.append(EpisodeResult(i["episode"]["r"], i["episode"]["l"]))
+            for i in np.flatnonzero(episodes.done):
+                res.append(EpisodeResult(episodes.returns[i], episodes.lengths[i]))
         else:
-            for i in filter(lambda i: terminals[i], range(self.config.nworkers)):
+            for i in indices[np.asarray(terminals, dtype=bool)]:
                 res.append(EpisodeResult(self.rewards[i], self.episode_length[i]))
                 self.rewards[i] = 0.0
                 self.episode_length[i] = 0
         return res
 
-    def step(self, states: Array[State]) -> tuple:
+    def step(self, states: Array[State]) -> PEnvTransition:
         actions = self.agent.batch_actions(states, self.penv)
-        next_states, rewards, terminals, infos = self.penv.step(actions)
-        for transition in zip(states, actions, next_states, rewards, terminals):
-            self.agent.store_transition(*transition)
-        return next_states, rewards, terminals, infos
+        transition = self.penv.step(actions)
+        next_states, rewards, terminals, _ = transition
+        self.agent.store_transitions(states, actions, next_states, rewards, terminals)
+        return transition
+
+    def _step_async(self, states: Array[State], indices: Array[int]) -> tuple:
+        actions = self.agent.batch_actions(states[indices], self.penv, indices)
+        self.penv.step_async(actions, indices)
+        return indices, actions
+
+    def _train_double_buffered(
+        self, states: Array[State], max_steps: int
+    ) -> Iterable[List[EpisodeResult]]:
+        half = self.config.nworkers // 2
+        halves = np.arange(half), np.arange(half, self.config.nworkers)
+        ag = self.agent
+        pending = self._step_async(states, halves[0])
+        for i in itertools.count(1):
+            # Actions of one half are computed while the other half is stepped.
+            # After max_steps, the half in flight is stored without stepping another
+            next_pending = None
+            if self.total_steps < max_steps:
+                next_pending = self._step_async(states, halves[i % 2])
+            indices, actions = pending
+            transition = self.penv.step_wait()
+            next_states, rewards, terminals, _ = transition
+            ag.store_transitions(
+                states[indices], actions, next_states, rewards, terminals, indices
+            )
+            states[indices] = next_states
+            results = self._update(indices, transition)
+            if len(results) > 0:
+                yield results
+            if next_pending is None:
+                break
+            pending = next_pending
+
+    def _train_ready(
+        self, states: Array[State], max_steps: int
+    ) -> Iterable[List[EpisodeResult]]:
+        ag = self.agent
+        actions = ag.batch_actions(states, self.penv)
+        self.penv.send(actions)
+        while True:
+            # Ids of ready environments are ragged, in the order they get ready
+            indices, transition = self.penv.recv(self.config.env_batch_size)
+            next_states, rewards, terminals, _ = transition
+            next_actions = ag.batch_actions(next_states, self.penv, indices)
+            # batch_actions squeezes a batch of size 1
+            next_actions = next_actions.reshape(len(indices), *actions.shape[1:])
+            self.penv.send(next_actions, indices)
+            ag.store_transitions(
+                states[indices],
+                actions[indices],
+                next_states,
+                rewards,
+                terminals,
+                indices,
+            )
+            states[indices] = next_states
+            actions[indices] = next_actions
+            results = self._update(indices, transition)
+            if len(results) > 0:
+                yield results
+            if self.total_steps >= max_steps:
+                break
+        self.penv.recv(self.config.nworkers)
+
+    def _update(
+        self, indices: Array[int], transition: PEnvTransition
+    ) -> List[EpisodeResult]:
+        """Trains the agent and updates statistics after stepping `indices`"""
+        ag = self.agent
+        ag.train_replay(len(indices))
+        self.rewards[indices] += transition.rewards
+        self.episode_length[indices] += 1
+        ag.total_steps += len(indices)
+        self.total_steps = ag.total_steps
+        return self._results(transition.terminals, transition.episodes, indices)
 
     def train_episodes(self, max_steps: int) -> Iterable[List[EpisodeResult]]:
         self.config.set_parallel_seeds(self.penv)
         states = self.penv.reset()
         ag = self.agent
+        if self.config.double_buffered_env and self.config.nworkers >= 2:
+            yield from self._train_double_buffered(np.array(states), max_steps)
+            return
+        if self.config.env_batch_size is not None:
+            yield from self._train_ready(np.array(states), max_steps)
+            return
         while True:
-            states, rewards, terminals, infos = self.step(states)
-            # Train
-            if ag.train_started and ag.total_steps % self.config.update_freq == 0:
-                ag.train(ag.replay.sample(self.config.replay_batch_size))
-                ag.update_steps += 1
+            transition = self.step(states)
+            states, rewards, terminals, _ = transition
+            ag.train_replay(self.config.nworkers)
             # Update stats
             self.rewards += rewards
             self.episode_length += 1
             ag.total_steps += self.config.nworkers
             self.total_steps = ag.total_steps
-            results = self._results(terminals, infos)
+            results = self._results(terminals, transition.episodes)
             if len(results) > 0:
                 yield results
             if self.total_steps >= max_steps:
@@ -3,7 +3,7 @@ from typing import Any, Callable, Container, Dict, List, Optional, Sequence, Uni
 from torch import nn
 from torch.optim import Optimizer, RMSprop
 
-from .envs import ClassicControl, DummyParallelEnv, EnvExt, EnvGen, ParallelEnv
+from .envs import ClassicControl, DummyParallelEnv, EnvExt, EnvGen, EnvSpec, ParallelEnv
 from .lib import mpi
 from .lib.explore import Cooler, DummyCooler, EpsGreedy, Explorer, LinearCooler
 from .lib.hooks import EvalHook
@@ -11,7 +11,14 @@ from .lib.kfac import KfacPreConditioner, PreConditioner
 from .net import actor_critic, bootstrap, deterministic, option_critic, sac, value
 from .net.prelude import NetFn
 from .prelude import Params
-from .replay import DQNReplayFeed, ReplayBuffer, UniformReplayBuffer
+from .replay import (
+    ArrayReplayBuffer,
+    DQNReplayFeed,
+    MemmapReplayBuffer,
+    PrefetchReplayBuffer,
+    ReplayBuffer,
+    UniformReplayBuffer,
+)
 from .utils import Device, ExperimentLogger
 
 
@@ -31,7 +38,11 @@ class Config:
         # Replay buffer
         self.replay_batch_size = 64
         self.replay_size = 10000
+        # Bytes of the replay buffer, which decides its capacity if set
+        self.replay_budget: Optional[int] = None
         self.train_start = 1000
+        # Number of batches sampled in a background thread (0 disables prefetching)
+        self.replay_prefetch = 0
         self.__replay: Callable[
             [int], ReplayBuffer
         ] = lambda capacity: UniformReplayBuffer(DQNReplayFeed, capacity=capacity)
@@ -42,6 +53,9 @@ class Config:
 
         # For DQN-like algorithms
         self.update_freq = 1
+        # Number of updates per environment step (e.g., 0.25 or 4), which overrides
+        # update_freq if set
+        self.replay_ratio: Optional[float] = None
         self.sync_freq = 1000
         self.__explore: Dict[Optional[str], Callable[[], Explorer]] = {
             None: lambda: EpsGreedy(1.0, LinearCooler(1.0, 0.1, 10000)),
@@ -69,6 +83,13 @@ class Config:
 
         # For multi worker algorithms
         self.nworkers = 1
+        # Step two halves of workers in turn, so that one half is simulated while
+        # actions of the other half are computed (only used by DQNLikeParallel)
+        self.double_buffered_env = False
+        # If not None, environments are stepped by `ParallelEnv.send` and the first
+        # `env_batch_size` ready ones are returned by `recv`, so that environments
+        # slow to step (e.g., resetting) don't stall others
+        self.env_batch_size: Optional[int] = None
 
         # For n-step algorithms
         self.nsteps = 1
@@ -196,8 +217,34 @@ class Config:
     ) -> None:
         self.__precond = precond
 
-    def replay_buffer(self) -> ReplayBuffer:
-        return self.__replay(self.replay_size)
+    def replay_capacity(self, spec: Optional[EnvSpec] = None, **examples: Any) -> int:
+        """Returns the capacity of the replay buffer.
+        If `replay_budget` is set, the capacity is computed from `spec` and examples
+        of fields other than state, action, reward and done.
+        """
+        if self.replay_budget is None:
+            return self.replay_size
+        if spec is None:
+            raise ValueError("replay_budget needs EnvSpec of the environment")
+        probe = self.__replay(1)
+        if not isinstance(probe, ArrayReplayBuffer):
+            raise ValueError(f"replay_budget is not supported by {type(probe)}")
+        capacity = probe.capacity_for(self.replay_budget, spec, **examples)
+        probe.close()
+        return capacity
+
+    def replay_buffer(
+        self, spec: Optional[EnvSpec] = None, **examples: Any
+    ) -> ReplayBuffer:
+        replay = self.__replay(self.replay_capacity(spec, **examples))
+        if isinstance(replay, ArrayReplayBuffer):
+            replay.set_discount_factor(self.discount_factor)
+        if isinstance(replay, MemmapReplayBuffer):
+            replay.set_directory(lambda: self.logger.logdir)
+        if self.replay_prefetch > 0:
+            pin_memory = self.device.unwrapped.type == "cuda"
+            replay = PrefetchReplayBuffer(replay, self.replay_prefetch, pin_memory)
+        return replay
 
     def set_replay_buffer(self, replay: Callable[[int], ReplayBuffer]) -> None:
         self.__replay = replay
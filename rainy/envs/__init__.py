@@ -5,9 +5,11 @@ import numpy as np
 
 from ..prelude import Array, Self, State
 from .atari_wrappers import LazyFrames, make_atari, wrap_deepmind
+from .cartpole_ext import CartPoleSwingUpContinuousVector, CartPoleSwingUpVector
+from .deepsea import DeepSeaVector  # noqa
 from .deepsea import DeepSea as DeepSeaGymEnv
 from .ext import EnvExt, EnvSpec, EnvTransition  # noqa
-from .monitor import RewardMonitor
+from .monitor import EpisodeStats, RewardMonitor  # noqa
 from .obs_wrappers import AddTimeStep, NormalizeObs, ScaleObs, TransposeObs  # noqa
 from .parallel import (  # noqa
     DummyParallelEnv,
@@ -22,6 +24,9 @@ from .parallel_wrappers import (  # noqa
     NormalizeRewardParallel,
     ParallelEnvWrapper,
 )
+from .spin import SpinProcEnv  # noqa
+from .threaded import ThreadedParallelEnv  # noqa
+from .vector import VectorEnv  # noqa
 
 
 class AtariConfig:
@@ -103,9 +108,19 @@ class Atari(EnvExt):
             return obs
 
 
-def atari_parallel(frame_stack: bool = True) -> Callable[[EnvGen, int], ParallelEnv]:
+def atari_parallel(
+    frame_stack: bool = True, shared_memory: bool = False, threaded: bool = False
+) -> Callable[[EnvGen, int], ParallelEnv]:
+    """If `shared_memory`, frames are sent through shared memory instead of pipes.
+    If `threaded`, environments are stepped by threads in this process.
+    """
+
     def __wrap(env_gen: EnvGen, num_workers: int) -> ParallelEnv:
-        penv: ParallelEnv = MultiProcEnv(env_gen, num_workers)
+        penv: ParallelEnv
+        if threaded:
+            penv = ThreadedParallelEnv(env_gen, num_workers)
+        else:
+            penv = MultiProcEnv(env_gen, num_workers, shared_memory=shared_memory)
         if frame_stack:
             penv = FrameStackParallel(penv)
         return penv
@@ -129,6 +144,17 @@ class DeepSea(EnvExt):
         super().__init__(env)
 
 
+def deepsea_vector(
+    size: int, noise: float = 0.0
+) -> Callable[[EnvGen, int], ParallelEnv]:
+    """DeepSeaVector for `Config.set_parallel_env`, which doesn't use the env_gen"""
+
+    def __wrap(_env_gen: EnvGen, num_workers: int) -> ParallelEnv:
+        return DeepSeaVector(num_workers, size, noise)
+
+    return __wrap
+
+
 class RLPyGridWorld(EnvExt):
     """
     Class for RLPy3 grid world.
@@ -171,7 +197,7 @@ class RLPyGridWorld(EnvExt):
             env._max_episode_steps = max_steps
         self.domain = env.unwrapped.domain  # Get RLPy domain
         obs_fn, obs_space = gridworld_obs(self.domain, mode=obs_type)
-        super().__init__(env, obs_space.shape)
+        super().__init__(env, obs_space.shape, obs_space.dtype)
         self.obs_fn = obs_fn
         self.obs_type = obs_type
 
@@ -236,9 +262,16 @@ def pybullet_parallel(
     obs_clip: float = 10.0,
     reward_clip: float = 10.0,
     gamma: float = 0.99,
+    threaded: bool = False,
 ) -> Callable[[EnvGen, int], ParallelEnv]:
+    """If `threaded`, environments are stepped by threads in this process"""
+
     def __wrap(env_gen: EnvGen, num_workers: int) -> ParallelEnv:
-        penv: ParallelEnv = MultiProcEnv(env_gen, num_workers)
+        penv: ParallelEnv
+        if threaded:
+            penv = ThreadedParallelEnv(env_gen, num_workers)
+        else:
+            penv = MultiProcEnv(env_gen, num_workers)
         if normalize_obs:
             penv = NormalizeObsParallel(penv, obs_clip=obs_clip)
         if normalize_reward:
@@ -248,6 +281,24 @@ def pybullet_parallel(
     return __wrap
 
 
+def swingup_vector(
+    version: int = 0, continuous: bool = False, max_steps: Optional[int] = 1000
+) -> Callable[[EnvGen, int], ParallelEnv]:
+    """Vectorized `CartPoleSwingUp-v{version}` (or `CartPoleSwingUpContinuous`)
+    for `Config.set_parallel_env`, which doesn't use the given env_gen
+    """
+
+    def __wrap(_env_gen: EnvGen, num_workers: int) -> ParallelEnv:
+        if continuous:
+            params = CONTINUOUS_SWINGUP_PARAMS[version]
+            return CartPoleSwingUpContinuousVector(num_workers, max_steps, **params)
+        else:
+            params = SWINGUP_PARAMS[version]
+            return CartPoleSwingUpVector(num_workers, max_steps, **params)
+
+    return __wrap
+
+
 SWINGUP_PARAMS = [
     # Same as bsuite
     dict(start_position="bottom", allow_noop=True),
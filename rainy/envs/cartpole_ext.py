@@ -1,15 +1,28 @@
+from typing import Optional, Tuple
+
 import numpy as np
 from gym import logger, spaces
 from gym.envs.classic_control import CartPoleEnv
 
+from ..prelude import Array
+from .ext import EnvSpec
+from .vector import VectorEnv
+
 F32_MAX = np.finfo(np.float32).max
 
-__all__ = ["CartPoleSwingUp", "CartPoleSwingUpContinuous"]
+__all__ = [
+    "CartPoleSwingUp",
+    "CartPoleSwingUpContinuous",
+    "CartPoleSwingUpVector",
+    "CartPoleSwingUpContinuousVector",
+]
 
 
 class _SwingUpCommon:
-    def _forward(self, force):
-        x, x_dot, theta, theta_dot = self.state
+    """Dynamics of swing-up, where states can be arrays of multiple environments"""
+
+    def _forward(self, state, force):
+        x, x_dot, theta, theta_dot = state
         costheta, sintheta = np.cos(theta), np.sin(theta)
         temp = (
             force + self.polemass_length * theta_dot * theta_dot * sintheta
@@ -31,22 +44,22 @@ class _SwingUpCommon:
             theta = theta + self.tau * theta_dot
         return x, x_dot, theta, theta_dot
 
+    def _reward(self, x, theta, theta_dot):
+        is_upright = np.cos(theta) > self._height_threshold
+        is_upright &= np.abs(theta_dot) < self._theta_dot_threshold
+        is_upright &= np.abs(x) < self._x_reward_threshold
+        return np.where(is_upright, 1.0, 0.0 - self._move_cost)
+
     def _step(self, force):
-        x, x_dot, theta, theta_dot = self._forward(force)
+        x, x_dot, theta, theta_dot = self._forward(self.state, force)
         done = bool(x < -self.x_threshold or x > self.x_threshold)
 
-        def _reward():
-            is_upright = np.cos(theta) > self._height_threshold
-            is_upright &= np.abs(theta_dot) < self._theta_dot_threshold
-            is_upright &= np.abs(x) < self._x_reward_threshold
-            return 1.0 if is_upright else 0.0 - self._move_cost
-
         if not done:
-            reward = _reward()
+            reward = float(self._reward(x, theta, theta_dot))
         elif self.steps_beyond_done is None:
             # Pole just fell!
             self.steps_beyond_done = 0
-            reward = _reward()
+            reward = float(self._reward(x, theta, theta_dot))
         else:
             if self.steps_beyond_done == 0:
                 logger.warn("You are calling 'step()' after the episode ending.")
@@ -56,15 +69,31 @@ class _SwingUpCommon:
         self.state = x, x_dot, theta, theta_dot
         return reward, done
 
+    def _initial_state(self, rng, n=None):
+        size = (4,) if n is None else (n, 4)
+        state = rng.uniform(-0.05, 0.05, size=size)
+        if self.start_position == 0:
+            state[..., 2] = rng.uniform(-np.pi, np.pi, size=size[:-1])
+        else:
+            state[..., 2] += np.pi
+        return state
+
+    def _obs_of(self, state):
+        x, x_dot, theta, theta_dot = state
+        obs = np.stack(
+            [
+                x / self.x_threshold,
+                x_dot / self.x_threshold,
+                np.sin(theta),
+                np.cos(theta),
+                theta_dot,
+            ],
+            axis=-1,
+        )
+        return obs.astype(np.float32)
+
     def _obs(self):
-        x, x_dot, theta, theta_dot = self.state
-        obs = np.zeros(5, dtype=np.float32)
-        obs[0] = x / self.x_threshold
-        obs[1] = x_dot / self.x_threshold
-        obs[2] = np.sin(theta)
-        obs[3] = np.cos(theta)
-        obs[4] = theta_dot
-        return obs
+        return self._obs_of(self.state)
 
 
 class CartPoleSwingUp(CartPoleEnv, _SwingUpCommon):
@@ -108,11 +137,7 @@ class CartPoleSwingUp(CartPoleEnv, _SwingUpCommon):
         return self._obs(), reward, done, {}
 
     def reset(self):
-        self.state = self.np_random.uniform(-0.05, 0.05, size=(4,))
-        if self.start_position == 0:
-            self.state[2] = self.np_random.uniform(-np.pi, np.pi)
-        else:
-            self.state[2] += np.pi
+        self.state = self._initial_state(self.np_random)
         self.steps_beyond_done = None
         return self._obs()
 
@@ -147,15 +172,69 @@ class CartPoleSwingUpContinuous(CartPoleEnv, _SwingUpCommon):
         self.force_mag = 10.0
 
     def step(self, force):
-        force = np.clip(force, *self._force_clipper)
+        force = np.clip(np.asarray(force).item(), *self._force_clipper)
         reward, done = self._step(force * self.force_mag)
         return self._obs(), reward, done, {}
 
     def reset(self):
-        self.state = self.np_random.uniform(-0.05, 0.05, size=(4,))
-        if self.start_position == 0:
-            self.state[2] = self.np_random.uniform(-np.pi, np.pi)
-        else:
-            self.state[2] += np.pi
+        self.state = self._initial_state(self.np_random)
         self.steps_beyond_done = None
         return self._obs()
+
+
+class _SwingUpVectorCommon(VectorEnv):
+    def __init__(
+        self, env: _SwingUpCommon, nworkers: int, max_steps: Optional[int]
+    ) -> None:
+        spec = EnvSpec(env.observation_space.shape, env.action_space)
+        super().__init__(nworkers, spec, max_steps)
+        # Parameters and dynamics are shared with the non-vectorized env
+        self.env = env
+        self.state = np.zeros((nworkers, 4))
+
+    def _reset(self, indices: Array[int]) -> None:
+        self.state[indices] = self.env._initial_state(self.np_random, len(indices))
+
+    def _obs(self, indices: Array[int]) -> Array:
+        return self.env._obs_of(self.state[indices].T)
+
+    def _step_force(
+        self, force: Array[float], indices: Array[int]
+    ) -> Tuple[Array[float], Array[bool]]:
+        x, x_dot, theta, theta_dot = self.env._forward(self.state[indices].T, force)
+        self.state[indices] = np.stack([x, x_dot, theta, theta_dot], axis=1)
+        done = (x < -self.env.x_threshold) | (x > self.env.x_threshold)
+        return self.env._reward(x, theta, theta_dot), done
+
+
+class CartPoleSwingUpVector(_SwingUpVectorCommon):
+    """Vectorized CartPoleSwingUp, where episodes end after `max_steps` steps as
+    registered `CartPoleSwingUp-v*` envs
+    """
+
+    def __init__(self, nworkers: int, max_steps: Optional[int] = 1000, **kwargs):
+        super().__init__(CartPoleSwingUp(**kwargs), nworkers, max_steps)
+        self._act_to_force = np.array(self.env.ACT_TO_FORCE) * self.env.force_mag
+
+    def _step(
+        self, actions: Array[int], indices: Array[int]
+    ) -> Tuple[Array[float], Array[bool]]:
+        actions = actions.reshape(-1)
+        if np.any((actions < 0) | (actions >= self.env.action_space.n)):
+            raise ValueError(f"Invalid actions: {actions}")
+        return self._step_force(self._act_to_force[actions], indices)
+
+
+class CartPoleSwingUpContinuousVector(_SwingUpVectorCommon):
+    """Vectorized CartPoleSwingUpContinuous, where episodes end after `max_steps`
+    steps as registered `CartPoleSwingUpContinuous-v*` envs
+    """
+
+    def __init__(self, nworkers: int, max_steps: Optional[int] = 1000, **kwargs):
+        super().__init__(CartPoleSwingUpContinuous(**kwargs), nworkers, max_steps)
+
+    def _step(
+        self, actions: Array[float], indices: Array[int]
+    ) -> Tuple[Array[float], Array[bool]]:
+        force = np.clip(actions.reshape(-1), *self.env._force_clipper)
+        return self._step_force(force * self.env.force_mag, indices)
@@ -4,6 +4,10 @@ import gym
 import numpy as np
 from gym.utils import seeding
 
+from ..prelude import Array
+from .ext import EnvSpec
+from .vector import VectorEnv
+
 
 class DeepSea(gym.Env):
     SCREEN_SIZE = 400
@@ -78,6 +82,47 @@ class DeepSea(gym.Env):
         return self._viewer.render(return_rgb_array=mode == "rgb_array")
 
     def _get_observation(self, row: int, column: int) -> np.ndarray:
-        observation = np.zeros(shape=(self._size, self._size), dtype=np.float32)
-        observation[row, column] = 1
-        return observation.flatten()
+        observation = np.zeros(self._size ** 2, dtype=np.float32)
+        observation[row * self._size + column] = 1
+        return observation
+
+
+class DeepSeaVector(VectorEnv):
+    """DeepSea whose `nworkers` instances are stepped as arrays"""
+
+    def __init__(self, nworkers: int, size: int, noise: float = 0.0) -> None:
+        spec = EnvSpec((size ** 2,), gym.spaces.Discrete(2))
+        super().__init__(nworkers, spec)
+        self._size = size
+        self._move_cost = 0.01 / size
+        self._goal_reward = 1.0
+        self.noise = noise
+        self._row = np.zeros(nworkers, dtype=np.int64)
+        self._column = np.zeros(nworkers, dtype=np.int64)
+
+    def _reset(self, indices: Array[int]) -> None:
+        self._row[indices] = 0
+        self._column[indices] = 0
+
+    def _step(
+        self, actions: Array[int], indices: Array[int]
+    ) -> Tuple[Array[float], Array[bool]]:
+        action_right = actions.reshape(-1) == 1
+        if self.noise > 0.0:
+            flip = self.np_random.uniform(0, 1, size=len(indices)) <= self.noise
+            action_right ^= flip
+        column = self._column[indices]
+        at_goal = (column == self._size - 1) & action_right
+        rewards = np.where(at_goal, self._goal_reward, 0.0)
+        rewards -= np.where(action_right, self._move_cost, 0.0)
+        column += np.where(action_right, 1, -1)
+        self._column[indices] = np.clip(column, 0, self._size - 1)
+        self._row[indices] += 1
+        return rewards, self._row[indices] == self._size
+
+    def _obs(self, indices: Array[int]) -> Array:
+        # Freshly allocated, since callers keep returned observations
+        obs = np.zeros((len(indices), self._size ** 2), dtype=np.float32)
+        flat = self._row[indices] * self._size + self._column[indices]
+        obs[np.arange(len(indices)), flat] = 1
+        return obs
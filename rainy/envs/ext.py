@@ -8,7 +8,7 @@ import numpy as np
 from gym import spaces
 
 from ..prelude import Action, Array, Self, State
-from .monitor import RewardMonitor
+from .monitor import EpisodeStats, RewardMonitor
 
 
 @dataclasses.dataclass(frozen=True)
@@ -30,8 +30,10 @@ class EnvSpec:
         state_dim: Sequence[int],
         action_space: gym.Space,
         use_reward_monitor: bool = False,
+        state_dtype: Any = np.float32,
     ) -> None:
         self.state_dim = state_dim
+        self.state_dtype = state_dtype
         self.action_space = action_space
         self.use_reward_monitor = use_reward_monitor
         if isinstance(action_space, spaces.Discrete):
@@ -64,16 +66,25 @@ class EnvSpec:
 
 
 class EnvExt(gym.Env, Generic[Action, State]):
-    def __init__(self, env: gym.Env, obs_shape: Optional[spaces.Space] = None) -> None:
+    def __init__(
+        self,
+        env: gym.Env,
+        obs_shape: Optional[spaces.Space] = None,
+        obs_dtype: Any = np.float32,
+    ) -> None:
         self._env = env
         if obs_shape is None:
             obs_shape = env.observation_space.shape
+            obs_dtype = env.observation_space.dtype
             if obs_shape is None:
                 raise NotImplementedError(
                     f"Failed detect state dimension from {env.obs_shape}!"
                 )
-        use_reward_monitor = _use_reward_monitor(env)
-        self._spec = EnvSpec(obs_shape, self._env.action_space, use_reward_monitor)
+        self._monitor = _reward_monitor(env)
+        use_reward_monitor = self._monitor is not None
+        self._spec = EnvSpec(
+            obs_shape, self._env.action_space, use_reward_monitor, obs_dtype
+        )
         self._eval = False
 
     def close(self):
@@ -135,6 +146,14 @@ class EnvExt(gym.Env, Generic[Action, State]):
         """Atari wrappers need RewardMonitor for evaluation."""
         return self._spec.use_reward_monitor
 
+    def write_episode(self, stats: EpisodeStats, index: int) -> None:
+        """
+        Extended method.
+        Writes the episode ended by the last step, recorded by RewardMonitor,
+        to `stats[index]`.
+        """
+        self._monitor.write_episode(stats, index)
+
     @property
     def observation_space(self) -> gym.Space:
         return self._env.observation_space
@@ -180,12 +199,12 @@ def _as_class(env: gym.Env, query: [[gym.Env], bool]) -> Optional[gym.Env]:
     return _as_class(parent, query)
 
 
-def _use_reward_monitor(env: gym.Env) -> bool:
+def _reward_monitor(env: gym.Env) -> Optional[RewardMonitor]:
     if not hasattr(env, "env"):
-        return False
+        return None
     parent = env.env
 
     if isinstance(parent, RewardMonitor):
-        return True
+        return parent
     else:
-        return _use_reward_monitor(parent)
+        return _reward_monitor(parent)
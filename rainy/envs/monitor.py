@@ -1,9 +1,51 @@
+import dataclasses
 import time
-from typing import Any, List, Tuple
+from typing import Any, List, Optional, Sequence, Tuple, Union
 
 import gym
+import numpy as np
 from gym.core import Wrapper
 
+from ..prelude import Array, Index
+
+
+@dataclasses.dataclass(frozen=True)
+class EpisodeStats:
+    """Statistics of episodes recorded by RewardMonitor, as typed arrays indexed by
+    environments. If the last step of an environment ended an episode, its `done`
+    is True and `returns`, `lengths` and `times` are the raw return, the length and
+    the wall time of the episode.
+    """
+
+    done: Array[bool]
+    returns: Array[float]
+    lengths: Array[int]
+    times: Array[float]
+
+    @staticmethod
+    def zeros(shape: Union[int, Sequence[int]]) -> "EpisodeStats":
+        return EpisodeStats(
+            np.zeros(shape, dtype=np.bool_),
+            np.zeros(shape, dtype=np.float64),
+            np.zeros(shape, dtype=np.int64),
+            np.zeros(shape, dtype=np.float64),
+        )
+
+    @staticmethod
+    def concatenate(stats: Sequence["EpisodeStats"]) -> "EpisodeStats":
+        return EpisodeStats(*map(np.concatenate, zip(*map(dataclasses.astuple, stats))))
+
+    def __getitem__(self, idx: Index) -> "EpisodeStats":
+        return EpisodeStats(
+            self.done[idx], self.returns[idx], self.lengths[idx], self.times[idx]
+        )
+
+    def __setitem__(self, idx: Index, other: "EpisodeStats") -> None:
+        self.done[idx] = other.done
+        self.returns[idx] = other.returns
+        self.lengths[idx] = other.lengths
+        self.times[idx] = other.times
+
 
 class RewardMonitor(Wrapper):
     """Based on https://github.com/openai/baselines/blob/master/baselines/bench/monitor.py,
@@ -18,6 +60,7 @@ class RewardMonitor(Wrapper):
         self.episode_lengths: List[int] = []
         self.episode_times: List[float] = []
         self.total_steps = 0
+        self._last_episode: Optional[Tuple[float, int, float]] = None
 
     def reset(self, **kwargs) -> Any:
         self.rewards = []
@@ -46,3 +89,14 @@ class RewardMonitor(Wrapper):
         self.episode_lengths.append(eplen)
         self.episode_times.append(time.time() - self.tstart)
         info["episode"] = epinfo
+        self._last_episode = epinfo["r"], eplen, epinfo["t"]
+
+    def write_episode(self, stats: EpisodeStats, index: int) -> None:
+        """Writes the episode ended after the last call of this method to `stats`"""
+        stats.done[index] = self._last_episode is not None
+        if self._last_episode is not None:
+            ret, length, time_ = self._last_episode
+            stats.returns[index] = ret
+            stats.lengths[index] = length
+            stats.times[index] = time_
+            self._last_episode = None
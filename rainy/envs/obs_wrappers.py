@@ -11,7 +11,10 @@ from .atari_wrappers import LazyFrames
 
 
 class TransposeObs(gym.ObservationWrapper):
-    """Transpose & Scale image"""
+    """Transpose & Scale image.
+    Scaled images are float32, and so is the observation space, since buffers of
+    parallel environments are allocated by its dtype.
+    """
 
     def __init__(
         self,
@@ -25,7 +28,7 @@ class TransposeObs(gym.ObservationWrapper):
             low=self.observation_space.low[0, 0, 0],
             high=self.observation_space.high[0, 0, 0] / scale,
             shape=[obs_shape[i] for i in transpose],
-            dtype=self.observation_space.dtype,
+            dtype=np.float32,
         )
         self.scale = scale
         self.transpose = transpose
@@ -35,18 +38,25 @@ class TransposeObs(gym.ObservationWrapper):
             img = np.concatenate(observation._frames, axis=2).transpose(2, 0, 1)
         else:
             img = observation.transpose(*self.transpose)
-        return img / self.scale
+        return np.divide(img, self.scale, dtype=np.float32)
 
 
 class ScaleObs(gym.ObservationWrapper):
-    """Transpose & Scale image"""
+    """Scale image to float32"""
 
     def __init__(self, env: gym.Env, scale: float = 255.0) -> None:
         super().__init__(env)
+        obs = self.observation_space
+        self.observation_space: gym.Box = Box(
+            low=obs.low / scale,
+            high=obs.high / scale,
+            shape=obs.shape,
+            dtype=np.float32,
+        )
         self.scale = scale
 
     def observation(self, obs: Array):
-        return obs / self.scale
+        return np.divide(obs, self.scale, dtype=np.float32)
 
 
 class AddTimeStep(gym.ObservationWrapper):
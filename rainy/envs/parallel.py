@@ -1,28 +1,76 @@
+import ctypes
 import dataclasses
 import multiprocessing as mp
 from abc import ABC, abstractmethod
-from multiprocessing.connection import Connection
-from typing import Any, Callable, Generic, Iterable, Optional, Sequence, Type, Union
+from collections import deque
+from multiprocessing.connection import Connection, wait
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Generic,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+)
 
 import numpy as np
 from numpy import ndarray
 
-from ..prelude import Action, Array, Self, State
+from ..prelude import Action, Array, Index, Self, State
 from ..utils import mp_utils
 from .ext import EnvExt, EnvSpec
+from .monitor import EpisodeStats
 
 EnvGen = Callable[[], EnvExt]
 
 
 @dataclasses.dataclass(frozen=True)
 class PEnvTransition(Generic[State]):
+    """Transitions of parallel environments.
+    `infos` is None if the ParallelEnv doesn't send info dicts, and `episodes` is
+    None if environments don't use RewardMonitor.
+    """
+
     states: Array[State]
     rewards: Array[float]
     terminals: Array[bool]
-    infos: Array[dict]
+    infos: Optional[Array[dict]]
+    episodes: Optional[EpisodeStats] = None
 
     def __iter__(self) -> Iterable[Array]:
-        return iter(dataclasses.astuple(self))
+        # Episode statistics are accessed only as an attribute.
+        # Not astuple, which deep-copies states (e.g., views of shared memory)
+        return iter((self.states, self.rewards, self.terminals, self.infos))
+
+    def __getitem__(self, idx: Index) -> "PEnvTransition":
+        return PEnvTransition(
+            self.states[idx],
+            self.rewards[idx],
+            self.terminals[idx],
+            None if self.infos is None else self.infos[idx],
+            None if self.episodes is None else self.episodes[idx],
+        )
+
+    @staticmethod
+    def concatenate(transitions: Sequence["PEnvTransition"]) -> "PEnvTransition":
+        first, infos, episodes = transitions[0], None, None
+        if first.infos is not None:
+            infos = np.concatenate([t.infos for t in transitions])
+        if first.episodes is not None:
+            episodes = EpisodeStats.concatenate([t.episodes for t in transitions])
+        return PEnvTransition(
+            np.concatenate([t.states for t in transitions]),
+            np.concatenate([t.rewards for t in transitions]),
+            np.concatenate([t.terminals for t in transitions]),
+            infos,
+            episodes,
+        )
 
 
 class ParallelEnv(ABC, Generic[Action, State]):
@@ -45,6 +93,45 @@ class ParallelEnv(ABC, Generic[Action, State]):
     def seed(self, seeds: Iterable[int]) -> None:
         pass
 
+    def step_async(
+        self, actions: Iterable[Action], indices: Optional[Array[int]] = None
+    ) -> None:
+        """Starts to step environments `indices` (all if None) by `actions`.
+        Results are returned by `step_wait` in the order of calls, and `step` must
+        not be called while steps are pending.
+        By default, environments are stepped synchronously by `step_wait`.
+        """
+        if indices is not None:
+            raise NotImplementedError(f"{type(self).__name__} can't step a subset")
+        self._pending_actions = actions
+
+    def step_wait(self) -> PEnvTransition:
+        """Waits for the oldest step started by `step_async`"""
+        return self.step(self._pending_actions)
+
+    def send(
+        self, actions: Iterable[Action], indices: Optional[Array[int]] = None
+    ) -> None:
+        """Starts to step environments `indices` (all if None) by `actions`, like
+        `send` of envpool. Results are returned by `recv` in the order they get
+        ready, and `send` must not be mixed with `step_async`.
+        By default, environments are stepped synchronously and get ready in order.
+        """
+        envids = np.arange(self.nworkers) if indices is None else np.asarray(indices)
+        self.step_async(actions, indices)
+        self._ready_queue().push(envids, self.step_wait())
+
+    def recv(self, batch_size: int) -> Tuple[Array[int], PEnvTransition]:
+        """Waits for the first `batch_size` environments ready after `send`, and
+        returns their ids and transitions.
+        """
+        return self._ready_queue().pop(batch_size)
+
+    def _ready_queue(self) -> "_ReadyQueue":
+        if not hasattr(self, "_ready"):
+            self._ready = _ReadyQueue()
+        return self._ready
+
     @property
     def action_dim(self) -> int:
         return self._spec.action_dim
@@ -98,35 +185,320 @@ class ParallelEnv(ABC, Generic[Action, State]):
             return None
 
 
+class _ReadyQueue:
+    """Transitions of environments stepped by `send` and not returned by `recv` yet"""
+
+    def __init__(self) -> None:
+        self._chunks: Deque[Tuple[Array[int], PEnvTransition]] = deque()
+        self._len = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def push(self, envids: Array[int], transition: PEnvTransition) -> None:
+        # Copied by fancy indexing, since arrays can be views of buffers used in turn
+        n = len(envids)
+        self._chunks.append((np.asarray(envids), transition[np.arange(n)]))
+        self._len += n
+
+    def pop(self, batch_size: int) -> Tuple[Array[int], PEnvTransition]:
+        if self._len < batch_size:
+            raise RuntimeError(
+                f"recv({batch_size}) waits for more environments than sent"
+            )
+        envids, transitions, n = [], [], 0
+        while n < batch_size:
+            ids, transition = self._chunks.popleft()
+            rest = batch_size - n
+            if len(ids) > rest:
+                self._chunks.appendleft((ids[rest:], transition[rest:]))
+                ids, transition = ids[:rest], transition[:rest]
+            envids.append(ids)
+            transitions.append(transition)
+            n += len(ids)
+        self._len -= batch_size
+        return np.concatenate(envids), PEnvTransition.concatenate(transitions)
+
+
+class _SharedArrays:
+    """Arrays in shared memory, which are accessed as attributes named by `specs`"""
+
+    def __init__(self, specs: Dict[str, Tuple[tuple, Any]]) -> None:
+        self.specs = specs
+        self._raw = {}
+        for name, (shape, dtype) in self.specs.items():
+            nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            self._raw[name] = mp.RawArray(ctypes.c_uint8, max(nbytes, 1))
+        self._set_views()
+
+    def _set_views(self) -> None:
+        for name, (shape, dtype) in self.specs.items():
+            count = int(np.prod(shape))
+            arr = np.frombuffer(self._raw[name], dtype=dtype, count=count)
+            setattr(self, name, arr.reshape(shape))
+
+    def __getstate__(self) -> dict:
+        # Arrays are rebuilt from raw arrays in worker processes
+        return {k: v for k, v in self.__dict__.items() if k not in self.specs}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._set_views()
+
+
+class _SharedBlock(_SharedArrays):
+    """Extracted states, rewards and terminals of all workers in shared memory, and
+    episode statistics if `episodes`.
+    It has `nbuffers` buffers, which are used in turn.
+    """
+
+    def __init__(
+        self,
+        nbuffers: int,
+        nworkers: int,
+        state_shape: tuple,
+        state_dtype: Any,
+        episodes: bool = False,
+    ) -> None:
+        shape = nbuffers, nworkers
+        specs = dict(
+            states=((*shape, *state_shape), state_dtype),
+            rewards=(shape, np.float64),
+            terminals=(shape, np.bool_),
+        )
+        if episodes:
+            specs.update(
+                episode_done=(shape, np.bool_),
+                episode_returns=(shape, np.float64),
+                episode_lengths=(shape, np.int64),
+                episode_times=(shape, np.float64),
+            )
+        super().__init__(specs)
+        self.nbuffers = nbuffers
+        self.has_episodes = episodes
+        self._index = -1
+
+    def next_index(self) -> int:
+        self._index = (self._index + 1) % self.nbuffers
+        return self._index
+
+    def episodes(self, index: int) -> Optional[EpisodeStats]:
+        """Views of episode statistics in the buffer `index`"""
+        if not self.has_episodes:
+            return None
+        return EpisodeStats(
+            self.episode_done[index],
+            self.episode_returns[index],
+            self.episode_lengths[index],
+            self.episode_times[index],
+        )
+
+
+def _buffer_ids(indices: Optional[Array[int]], nworkers: int, views: bool) -> Index:
+    """Indices of environments in buffers, where a slice returns views of buffers"""
+    if indices is not None:
+        return indices
+    return slice(None) if views else np.arange(nworkers)
+
+
 class MultiProcEnv(ParallelEnv):
-    def __init__(self, env_gen: EnvGen, nworkers: int) -> None:
+    """ParallelEnv which runs environments in worker processes.
+    Each process steps `envs_per_worker` environments sequentially and sends their
+    results as one message, which amortizes IPC costs for cheap environments.
+    If `shared_memory`, workers write extracted states, rewards and terminals to
+    an array block in shared memory indexed by environment id, and only actions and
+    infos go through pipes. Then `extract` does nothing, and returned arrays are
+    copied from one of `nbuffers` buffers used in turn. If `views`, they are views of
+    the buffer instead, which are overwritten after `nbuffers` calls of `step` or
+    `reset`, so callers keeping states longer (e.g., RolloutStorage) must copy them.
+    Since the block is allocated before workers start, it is sized by `state_dim`
+    and `state_dtype` of the EnvSpec, and no environment is reset in the main process.
+    Episodes recorded by RewardMonitor are returned as typed `episodes`, and info
+    dicts are pickled and returned as `infos` only if `infos`.
+    """
+
+    def __init__(
+        self,
+        env_gen: EnvGen,
+        nworkers: int,
+        shared_memory: bool = False,
+        nbuffers: int = 2,
+        envs_per_worker: int = 1,
+        infos: bool = False,
+        views: bool = False,
+    ) -> None:
         assert nworkers >= 2
+        assert envs_per_worker >= 1
         envs = [env_gen() for _ in range(nworkers)]
         self.to_array = envs[0].extract
         self._spec = envs[0]._spec
-        self.envs = [_ProcHandler(i, envs[i]) for i in range(nworkers)]
+        self.views = views
+        if shared_memory:
+            # Not reset here, since some simulators (e.g., PyBullet) break after fork
+            self._block: Optional[_SharedBlock] = _SharedBlock(
+                nbuffers,
+                nworkers,
+                self._spec.state_dim,
+                self._spec.state_dtype,
+                episodes=self.use_reward_monitor,
+            )
+        else:
+            self._block = None
+        self._slices = [
+            slice(start, start + envs_per_worker)
+            for start in range(0, nworkers, envs_per_worker)
+        ]
+        self.envs = [
+            _ProcHandler(i, sl.start, envs[sl], self._block, infos)
+            for i, sl in enumerate(self._slices)
+        ]
+        self.envs_per_worker = envs_per_worker
         self.nworkers = nworkers
+        self.infos = infos
+        # (indices, {process: positions in indices}, shared buffer index)
+        self._pending: Deque[Tuple[Any, Dict[int, Any], int]] = deque()
+        # (environment ids, shared buffer index) of each process sent by `send`
+        self._sent: List[Deque[Tuple[Array[int], int]]] = [deque() for _ in self.envs]
 
     def close(self) -> None:
         for env in self.envs:
             env.close()
 
+    def _recv_all(self) -> List[Any]:
+        return [res for env in self.envs for res in env.recv()]
+
     def reset(self) -> Array[State]:
+        if self._block is not None:
+            index = self._block.next_index()
+            for env in self.envs:
+                env.reset_shared(index)
+            for env in self.envs:
+                env.recv()
+            states = self._block.states[index]
+            return states if self.views else states.copy()
         for env in self.envs:
             env.reset()
-        return np.array([env.recv() for env in self.envs])
+        return np.array(self._recv_all())
 
     def step(self, actions: Iterable[Action]) -> PEnvTransition:
-        for env, action in zip(self.envs, actions):
-            env.step(action)
-        res = [dataclasses.astuple(env.recv()) for env in self.envs]
-        return PEnvTransition(*map(np.array, zip(*res)))
+        self.step_async(actions)
+        return self.step_wait()
+
+    def _group(self, indices: Array[int]) -> Dict[int, Any]:
+        groups: Dict[int, Any] = {}
+        for pos, envid in enumerate(indices):
+            groups.setdefault(envid // self.envs_per_worker, []).append(pos)
+        return groups
+
+    def step_async(
+        self, actions: Iterable[Action], indices: Optional[Array[int]] = None
+    ) -> None:
+        actions = list(actions)
+        if indices is None:
+            envids = range(self.nworkers)
+            groups = {i: envids[sl] for i, sl in enumerate(self._slices)}
+        else:
+            indices = np.asarray(indices)
+            groups = self._group(indices)
+        index = -1 if self._block is None else self._block.next_index()
+        for i, positions in groups.items():
+            acts = [actions[p] for p in positions]
+            if indices is None:
+                local_ids = None
+            else:
+                local_ids = [indices[p] - self._slices[i].start for p in positions]
+            if self._block is None:
+                self.envs[i].step(acts, local_ids)
+            else:
+                self.envs[i].step_shared(acts, local_ids, index)
+        self._pending.append((indices, groups, index))
+
+    def step_wait(self) -> PEnvTransition:
+        indices, groups, index = self._pending.popleft()
+        n = self.nworkers if indices is None else len(indices)
+        replies = {i: self.envs[i].recv() for i in groups}
+        envids = _buffer_ids(indices, self.nworkers, self.views)
+        return self._transition(n, groups, replies, envids, index)
+
+    def _transition(
+        self,
+        n: int,
+        groups: Dict[int, Any],
+        replies: Dict[int, tuple],
+        envids: Union[slice, Array[int]],
+        index: int,
+    ) -> PEnvTransition:
+        """Makes a transition of `n` environments from replies of processes.
+        A reply is `(infos, episodes, results)`, and `groups` has positions of
+        environments stepped by each process.
+        """
+        infos = np.empty(n, dtype=object) if self.infos else None
+        if self.use_reward_monitor and self._block is None:
+            episodes: Optional[EpisodeStats] = EpisodeStats.zeros(n)
+        else:
+            episodes = None
+        results = [None] * n
+        for i, positions in groups.items():
+            proc_infos, proc_episodes, proc_results = replies[i]
+            for k, pos in enumerate(positions):
+                if infos is not None:
+                    infos[pos] = proc_infos[k]
+                if proc_results is not None:
+                    results[pos] = proc_results[k]
+            if episodes is not None:
+                episodes[list(positions)] = proc_episodes
+        if self._block is not None:
+            episodes = self._block.episodes(index)
+            return PEnvTransition(
+                self._block.states[index][envids],
+                self._block.rewards[index][envids],
+                self._block.terminals[index][envids],
+                infos,
+                None if episodes is None else episodes[envids],
+            )
+        states, rewards, terminals = map(np.array, zip(*results))
+        return PEnvTransition(states, rewards, terminals, infos, episodes)
+
+    def send(
+        self, actions: Iterable[Action], indices: Optional[Array[int]] = None
+    ) -> None:
+        actions = list(actions)
+        envids = np.arange(self.nworkers) if indices is None else np.asarray(indices)
+        index = -1 if self._block is None else self._block.next_index()
+        for i, positions in self._group(envids).items():
+            acts = [actions[p] for p in positions]
+            ids = envids[positions]
+            local_ids = list(ids - self._slices[i].start)
+            if self._block is None:
+                self.envs[i].step(acts, local_ids)
+            else:
+                self.envs[i].step_shared(acts, local_ids, index)
+            self._sent[i].append((ids, index))
+
+    def recv(self, batch_size: int) -> Tuple[Array[int], PEnvTransition]:
+        ready = self._ready_queue()
+        while len(ready) < batch_size:
+            busy = {env.pipe: i for i, env in enumerate(self.envs) if self._sent[i]}
+            if len(busy) == 0:
+                break
+            # Processes stepping slow environments (e.g., resetting) are skipped
+            for pipe in wait(list(busy)):
+                i = busy[pipe]
+                ids, index = self._sent[i].popleft()
+                groups = {i: range(len(ids))}
+                replies = {i: self.envs[i].recv()}
+                ready.push(ids, self._transition(len(ids), groups, replies, ids, index))
+        return ready.pop(batch_size)
 
     def seed(self, seeds: Iterable[int]) -> None:
-        for env, seed in zip(self.envs, seeds):
-            env.seed(seed)
+        seeds = list(seeds)
+        for env, sl in zip(self.envs, self._slices):
+            env.seed(seeds[sl])
 
     def extract(self, states: Iterable[State]) -> ndarray:
+        if self._block is not None:
+            # States are extracted by workers
+            return np.asarray(states)
         return np.asarray([self.to_array(s) for s in states])
 
     def do_any(
@@ -141,13 +513,20 @@ class MultiProcEnv(ParallelEnv):
             kwargs = {}
         for env in self.envs:
             env.do_any(function, args, kwargs)
-        return np.array([env.recv() for env in self.envs])
+        return np.array(self._recv_all())
 
 
 class _ProcHandler:
-    def __init__(self, envid: int, env: EnvExt) -> None:
+    def __init__(
+        self,
+        workerid: int,
+        start: int,
+        envs: List[EnvExt],
+        block: Optional[_SharedBlock] = None,
+        infos: bool = False,
+    ) -> None:
         self.pipe, worker_pipe = mp.Pipe()
-        self.worker = _ProcWorker(envid, env, worker_pipe)
+        self.worker = _ProcWorker(workerid, start, envs, worker_pipe, block, infos)
         self.worker.start()
 
     def close(self) -> None:
@@ -156,61 +535,141 @@ class _ProcHandler:
     def reset(self) -> None:
         self.pipe.send((_ProcWorker.RESET, None))
 
-    def seed(self, seed: int) -> None:
-        self.pipe.send((_ProcWorker.SEED, seed))
+    def seed(self, seeds: List[int]) -> None:
+        self.pipe.send((_ProcWorker.SEED, seeds))
 
-    def step(self, action: Action) -> None:
-        self.pipe.send((_ProcWorker.STEP, action))
+    def step(self, actions: List[Action], local_ids: Optional[List[int]]) -> None:
+        self.pipe.send((_ProcWorker.STEP, (actions, local_ids)))
+
+    def reset_shared(self, index: int) -> None:
+        self.pipe.send((_ProcWorker.RESET_SHARED, index))
+
+    def step_shared(
+        self, actions: List[Action], local_ids: Optional[List[int]], index: int
+    ) -> None:
+        self.pipe.send((_ProcWorker.STEP_SHARED, (actions, local_ids, index)))
 
     def do_any(self, function: str, args: tuple, kwargs: dict) -> None:
         self.pipe.send((_ProcWorker.ANY, (function, args, kwargs)))
 
-    def recv(self) -> Any:
+    def recv(self) -> List[Any]:
         return self.pipe.recv()
 
 
 class _ProcWorker(mp.Process):
+    """Worker process stepping environments `start, start + 1, ...` in turn"""
+
     CLOSE = 0
     RESET = 1
     SEED = 2
     STEP = 3
     ANY = 4
+    RESET_SHARED = 5
+    STEP_SHARED = 6
 
-    def __init__(self, envid: int, env: EnvExt, pipe: Connection) -> None:
+    def __init__(
+        self,
+        workerid: int,
+        start: int,
+        envs: List[EnvExt],
+        pipe: Connection,
+        block: Optional[_SharedBlock] = None,
+        infos: bool = False,
+    ) -> None:
         super().__init__()
-        self.envid = envid
-        self.env = env
+        self.workerid = workerid
+        self.start_id = start
+        self.envs = envs
         self.pipe = pipe
+        self.block = block
+        self.infos = infos
+        self._monitor = envs[0].use_reward_monitor
+
+    def _envs(self, local_ids: Optional[List[int]]) -> List[Tuple[int, EnvExt]]:
+        if local_ids is None:
+            local_ids = range(len(self.envs))
+        return [(self.start_id + i, self.envs[i]) for i in local_ids]
+
+    def _step(
+        self, actions: List[Action], local_ids: Optional[List[int]], index: int = -1
+    ) -> tuple:
+        """Steps environments and returns `(infos, episodes, results)`.
+        Episodes and results are None if they are written to the shared block.
+        """
+        envs = self._envs(local_ids)
+        block = self.block
+        if block is None:
+            results: Optional[list] = []
+            episodes = EpisodeStats.zeros(len(envs)) if self._monitor else None
+        else:
+            results, episodes = None, None
+            block_episodes = block.episodes(index)
+        infos = []
+        for k, ((envid, env), action) in enumerate(zip(envs, actions)):
+            transition = env.step_and_reset(action)
+            infos.append(transition.info)
+            if block is None:
+                results.append(
+                    (transition.state, transition.reward, transition.terminal)
+                )
+                if episodes is not None:
+                    env.write_episode(episodes, k)
+                continue
+            block.states[index, envid] = env.extract(transition.state)
+            block.rewards[index, envid] = transition.reward
+            block.terminals[index, envid] = transition.terminal
+            if block_episodes is not None:
+                env.write_episode(block_episodes, envid)
+        return infos if self.infos else None, episodes, results
 
     def run(self):
         def _loop():
             while True:
                 op, arg = self.pipe.recv()
-                if op == self.STEP:
-                    self.pipe.send(self.env.step_and_reset(arg))
+                if op == self.STEP_SHARED:
+                    actions, local_ids, index = arg
+                    self.pipe.send(self._step(actions, local_ids, index))
+                elif op == self.STEP:
+                    actions, local_ids = arg
+                    self.pipe.send(self._step(actions, local_ids))
                 elif op == self.ANY:
                     fname, args, kwargs = arg
-                    fn = getattr(self.env.unwrapped, fname)
-                    self.pipe.send(fn(*args, **kwargs))
+                    res = [
+                        getattr(e.unwrapped, fname)(*args, **kwargs) for e in self.envs
+                    ]
+                    self.pipe.send(res)
                 elif op == self.RESET:
-                    self.pipe.send(self.env.reset())
+                    self.pipe.send([env.reset() for env in self.envs])
+                elif op == self.RESET_SHARED:
+                    for i, env in enumerate(self.envs):
+                        state = env.extract(env.reset())
+                        self.block.states[arg, self.start_id + i] = state
+                    self.pipe.send(None)
                 elif op == self.SEED:
-                    self.env.seed(arg)
+                    for env, seed in zip(self.envs, arg):
+                        env.seed(seed)
                 elif op == self.CLOSE:
-                    self.env.close()
+                    for env in self.envs:
+                        env.close()
                     self.pipe.close()
                     break
                 else:
                     raise NotImplementedError("Not-supported operation: {}".format(op))
 
-        mp_utils.pretty_loop(self.envid, _loop)
+        mp_utils.pretty_loop(self.workerid, _loop)
 
 
 class DummyParallelEnv(ParallelEnv):
-    def __init__(self, env_gen: EnvGen, nworkers: int) -> None:
+    """ParallelEnv which steps environments sequentially in this process.
+    Info dicts are returned as `infos` only if `infos`.
+    """
+
+    def __init__(self, env_gen: EnvGen, nworkers: int, infos: bool = False) -> None:
         self.envs = [env_gen() for _ in range(nworkers)]
         self._spec = self.envs[0]._spec
         self.nworkers = nworkers
+        self.infos = infos
+        self._pending: Deque[PEnvTransition] = deque()
 
     def close(self) -> None:
         for env in self.envs:
@@ -220,11 +679,35 @@ class DummyParallelEnv(ParallelEnv):
         return np.array([e.reset() for e in self.envs])
 
     def step(self, actions: Iterable[Action]) -> PEnvTransition:
-        res = [
-            dataclasses.astuple(e.step_and_reset(a))
-            for (a, e) in zip(actions, self.envs)
-        ]
-        return PEnvTransition(*map(np.array, zip(*res)))
+        return self._step(actions, range(self.nworkers))
+
+    def _step(self, actions: Iterable[Action], envids: Iterable[int]) -> PEnvTransition:
+        envids = list(envids)
+        n = len(envids)
+        states, rewards, terminals = [], np.zeros(n), np.zeros(n, dtype=np.bool_)
+        infos = np.empty(n, dtype=object) if self.infos else None
+        episodes = EpisodeStats.zeros(n) if self.use_reward_monitor else None
+        for k, (action, i) in enumerate(zip(actions, envids)):
+            env = self.envs[i]
+            transition = env.step_and_reset(action)
+            states.append(transition.state)
+            rewards[k], terminals[k] = transition.reward, transition.terminal
+            if infos is not None:
+                infos[k] = transition.info
+            if episodes is not None:
+                env.write_episode(episodes, k)
+        return PEnvTransition(np.array(states), rewards, terminals, infos, episodes)
+
+    def step_async(
+        self, actions: Iterable[Action], indices: Optional[Array[int]] = None
+    ) -> None:
+        if indices is None:
+            self._pending.append(self.step(actions))
+        else:
+            self._pending.append(self._step(actions, indices))
+
+    def step_wait(self) -> PEnvTransition:
+        return self._pending.popleft()
 
     def seed(self, seeds: Iterable[int]) -> None:
         for env, seed in zip(self.envs, seeds):
@@ -1,5 +1,6 @@
+from collections import deque
 from dataclasses import replace
-from typing import Any, Iterable, Optional, Tuple, Type, Union
+from typing import Any, Deque, Iterable, Optional, Tuple, Type, Union
 
 import numpy as np
 
@@ -13,6 +14,7 @@ class ParallelEnvWrapper(ParallelEnv[Action, State]):
         self.penv = penv
         self.nworkers = penv.nworkers
         self._spec = self.penv._spec
+        self._pending_indices: Deque[Optional[Array[int]]] = deque()
 
     def close(self) -> None:
         self.penv.close()
@@ -21,7 +23,33 @@ class ParallelEnvWrapper(ParallelEnv[Action, State]):
         return self.penv.reset()
 
     def step(self, actions: Iterable[Action]) -> PEnvTransition:
-        return self.penv.step(actions)
+        self.step_async(actions)
+        return self.step_wait()
+
+    def step_async(
+        self, actions: Iterable[Action], indices: Optional[Array[int]] = None
+    ) -> None:
+        self.penv.step_async(actions, indices)
+        self._pending_indices.append(indices)
+
+    def step_wait(self) -> PEnvTransition:
+        transition = self.penv.step_wait()
+        return self._on_step(transition, self._pending_indices.popleft())
+
+    def send(
+        self, actions: Iterable[Action], indices: Optional[Array[int]] = None
+    ) -> None:
+        self.penv.send(actions, indices)
+
+    def recv(self, batch_size: int) -> Tuple[Array[int], PEnvTransition]:
+        envids, transition = self.penv.recv(batch_size)
+        return envids, self._on_step(transition, envids)
+
+    def _on_step(
+        self, transition: PEnvTransition, indices: Optional[Array[int]]
+    ) -> PEnvTransition:
+        """Modifies a transition of environments `indices` (all if None)"""
+        return transition
 
     def seed(self, seeds: Iterable[int]) -> None:
         self.penv.seed(seeds)
@@ -72,13 +100,18 @@ class FrameStackParallel(ParallelEnvWrapper):
         self.shape = (nstack, *self.penv.state_dim[idx:])
         self.obs = np.zeros((self.nworkers, *self.shape), dtype=dtype)
 
-    def step(self, actions: Iterable[Action]) -> PEnvTransition:
-        transition = self.penv.step(actions)
-        self.obs = np.roll(self.obs, shift=-1, axis=1)
-        for i, _ in filter(lambda t: t[1], enumerate(transition.terminals)):
-            self.obs[i] = 0.0
-        self.obs[:, -1] = self.extract(transition.states).squeeze()
-        return replace(transition, states=self.obs)
+    def _on_step(
+        self, transition: PEnvTransition, indices: Optional[Array[int]]
+    ) -> PEnvTransition:
+        obs = self.obs if indices is None else self.obs[indices]
+        obs = np.roll(obs, shift=-1, axis=1)
+        obs[np.asarray(transition.terminals, dtype=bool)] = 0.0
+        obs[:, -1] = self.extract(transition.states).reshape(obs[:, -1].shape)
+        if indices is None:
+            self.obs = obs
+        else:
+            self.obs[indices] = obs
+        return replace(transition, states=obs)
 
     def reset(self) -> Array[State]:
         self.obs.fill(0)
@@ -98,8 +131,9 @@ class NormalizeObsParallel(ParallelEnvWrapper[Action, Array[float]]):
         self._rms = RunningMeanStd(shape=self.state_dim)
         self._training_mode = True
 
-    def step(self, actions: Iterable[Action]) -> PEnvTransition:
-        transition = self.penv.step(actions)
+    def _on_step(
+        self, transition: PEnvTransition, indices: Optional[Array[int]]
+    ) -> PEnvTransition:
         return replace(transition, states=self._filter_obs(transition.states))
 
     def _filter_obs(self, obs: Array[Array[float]]) -> Array[Array[float]]:
@@ -134,12 +168,14 @@ class NormalizeRewardParallel(ParallelEnvWrapper[Action, State]):
         self._ret = np.zeros(self.nworkers)
         self._training_mode = True
 
-    def step(self, actions: Iterable[Action]) -> PEnvTransition:
-        transition = self.penv.step(actions)
+    def _on_step(
+        self, transition: PEnvTransition, indices: Optional[Array[int]]
+    ) -> PEnvTransition:
         if self._training_mode:
-            ret = self._ret * self.gamma + transition.rewards
+            idx = slice(None) if indices is None else indices
+            ret = self._ret[idx] * self.gamma + transition.rewards
             self._rms.update(ret)
-            self._ret = ret * (1.0 - transition.terminals)
+            self._ret[idx] = ret * (1.0 - transition.terminals)
         normalized = transition.rewards / self._rms.std()
         clipped = np.clip(normalized, -self.reward_clip, self.reward_clip)
         return replace(transition, rewards=clipped)
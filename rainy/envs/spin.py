@@ -0,0 +1,325 @@
+"""ParallelEnv whose workers are synchronized by counters in shared memory
+"""
+import multiprocessing as mp
+import os
+from collections import deque
+from multiprocessing.connection import Connection
+from multiprocessing.synchronize import Semaphore
+from typing import Any, Deque, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from numpy import ndarray
+
+from ..prelude import Action, Array, State
+from ..utils import mp_utils
+from .ext import EnvExt
+from .parallel import (
+    EnvGen,
+    ParallelEnv,
+    PEnvTransition,
+    _buffer_ids,
+    _SharedArrays,
+    _SharedBlock,
+)
+
+
+def _wait(counters: Array[int], i: int, expected: int, sem: Semaphore, spin: int):
+    for _ in range(spin):
+        if counters[i] == expected:
+            break
+    # Acquired without blocking if the counter is already updated, which also
+    # ensures that arrays written before the update are visible
+    sem.acquire()
+
+
+class SpinProcEnv(ParallelEnv):
+    """ParallelEnv which runs environments in worker processes like MultiProcEnv,
+    but exchanges actions and results through shared memory instead of pipes.
+    A worker notices a request (and the main process notices a reply) by spinning
+    on a counter for `spin` iterations and then blocking on a semaphore, so that
+    environments which step in microseconds don't pay for round trips of pipes.
+    By default, workers spin only if each of them can have its own CPU core.
+    Returned arrays are copied from `nbuffers` buffers used in turn, or views of them
+    if `views`, as in MultiProcEnv with `shared_memory=True`.
+    Episodes recorded by RewardMonitor are written to the buffers too, and info dicts
+    are sent through pipes only if `infos` and they are not empty.
+    """
+
+    def __init__(
+        self,
+        env_gen: EnvGen,
+        nworkers: int,
+        envs_per_worker: int = 1,
+        spin: Optional[int] = None,
+        nbuffers: int = 2,
+        infos: bool = False,
+        views: bool = False,
+    ) -> None:
+        assert nworkers >= 2
+        assert envs_per_worker >= 1
+        envs = [env_gen() for _ in range(nworkers)]
+        self.to_array = envs[0].extract
+        self._spec = envs[0]._spec
+        self.nworkers = nworkers
+        self.envs_per_worker = envs_per_worker
+        nprocs = -(-nworkers // envs_per_worker)
+        if spin is None:
+            spin = 1000 if nprocs < (os.cpu_count() or 1) else 0
+        self.spin = spin
+        self.views = views
+        self._block = _SharedBlock(
+            nbuffers,
+            nworkers,
+            self._spec.state_dim,
+            self._spec.state_dtype,
+            episodes=self.use_reward_monitor,
+        )
+        self.infos = infos
+        space = self._spec.action_space
+        self._control = _SharedArrays(
+            dict(
+                actions=((nworkers, *space.shape), space.dtype),
+                active=((nworkers,), np.bool_),
+                commands=((nprocs,), np.int64),
+                buffer_index=((nprocs,), np.int64),
+                requests=((nprocs,), np.int64),
+                replies=((nprocs,), np.int64),
+                has_info=((nprocs,), np.bool_),
+            )
+        )
+        self._nrequests = [0] * nprocs
+        self._request_sems = [mp.Semaphore(0) for _ in range(nprocs)]
+        self._reply_sems = [mp.Semaphore(0) for _ in range(nprocs)]
+        self._pipes: List[Connection] = []
+        self.workers: List[_SpinWorker] = []
+        for i in range(nprocs):
+            pipe, worker_pipe = mp.Pipe()
+            start = i * envs_per_worker
+            worker = _SpinWorker(
+                i,
+                envs[start : start + envs_per_worker],
+                start,
+                worker_pipe,
+                self._block,
+                self._control,
+                self._request_sems[i],
+                self._reply_sems[i],
+                spin,
+                infos,
+            )
+            worker.start()
+            self._pipes.append(pipe)
+            self.workers.append(worker)
+        # (indices, processes, buffer index)
+        self._pending: Deque[Tuple[Any, List[int], int]] = deque()
+        self._busy: Set[int] = set()
+
+    def _request(self, proc: int, command: int, index: int = 0) -> None:
+        self._control.commands[proc] = command
+        self._control.buffer_index[proc] = index
+        self._nrequests[proc] += 1
+        self._control.requests[proc] = self._nrequests[proc]
+        self._request_sems[proc].release()
+
+    def _wait(self, proc: int) -> None:
+        expected = self._nrequests[proc]
+        _wait(self._control.replies, proc, expected, self._reply_sems[proc], self.spin)
+
+    def _call(self, op: int, args: List[Any]) -> None:
+        for proc, (pipe, arg) in enumerate(zip(self._pipes, args)):
+            pipe.send((op, arg))
+            self._request(proc, _SpinWorker.PIPE)
+        for proc in range(len(self._pipes)):
+            self._wait(proc)
+
+    def close(self) -> None:
+        self._call(_SpinWorker.CLOSE, [None] * len(self.workers))
+        for worker in self.workers:
+            worker.join()
+
+    def reset(self) -> Array[State]:
+        index = self._block.next_index()
+        for proc in range(len(self.workers)):
+            self._request(proc, _SpinWorker.RESET, index)
+        for proc in range(len(self.workers)):
+            self._wait(proc)
+        states = self._block.states[index]
+        return states if self.views else states.copy()
+
+    def step(self, actions: Iterable[Action]) -> PEnvTransition:
+        self.step_async(actions)
+        return self.step_wait()
+
+    def step_async(
+        self, actions: Iterable[Action], indices: Optional[Array[int]] = None
+    ) -> None:
+        control = self._control
+        if indices is None:
+            procs = list(range(len(self.workers)))
+        else:
+            indices = np.asarray(indices)
+            procs = np.unique(indices // self.envs_per_worker).tolist()
+        if not self._busy.isdisjoint(procs):
+            raise RuntimeError("SpinProcEnv can't step a worker which is stepping")
+        if indices is None:
+            control.actions[:] = np.asarray(actions).reshape(control.actions.shape)
+            control.active[:] = True
+        else:
+            for proc in procs:
+                start = proc * self.envs_per_worker
+                control.active[start : start + self.envs_per_worker] = False
+            control.actions[indices] = np.asarray(actions).reshape(
+                (len(indices), *control.actions.shape[1:])
+            )
+            control.active[indices] = True
+        index = self._block.next_index()
+        for proc in procs:
+            self._request(proc, _SpinWorker.STEP, index)
+        self._busy.update(procs)
+        self._pending.append((indices, procs, index))
+
+    def step_wait(self) -> PEnvTransition:
+        indices, procs, index = self._pending.popleft()
+        if self.infos:
+            infos: Optional[Array[dict]] = np.empty(self.nworkers, dtype=object)
+            infos[:] = [{} for _ in range(self.nworkers)]
+        else:
+            infos = None
+        for proc in procs:
+            self._wait(proc)
+            if self._control.has_info[proc]:
+                for envid, info in self._pipes[proc].recv():
+                    infos[envid] = info
+        self._busy.difference_update(procs)
+        envids = _buffer_ids(indices, self.nworkers, self.views)
+        episodes = self._block.episodes(index)
+        return PEnvTransition(
+            self._block.states[index][envids],
+            self._block.rewards[index][envids],
+            self._block.terminals[index][envids],
+            None if infos is None else infos[envids],
+            None if episodes is None else episodes[envids],
+        )
+
+    def seed(self, seeds: Iterable[int]) -> None:
+        seeds, epw = list(seeds), self.envs_per_worker
+        self._call(
+            _SpinWorker.SEED, [seeds[i : i + epw] for i in range(0, len(seeds), epw)]
+        )
+
+    def extract(self, states: Iterable[State]) -> ndarray:
+        # States are extracted by workers
+        return np.asarray(states)
+
+    def do_any(
+        self,
+        function: str,
+        args: Optional[tuple] = None,
+        kwargs: Optional[dict] = None,
+    ) -> Array[Any]:
+        if args is None:
+            args = ()
+        if kwargs is None:
+            kwargs = {}
+        self._call(_SpinWorker.ANY, [(function, args, kwargs)] * len(self.workers))
+        return np.array([res for pipe in self._pipes for res in pipe.recv()])
+
+
+class _SpinWorker(mp.Process):
+    # Commands in shared memory
+    STEP = 0
+    RESET = 1
+    PIPE = 2
+    # Operations sent through pipes
+    CLOSE = 0
+    SEED = 1
+    ANY = 2
+
+    def __init__(
+        self,
+        workerid: int,
+        envs: List[EnvExt],
+        start: int,
+        pipe: Connection,
+        block: _SharedBlock,
+        control: _SharedArrays,
+        request_sem: Semaphore,
+        reply_sem: Semaphore,
+        spin: int,
+        infos: bool = False,
+    ) -> None:
+        super().__init__()
+        self.workerid = workerid
+        self.envs = envs
+        self.start_id = start
+        self.pipe = pipe
+        self.block = block
+        self.control = control
+        self.request_sem = request_sem
+        self.reply_sem = reply_sem
+        self.spin = spin
+        self.infos = infos
+        self._discrete = envs[0]._spec.is_discrete()
+
+    def _step(self, index: int) -> None:
+        block, control = self.block, self.control
+        episodes = block.episodes(index)
+        infos = []
+        for envid, env in enumerate(self.envs, self.start_id):
+            if not control.active[envid]:
+                continue
+            action = control.actions[envid]
+            action = int(action) if self._discrete else action.copy()
+            transition = env.step_and_reset(action)
+            block.states[index, envid] = env.extract(transition.state)
+            block.rewards[index, envid] = transition.reward
+            block.terminals[index, envid] = transition.terminal
+            if episodes is not None:
+                env.write_episode(episodes, envid)
+            if self.infos and transition.info:
+                infos.append((envid, transition.info))
+        control.has_info[self.workerid] = len(infos) > 0
+        if len(infos) > 0:
+            self.pipe.send(infos)
+
+    def _handle_pipe(self) -> bool:
+        op, arg = self.pipe.recv()
+        if op == self.SEED:
+            for env, seed in zip(self.envs, arg):
+                env.seed(seed)
+        elif op == self.ANY:
+            fname, args, kwargs = arg
+            res = [getattr(e.unwrapped, fname)(*args, **kwargs) for e in self.envs]
+            self.pipe.send(res)
+        elif op == self.CLOSE:
+            for env in self.envs:
+                env.close()
+            return False
+        else:
+            raise NotImplementedError("Not-supported operation: {}".format(op))
+        return True
+
+    def run(self):
+        def _loop():
+            control, i = self.control, self.workerid
+            nrequests = 0
+            running = True
+            while running:
+                nrequests += 1
+                _wait(control.requests, i, nrequests, self.request_sem, self.spin)
+                command = control.commands[i]
+                if command == self.STEP:
+                    self._step(control.buffer_index[i])
+                elif command == self.RESET:
+                    index = control.buffer_index[i]
+                    for envid, env in enumerate(self.envs, self.start_id):
+                        self.block.states[index, envid] = env.extract(env.reset())
+                elif command == self.PIPE:
+                    running = self._handle_pipe()
+                else:
+                    raise NotImplementedError(f"Not-supported command: {command}")
+                control.replies[i] = nrequests
+                self.reply_sem.release()
+            self.pipe.close()
+
+        mp_utils.pretty_loop(self.workerid, _loop)
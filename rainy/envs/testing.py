@@ -8,6 +8,7 @@ import numpy as np
 
 from ..prelude import Array
 from .ext import EnvExt
+from .monitor import RewardMonitor
 
 ACTION_DIM = 10
 
@@ -55,7 +56,10 @@ class DummyEnvImpl(gym.Env):
 
 class DummyEnv(EnvExt):
     def __init__(
-        self, array_dim: Sequence[int] = (16, 16), flatten: bool = False
+        self,
+        array_dim: Sequence[int] = (16, 16),
+        flatten: bool = False,
+        monitor: bool = False,
     ) -> None:
         self.array_dim = array_dim
         self.flatten = flatten
@@ -63,7 +67,11 @@ class DummyEnv(EnvExt):
             shape: Sequence[int] = (np.prod(self.array_dim),)
         else:
             shape = self.array_dim
-        super().__init__(DummyEnvImpl(), obs_shape=shape)
+        env = DummyEnvImpl()
+        if monitor:
+            # EnvExt finds RewardMonitor under the outermost wrapper
+            env = gym.Wrapper(RewardMonitor(env))
+        super().__init__(env, obs_shape=shape)
 
     def extract(self, state: State) -> Array:
         res = state.to_array(self.array_dim)
@@ -76,7 +84,7 @@ class DummyEnv(EnvExt):
 class DummyEnvDeterministic(DummyEnv):
     def __init__(self, *args, **kwargs) -> None:
         super().__init__(*args, **kwargs)
-        self._env.transition = [
+        self.unwrapped.transition = [
             [0.0, 1.0, 0.0, 0.0, 0.0],
             [0.0, 0.0, 1.0, 0.0, 0.0],
             [0.0, 0.0, 0.0, 0.0, 1.0],
@@ -0,0 +1,207 @@
+"""ParallelEnv which steps environments in threads
+"""
+import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from numpy import ndarray
+
+from ..prelude import Action, Array, State
+from .ext import EnvExt
+from .monitor import EpisodeStats
+from .parallel import EnvGen, ParallelEnv, PEnvTransition, _buffer_ids
+
+
+class ThreadedParallelEnv(ParallelEnv):
+    """ParallelEnv which steps environments in `nthreads` threads, each of which
+    steps a contiguous chunk of environments.
+    It's faster than MultiProcEnv for simulators which release the GIL while stepping
+    (e.g., Atari and PyBullet), since nothing is pickled or sent between processes.
+    Simulators written in Python (e.g., ClassicControl) hold the GIL, and should be
+    run by MultiProcEnv or DummyParallelEnv.
+    Extracted states, rewards and terminals are written into `nbuffers` buffers used
+    in turn, and returned arrays are copied from them, or views of them if `views`,
+    as in MultiProcEnv with `shared_memory=True`.
+    Info dicts are returned as `infos` only if `infos`.
+    Chunks stepped by `send` are returned by `recv` in the order they get ready.
+    """
+
+    def __init__(
+        self,
+        env_gen: EnvGen,
+        nworkers: int,
+        nthreads: Optional[int] = None,
+        nbuffers: int = 2,
+        views: bool = False,
+        infos: bool = False,
+    ) -> None:
+        self.envs: List[EnvExt] = [env_gen() for _ in range(nworkers)]
+        self._spec = self.envs[0]._spec
+        self.nworkers = nworkers
+        self.views = views
+        self.infos = infos
+        self.nthreads = nthreads or min(nworkers, os.cpu_count() or 1)
+        self._pool = ThreadPoolExecutor(self.nthreads)
+        state_shape, state_dtype = self._spec.state_dim, self._spec.state_dtype
+        self._states = np.zeros((nbuffers, nworkers, *state_shape), state_dtype)
+        self._rewards = np.zeros((nbuffers, nworkers), dtype=np.float64)
+        self._terminals = np.zeros((nbuffers, nworkers), dtype=np.bool_)
+        if self.use_reward_monitor:
+            self._episodes: Optional[EpisodeStats] = EpisodeStats.zeros(
+                (nbuffers, nworkers)
+            )
+        else:
+            self._episodes = None
+        self._index = -1
+        self._pending: Deque[Tuple[Any, List[Future], int]] = deque()
+        self._busy: Set[int] = set()
+        self._sent: Dict[Future, Tuple[Array[int], int]] = {}
+
+    def _next_index(self) -> int:
+        self._index = (self._index + 1) % len(self._states)
+        return self._index
+
+    def _chunks(self, envids: Array[int]) -> List[Array[int]]:
+        chunks = np.array_split(envids, min(self.nthreads, len(envids)))
+        return [chunk for chunk in chunks if len(chunk) > 0]
+
+    def _reset_chunk(self, envids: Array[int], index: int) -> None:
+        for i in envids:
+            env = self.envs[i]
+            self._states[index, i] = env.extract(env.reset())
+
+    def _step_chunk(
+        self, envids: Array[int], actions: List[Action], index: int
+    ) -> Dict[int, dict]:
+        infos = {}
+        for i, action in zip(envids, actions):
+            env = self.envs[i]
+            transition = env.step_and_reset(action)
+            self._states[index, i] = env.extract(transition.state)
+            self._rewards[index, i] = transition.reward
+            self._terminals[index, i] = transition.terminal
+            if self.infos:
+                infos[i] = transition.info
+            if self._episodes is not None:
+                env.write_episode(self._episodes[index], i)
+        return infos
+
+    def close(self) -> None:
+        self._pool.shutdown()
+        for env in self.envs:
+            env.close()
+
+    def reset(self) -> Array[State]:
+        index = self._next_index()
+        chunks = self._chunks(np.arange(self.nworkers))
+        for future in [
+            self._pool.submit(self._reset_chunk, chunk, index) for chunk in chunks
+        ]:
+            future.result()
+        states = self._states[index]
+        return states if self.views else states.copy()
+
+    def step(self, actions: Iterable[Action]) -> PEnvTransition:
+        self.step_async(actions)
+        return self.step_wait()
+
+    def step_async(
+        self, actions: Iterable[Action], indices: Optional[Array[int]] = None
+    ) -> None:
+        actions = list(actions)
+        envids = np.arange(self.nworkers) if indices is None else np.asarray(indices)
+        self._check_idle(envids)
+        index = self._next_index()
+        futures, start = [], 0
+        for chunk in self._chunks(envids):
+            chunk_actions = actions[start : start + len(chunk)]
+            futures.append(
+                self._pool.submit(self._step_chunk, chunk, chunk_actions, index)
+            )
+            start += len(chunk)
+        self._busy.update(envids.tolist())
+        self._pending.append((indices, futures, index))
+
+    def _check_idle(self, envids: Array[int]) -> None:
+        if not self._busy.isdisjoint(envids.tolist()):
+            raise RuntimeError(
+                "ThreadedParallelEnv can't step an environment which is stepping"
+            )
+
+    def step_wait(self) -> PEnvTransition:
+        indices, futures, index = self._pending.popleft()
+        infos_by_id: Dict[int, dict] = {}
+        for future in futures:
+            infos_by_id.update(future.result())
+        envids = np.arange(self.nworkers) if indices is None else np.asarray(indices)
+        self._busy.difference_update(envids.tolist())
+        return self._transition(indices, index, infos_by_id)
+
+    def send(
+        self, actions: Iterable[Action], indices: Optional[Array[int]] = None
+    ) -> None:
+        actions = list(actions)
+        envids = np.arange(self.nworkers) if indices is None else np.asarray(indices)
+        self._check_idle(envids)
+        index, start = self._next_index(), 0
+        for chunk in self._chunks(envids):
+            chunk_actions = actions[start : start + len(chunk)]
+            future = self._pool.submit(self._step_chunk, chunk, chunk_actions, index)
+            self._sent[future] = chunk, index
+            start += len(chunk)
+        self._busy.update(envids.tolist())
+
+    def recv(self, batch_size: int) -> Tuple[Array[int], PEnvTransition]:
+        ready = self._ready_queue()
+        while len(ready) < batch_size and len(self._sent) > 0:
+            # Chunks stepping slow environments (e.g., resetting) are skipped
+            done, _ = wait(list(self._sent), return_when=FIRST_COMPLETED)
+            for future in done:
+                chunk, index = self._sent.pop(future)
+                self._busy.difference_update(chunk.tolist())
+                ready.push(chunk, self._transition(chunk, index, future.result()))
+        return ready.pop(batch_size)
+
+    def _transition(
+        self, indices: Optional[Array[int]], index: int, infos_by_id: Dict[int, dict]
+    ) -> PEnvTransition:
+        envids = np.arange(self.nworkers) if indices is None else np.asarray(indices)
+        if self.infos:
+            infos: Optional[Array[dict]] = np.empty(len(envids), dtype=object)
+            infos[:] = [infos_by_id[i] for i in envids]
+        else:
+            infos = None
+        envids = _buffer_ids(indices, self.nworkers, self.views)
+        return PEnvTransition(
+            self._states[index][envids],
+            self._rewards[index][envids],
+            self._terminals[index][envids],
+            infos,
+            None if self._episodes is None else self._episodes[index][envids],
+        )
+
+    def seed(self, seeds: Iterable[int]) -> None:
+        for env, seed in zip(self.envs, seeds):
+            env.seed(seed)
+
+    def extract(self, states: Iterable[State]) -> ndarray:
+        # States are extracted by threads
+        return np.asarray(states)
+
+    def do_any(
+        self,
+        function: str,
+        args: Optional[tuple] = None,
+        kwargs: Optional[dict] = None,
+    ) -> Array[Any]:
+        if args is None:
+            args = ()
+        if kwargs is None:
+            kwargs = {}
+        res = []
+        for env in self.envs:
+            fn = getattr(env.unwrapped, function)
+            res.append(fn(*args, **kwargs))
+        return np.array(res)
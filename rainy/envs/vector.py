@@ -0,0 +1,103 @@
+"""ParallelEnv which steps all environments by vectorized NumPy operations
+"""
+from abc import abstractmethod
+from collections import deque
+from typing import Any, Deque, Iterable, Optional, Tuple
+
+import numpy as np
+
+from ..prelude import Action, Array, State
+from .ext import EnvSpec
+from .parallel import ParallelEnv, PEnvTransition
+
+
+class VectorEnv(ParallelEnv):
+    """ParallelEnv whose environments are rows of arrays, like `(nworkers, 4)` states
+    of cartpoles, and are stepped at once by NumPy operations instead of a loop over
+    EnvExts. As `EnvExt.step_and_reset`, terminated environments are reset and their
+    next states are initial states, and `infos` of transitions are None.
+    Since all rows are stepped at once, `send` steps rows synchronously and `recv`
+    returns them in order.
+    Subclasses implement `_reset`, `_step` and `_obs` over rows `indices`.
+    """
+
+    def __init__(
+        self, nworkers: int, spec: EnvSpec, max_steps: Optional[int] = None
+    ) -> None:
+        self.nworkers = nworkers
+        self._spec = spec
+        self.max_steps = max_steps
+        self.np_random = np.random.default_rng()
+        self._episode_steps = np.zeros(nworkers, dtype=np.int64)
+        self._pending: Deque[PEnvTransition] = deque()
+
+    @abstractmethod
+    def _reset(self, indices: Array[int]) -> None:
+        """Initializes rows `indices`"""
+        pass
+
+    @abstractmethod
+    def _step(
+        self, actions: Array[Action], indices: Array[int]
+    ) -> Tuple[Array[float], Array[bool]]:
+        """Steps rows `indices` by `actions` and returns rewards and terminals"""
+        pass
+
+    @abstractmethod
+    def _obs(self, indices: Array[int]) -> Array:
+        """Returns observations of rows `indices`"""
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def reset(self) -> Array[State]:
+        indices = np.arange(self.nworkers)
+        self._reset(indices)
+        self._episode_steps.fill(0)
+        return self._obs(indices)
+
+    def step(self, actions: Iterable[Action]) -> PEnvTransition:
+        self.step_async(actions)
+        return self.step_wait()
+
+    def step_async(
+        self, actions: Iterable[Action], indices: Optional[Array[int]] = None
+    ) -> None:
+        if indices is None:
+            indices = np.arange(self.nworkers)
+        else:
+            indices = np.asarray(indices)
+        rewards, terminals = self._step(np.asarray(actions), indices)
+        self._episode_steps[indices] += 1
+        if self.max_steps is not None:
+            terminals |= self._episode_steps[indices] >= self.max_steps
+        ended = indices[terminals]
+        if len(ended) > 0:
+            self._reset(ended)
+            self._episode_steps[ended] = 0
+        # Rows have no info dicts
+        transition = PEnvTransition(self._obs(indices), rewards, terminals, None)
+        self._pending.append(transition)
+
+    def step_wait(self) -> PEnvTransition:
+        return self._pending.popleft()
+
+    def seed(self, seeds: Iterable[int]) -> None:
+        self.np_random = np.random.default_rng(list(seeds))
+
+    def extract(self, states: Iterable[State]) -> Array:
+        return np.asarray(states)
+
+    def do_any(
+        self,
+        function: str,
+        args: Optional[tuple] = None,
+        kwargs: Optional[dict] = None,
+    ) -> Array[Any]:
+        """Executes a method of this environment, which returns results of all rows"""
+        if args is None:
+            args = ()
+        if kwargs is None:
+            kwargs = {}
+        return np.asarray(getattr(self, function)(*args, **kwargs))
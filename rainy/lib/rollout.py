@@ -1,5 +1,7 @@
-from typing import DefaultDict, Generic, Iterator, List, NamedTuple, Optional
+import copy
+from typing import Any, DefaultDict, Generic, Iterator, List, NamedTuple, Optional
 
+import numpy as np
 import torch
 from torch import Tensor
 
@@ -62,6 +64,54 @@ class RolloutStorage(Generic[State]):
         for name, value in additional_values.items():
             self.additional_slots[name].append(value)
 
+    def push_ragged(
+        self,
+        envids: Array[int],
+        row: int,
+        state: Array[State],
+        reward: Array[float],
+        terminals: Array[bool],
+        **net_outputs,
+    ) -> None:
+        """Pushes transitions of environments `envids` from `row` to `row + 1`, where
+        other environments may be at other rows. The last row always holds the latest
+        values of each environment, and rows after `row + 1` are overwritten by them
+        until environments `envids` push these rows.
+        Other arguments are the same as `push`, but outputs are for all environments.
+        """
+        nrows = len(self.states)
+        rewards = np.zeros(self.nworkers, dtype=np.float32)
+        lengths = {id(values): len(values) for values in self._row_lists()}
+        self.push(
+            _scatter(self.states[-1], envids, state),
+            _scatter(self.rewards[-1] if self.rewards else rewards, envids, reward),
+            _scatter(np.zeros(self.nworkers, dtype=np.bool_), envids, terminals),
+            **net_outputs,
+        )
+        for values in self._row_lists():
+            if len(values) == lengths.get(id(values), 0):
+                continue
+            new = values.pop()
+            if row + 1 == nrows:
+                prev = values[-1] if len(values) > 0 else new
+                values.append(_merge(prev, envids, new))
+            else:
+                start = row + 1 - nrows + len(values)
+                for i in range(max(start, 0), len(values)):
+                    values[i] = _merge(values[i], envids, new)
+
+    def _row_lists(self) -> List[List[Any]]:
+        lists = [
+            self.states,
+            self.rewards,
+            self.masks,
+            self.episode_steps,
+            self.rnn_states,
+            self.policies,
+            self.values,
+        ]
+        return lists + list(self.additional_slots.values())
+
     def reset(self) -> None:
         self.masks = [self.masks[-1]]
         self.episode_steps = [self.episode_steps[-1]]
@@ -125,6 +175,29 @@ class RolloutStorage(Generic[State]):
         self.returns[:-1] = self.advs[:-1] + self.batch_values
 
 
+def _scatter(dst: Array, envids: Array[int], values: Array) -> Array:
+    res = np.array(dst, copy=True)
+    res[envids] = values
+    return res
+
+
+def _merge(dst: Any, envids: Array[int], src: Any) -> Any:
+    """Returns a copy of `dst` where values of `envids` are replaced by `src`'s"""
+    if isinstance(src, Tensor):
+        res = dst.clone()
+    elif isinstance(src, np.ndarray):
+        res = dst.copy()
+    elif isinstance(src, RnnState):
+        res = dst[torch.arange(src.size(0))]
+    elif isinstance(src, Policy):
+        res = copy.copy(dst)
+    else:
+        # Per-row scalars (e.g., epsilons) are set by the latest push
+        return src
+    res[envids] = src if isinstance(src, (RnnState, Policy)) else src[envids]
+    return res
+
+
 class RolloutBatch(NamedTuple):
     states: Tensor
     actions: Tensor
@@ -55,6 +55,30 @@ class Policy(ABC):
         else:
             return act.squeeze_()
 
+    def __setitem__(self, idx: Index, other: Self) -> None:
+        """Replaces distributions and cached actions of ``idx`` by ``other``'s."""
+        if self._action is not None or other._action is not None:
+            action = self._action if self._action is not None else self.sample()
+            other_action = (
+                other._action if other._action is not None else other.sample()
+            )
+            self._action = action.clone()
+            self._action[idx] = other_action[idx]
+        self._baction = None
+        self._set_dist(idx, other)
+
+    def take(self, idx: Index) -> Self:
+        """Returns ``self[idx]`` that keeps cached actions of ``idx``."""
+        if self._action is None:
+            self._action = self.sample()
+        res = self[idx]
+        res._action = self._action[idx]
+        return res
+
+    @abstractmethod
+    def _set_dist(self, idx: Index, other: Self) -> None:
+        pass
+
     @abstractmethod
     def __getitem__(self, idx: Index) -> Self:
         pass
@@ -103,6 +127,11 @@ class BernoulliPolicy(Policy):
     def __getitem__(self, idx: Index) -> Self:
         return self.__class__(logits=self.dist.logits[idx])
 
+    def _set_dist(self, idx: Index, other: Self) -> None:
+        logits = self.dist.logits.clone()
+        logits[idx] = other.dist.logits[idx]
+        self.dist = self.dist.__class__(logits=logits)
+
     def detach(self) -> Self:
         return self.__class__(logits=self.dist.logits.detach())
 
@@ -130,6 +159,11 @@ class CategoricalPolicy(Policy):
     def __getitem__(self, idx: Index) -> Self:
         return self.__class__(logits=self.dist.logits[idx])
 
+    def _set_dist(self, idx: Index, other: Self) -> None:
+        logits = self.dist.logits.clone()
+        logits[idx] = other.dist.logits[idx]
+        self.dist = self.dist.__class__(logits=logits)
+
     def detach(self) -> Self:
         return self.__class__(logits=self.dist.logits.detach())
 
@@ -157,6 +191,12 @@ class GaussianPolicy(Policy):
     def __getitem__(self, idx: Index) -> Self:
         return self.__class__(self.dist.mean[idx], self.dist.stddev[idx])
 
+    def _set_dist(self, idx: Index, other: Self) -> None:
+        mean, stddev = self.dist.mean.clone(), self.dist.stddev.clone()
+        mean[idx] = other.dist.mean[idx]
+        stddev[idx] = other.dist.stddev[idx]
+        self.dist = Normal(mean, stddev)
+
     def detach(self) -> Self:
         return self.__class__(self.dist.mean.detach(), self.dist.stddev.detach())
 
@@ -177,6 +217,11 @@ class TanhGaussianPolicy(GaussianPolicy):
         self._pre_tanh = res
         return torch.tanh(res)
 
+    def _set_dist(self, idx: Index, other: Self) -> None:
+        super()._set_dist(idx, other)
+        # Recomputed from actions by log_prob
+        self._pre_tanh = None
+
     def best_action(self) -> Tensor:
         return torch.tanh(self.dist.mean)
 
@@ -39,3 +39,4 @@ State = TypeVar("State")
 
 
 DEFAULT_SAVEFILE_NAME = "rainy-agent.pth"
+REPLAY_DIRNAME = "replay-chunks"
@@ -1,3 +1,12 @@
+from .array import ArrayReplayBuffer
 from .array_deque import ArrayDeque
-from .base import ReplayBuffer, ReplayFeed
+from .base import ReplayBatch, ReplayBuffer, ReplayFeed
+from .compressed import CompressedFrameReplayBuffer, CompressedReplayBuffer
+from .frame import FrameReplayBuffer
+from .memmap import MemmapReplayBuffer
+from .prefetch import PrefetchReplayBuffer
+from .prioritized import PrioritizedFrameReplayBuffer, PrioritizedReplayBuffer, SumTree
+from .sequence import SequenceBatch, SequenceFrameReplayBuffer, SequenceReplayBuffer
+from .shared import SharedMemoryReplayBuffer
+from .tensor import TensorReplayBuffer
 from .uniform import BootDQNReplayFeed, DQNReplayFeed, UniformReplayBuffer
@@ -0,0 +1,543 @@
+"""Replay buffer backed by preallocated ring arrays
+"""
+import dataclasses
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Generic,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+)
+
+import numpy as np
+
+from ..prelude import Array, State
+from ..utils import sample_indices
+from . import chunk
+from .base import ReplayBatch, ReplayBuffer, ReplayFeed
+
+if TYPE_CHECKING:
+    from ..envs import EnvSpec
+
+
+def _storage_dtype(arr: Array) -> np.dtype:
+    # float64 is only a default of numpy and python, so we don't need it
+    return np.float32 if arr.dtype == np.float64 else arr.dtype
+
+
+class ArrayReplayBuffer(ReplayBuffer, Generic[ReplayFeed]):
+    """Uniform replay buffer that stores each field of the feed in a ring array.
+    Each slot holds a state and the other fields of the transition from it.
+    The next state of the transition in slot i is the state in slot i + 1, so
+    consecutive transitions share states and `next_state` is never copied twice.
+    When a transition doesn't start from the last next state (e.g., after reset),
+    the last next state occupies one slot which is never sampled.
+    Arrays are allocated when the first transition is appended.
+    If nstep > 1, sampled batches have n-step returns computed from the following
+    slots and `discounts`, which are discount_factor ** n or 0 if terminated.
+    If `discount_factor` is None, `Config.replay_buffer` sets it to the discount
+    factor of the config (0.99 if the buffer is used without a config).
+    `save_chunks` only writes chunks of `chunk_size` slots modified after the last
+    call to the same directory.
+    `dtypes` overrides storage dtypes of fields (e.g., `{"state": np.float16}`), and
+    sampled fields are converted back to the dtypes they would be stored as.
+    `append_batch` gives each environment its own block of slots at a time, so that
+    transitions from parallel environments also share states.
+    """
+
+    # Number of preceding slots that a state in a slot depends on
+    _history = 0
+    # Maximum number of slots in a block written by one environment
+    _max_block_size = 256
+
+    def __init__(
+        self,
+        feed: Type[ReplayFeed],
+        capacity: int = 1000,
+        allow_overlap: bool = False,
+        extract: Callable[[State], Array] = np.asarray,
+        nstep: int = 1,
+        discount_factor: Optional[float] = None,
+        chunk_size: int = 4096,
+        dtypes: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        super().__init__(feed, allow_overlap=allow_overlap)
+        self.cap = capacity
+        self.extract = extract
+        self.nstep = nstep
+        self.discount_factor = discount_factor
+        gamma = 0.99 if discount_factor is None else discount_factor
+        self._gammas = gamma ** np.arange(nstep + 1)
+        self._field_names = [f.name for f in dataclasses.fields(feed)]
+        self._nslots = capacity + 1 + self._history
+        self._states: Optional[Array] = None
+        self._columns: Dict[str, Array] = {}
+        # _valid[i] is True iff slot i has a transition whose next state is in i + 1
+        self._valid = np.zeros(self._nslots, dtype=np.bool_)
+        self._cursor = -1
+        self._filled = 0
+        self._len = 0
+        # Whether the next `append` continues the episode of the last one
+        self._continuing = False
+        self._episode_started = False
+        # Chunks of slots modified since the last save_chunks
+        self.chunk_size = chunk_size
+        self._dirty = np.zeros(-(-self._nslots // chunk_size), dtype=np.bool_)
+        self._chunk_dir: Optional[Path] = None
+        self.dtypes = {name: np.dtype(d) for name, d in (dtypes or {}).items()}
+        # Dtypes that sampled fields are converted to
+        self._casts: Dict[str, np.dtype] = {}
+        # Blocks of slots written by append_batch
+        self._block_size = 0
+        self._next_block = 0
+        self._block_owners: Dict[int, int] = {}
+        self._reset_lanes()
+
+    def set_discount_factor(self, gamma: float) -> None:
+        """Sets the discount factor of n-step returns if it isn't given, or checks
+        that the given one is `gamma`.
+        """
+        if self.discount_factor is None:
+            self.discount_factor = gamma
+            self._gammas = gamma ** np.arange(self.nstep + 1)
+        elif self.nstep > 1 and self.discount_factor != gamma:
+            raise ValueError(
+                f"discount_factor of the replay buffer ({self.discount_factor}) is"
+                f" different from discount_factor of the config ({gamma})"
+            )
+
+    def _allocate(self, name: str, shape: tuple, dtype: np.dtype) -> Array:
+        return np.zeros((self._nslots, *shape), dtype=dtype)
+
+    def _state_spec(self, state: Array) -> Tuple[tuple, np.dtype]:
+        return state.shape, self.dtypes.get("state", _storage_dtype(state))
+
+    def _column_spec(self, name: str, value: Any) -> Tuple[tuple, np.dtype]:
+        arr = np.asarray(value)
+        return arr.shape, self.dtypes.get(name, _storage_dtype(arr))
+
+    def _setup(self, state: Array, values: Dict[str, Any]) -> None:
+        self._states = self._allocate("state", *self._state_spec(state))
+        for name, value in values.items():
+            self._columns[name] = self._allocate(name, *self._column_spec(name, value))
+        values = dict(state=state, **values)
+        for name in self.dtypes:
+            self._casts[name] = np.dtype(_storage_dtype(np.asarray(values[name])))
+
+    def _validate(self, slots: Union[int, Array[int]]) -> None:
+        self._valid[slots] = True
+        self._len += int(np.size(slots))
+
+    def _invalidate(self, slots: Union[int, Array[int]]) -> None:
+        """Slots must be unique"""
+        n = int(np.count_nonzero(self._valid[slots]))
+        if n > 0:
+            self._valid[slots] = False
+            self._len -= n
+
+    def _advance(self) -> int:
+        self._cursor = (self._cursor + 1) % self._nslots
+        self._invalidate(self._cursor)
+        # The state in the cursor slot is a part of the states of following slots
+        self._invalidate((self._cursor + self._history) % self._nslots)
+        self._filled = max(self._filled, self._cursor + 1)
+        self._dirty[self._cursor // self.chunk_size] = True
+        history_end = (self._cursor + self._history) % self._nslots
+        self._dirty[history_end // self.chunk_size] = True
+        return self._cursor
+
+    def _write(self, arr: Array, index: Any, value: Any) -> None:
+        arr[index] = value
+
+    def _read(self, arr: Array, index: Any) -> Array:
+        return arr[index]
+
+    def _to_numpy(self, arr: Array) -> Array:
+        return arr
+
+    def _cast(self, name: str, arr: Array) -> Array:
+        dtype = self._casts.get(name, None)
+        return arr if dtype is None else arr.astype(dtype)
+
+    def _write_state(self, state: Array, new_episode: bool) -> None:
+        self._write(self._states, self._advance(), state)
+
+    def _write_next_states(self, slots: Array[int], states: Array) -> None:
+        """Write states that follow the states in `slots - 1`"""
+        self._write(self._states, slots, states)
+
+    def _read_states(self, slots: Array[int]) -> Array:
+        return self._cast("state", self._read(self._states, slots))
+
+    def append(self, *args) -> None:
+        values = dict(zip(self._field_names, args))
+        state, next_state = values.pop("state"), values.pop("next_state")
+        if self._block_size > 0:
+            raise ValueError("append can't follow append_batch")
+        state = self.extract(state)
+        if self._states is None:
+            self._setup(state, values)
+        self._episode_started = not self._continuing
+        if self._episode_started:
+            self._write_state(state, new_episode=True)
+        slot = self._cursor
+        for name, value in values.items():
+            self._write(self._columns[name], slot, value)
+        self._write_state(self.extract(next_state), new_episode=False)
+        self._validate(slot)
+        self._continuing = not values.get("done", False)
+
+    def end_episode(self) -> None:
+        self._continuing = False
+
+    def _extract_batch(self, states: Array[State]) -> Array:
+        if self.extract is np.asarray:
+            return np.asarray(states)
+        return np.stack([self.extract(state) for state in states])
+
+    def _reset_lanes(self) -> None:
+        # Slot of the last next state, end of the block, whether the last transition
+        # is terminal and the last next state of each environment
+        self._lane_cursor = np.zeros(0, dtype=np.int64)
+        self._lane_end = np.zeros(0, dtype=np.int64)
+        self._lane_done = np.zeros(0, dtype=np.bool_)
+        self._lane_next: Optional[Array] = None
+
+    def _grow_lanes(self, nenvs: int, state: Array) -> None:
+        n = len(self._lane_cursor)
+        if n >= nenvs:
+            return
+        self._lane_cursor = np.concatenate((self._lane_cursor, np.full(nenvs - n, -1)))
+        self._lane_end = np.concatenate((self._lane_end, np.zeros(nenvs - n, np.int64)))
+        # New environments start episodes
+        self._lane_done = np.concatenate((self._lane_done, np.ones(nenvs - n, bool)))
+        lane_next = np.zeros((nenvs, *state.shape), dtype=state.dtype)
+        if self._lane_next is not None:
+            lane_next[:n] = self._lane_next
+        self._lane_next = lane_next
+        self._resize_blocks()
+
+    def _resize_blocks(self) -> None:
+        """Sizes blocks by the number of environments, and makes them start new blocks.
+        The last slot of each block and unfilled blocks being written by environments
+        are wasted, so the size of blocks balances these two.
+        """
+        nlanes = len(self._lane_cursor)
+        size = int(np.sqrt(2 * self._nslots / nlanes))
+        # Blocks are allocated from the start of the next block of the old size
+        if self._block_size == 0:
+            start = self._cursor + 1
+        else:
+            start = self._next_block * self._block_size
+        self._block_size = max(min(size, self._max_block_size), self._history + 2)
+        nblocks = self._nslots // self._block_size
+        self._next_block = -(-start // self._block_size) % nblocks
+        self._lane_cursor[:] = -1
+        self._block_owners.clear()
+
+    def _load_blocks(self, meta: Dict[str, Any]) -> None:
+        # Environments start new blocks after loading
+        self._block_size = meta.get("block_size", 0)
+        self._next_block = meta.get("next_block", 0)
+        self._block_owners.clear()
+        self._reset_lanes()
+
+    def _allocate_block(self, envid: int) -> int:
+        """Returns the first slot of the next block, which `envid` writes to"""
+        nblocks = self._nslots // self._block_size
+        block = self._next_block
+        self._next_block = (block + 1) % nblocks
+        start = block * self._block_size
+        end = self._nslots if block == nblocks - 1 else start + self._block_size
+        owner = self._block_owners.get(block, None)
+        if owner is not None and self._lane_end[owner] == end:
+            self._lane_cursor[owner] = -1
+        self._block_owners[block] = envid
+        self._lane_end[envid] = end
+        # Slots whose transitions or states overlap the block
+        stale = np.unique(np.arange(start - 1, end + self._history) % self._nslots)
+        self._invalidate(stale)
+        self._dirty[stale // self.chunk_size] = True
+        return start
+
+    def _append_new(
+        self, envid: int, state: Array, next_state: Array, values: Dict[str, Any]
+    ) -> int:
+        """Append a transition that doesn't start from the last next state"""
+        cursor = self._lane_cursor[envid]
+        # The state and the next state must be in the same block
+        if cursor < 0 or cursor + self._history + 2 >= self._lane_end[envid]:
+            cursor = self._allocate_block(envid) - 1
+        self._cursor = int(cursor)
+        self._write_state(state, new_episode=True)
+        slot = self._cursor
+        for name, value in values.items():
+            self._write(self._columns[name], slot, value)
+        self._write_state(next_state, new_episode=False)
+        self._validate(slot)
+        self._lane_cursor[envid] = self._cursor
+        return slot
+
+    def append_batch(self, *args, envids: Optional[Array[int]] = None) -> None:
+        """Append transitions from parallel environments `envids` (0, 1, ... if None).
+        Each environment writes to its own block of consecutive slots, so that its
+        transitions share states as in `append` and n-step returns and stacked
+        frames are read from consecutive slots.
+        """
+        self._append_lanes(args, envids)
+
+    def _append_lanes(
+        self, args: Sequence[Any], envids: Optional[Array[int]]
+    ) -> Tuple[Array[int], Array[bool]]:
+        """Returns slots of transitions and whether they start new episodes"""
+        values = dict(zip(self._field_names, args))
+        states = self._extract_batch(values.pop("state"))
+        next_states = self._extract_batch(values.pop("next_state"))
+        values = {name: np.asarray(value) for name, value in values.items()}
+        n = len(states)
+        if self._states is None:
+            self._setup(states[0], {name: v[0] for name, v in values.items()})
+        envids = np.arange(n) if envids is None else np.asarray(envids)
+        self._grow_lanes(int(envids.max()) + 1, states[0])
+        cursors = self._lane_cursor[envids]
+        same = (states == self._lane_next[envids]).reshape(n, -1).all(axis=1)
+        new_episode = self._lane_done[envids] | ~same
+        cont = (cursors >= 0) & ~new_episode & (cursors + 1 < self._lane_end[envids])
+        # Transitions from the last next states only write the next states
+        slots = cursors[cont]
+        next_slots = slots + 1
+        if len(slots) > 0:
+            stale = next_slots
+            if self._history > 0:
+                stale = np.union1d(stale, (stale + self._history) % self._nslots)
+            self._invalidate(stale)
+            self._dirty[stale // self.chunk_size] = True
+            for name, value in values.items():
+                self._write(self._columns[name], slots, value[cont])
+            self._write_next_states(next_slots, next_states[cont])
+            self._validate(slots)
+            self._filled = max(self._filled, int(next_slots.max()) + 1)
+            self._lane_cursor[envids[cont]] = next_slots
+            self._cursor = int(next_slots[-1])
+        res = np.zeros(n, dtype=np.int64)
+        res[cont] = slots
+        for i in np.flatnonzero(~cont):
+            transition = {name: value[i] for name, value in values.items()}
+            res[i] = self._append_new(envids[i], states[i], next_states[i], transition)
+        self._lane_next[envids] = next_states
+        self._lane_done[envids] = values["done"] if "done" in values else False
+        self._continuing = False
+        return res, new_episode
+
+    def _sample_slots(self, batch_size: int) -> Array[int]:
+        if self.allow_overlap:
+            slots = np.random.randint(self._filled, size=batch_size)
+            invalid = ~self._valid[slots]
+            while invalid.any():
+                slots[invalid] = np.random.randint(self._filled, size=invalid.sum())
+                invalid = ~self._valid[slots]
+            return slots
+        if self._len < batch_size:
+            raise ValueError("[ArrayReplayBuffer::sample] len < batch_size")
+        slots = sample_indices(self._filled, batch_size)
+        slots = slots[self._valid[slots]]
+        while len(slots) < batch_size:
+            extra = sample_indices(self._filled, batch_size)
+            extra = extra[self._valid[extra] & ~np.isin(extra, slots)]
+            # Slots stay in random order, unlike np.union1d
+            slots = np.concatenate((slots, extra))
+        return slots[:batch_size]
+
+    def _nstep_returns(self, slots: Array[int]) -> Tuple[Array, ...]:
+        """Returns n-step returns, terminals, slots of next states and discounts"""
+        window = (slots[:, np.newaxis] + np.arange(self.nstep)) % self._nslots
+        rewards = self._columns["reward"][window]
+        dones = self._columns["done"][window]
+        # Step j is used iff all steps before j are not terminal and step j exists
+        cont = np.logical_and(self._valid[window[:, 1:]], ~dones[:, :-1])
+        used = np.ones(window.shape, dtype=np.bool_)
+        used[:, 1:] = np.logical_and.accumulate(cont, axis=1)
+        nsteps = used.sum(axis=1)
+        returns = np.sum(rewards * used * self._gammas[:-1], axis=1)
+        terminals = np.any(dones & used, axis=1)
+        discounts = self._gammas[nsteps] * (1.0 - terminals)
+        next_slots = (slots + nsteps) % self._nslots
+        return returns, terminals, next_slots, discounts.astype(np.float32)
+
+    def _gather(self, slots: Array[int]) -> ReplayBatch:
+        batch = {
+            name: self._cast(name, column[slots])
+            for name, column in self._columns.items()
+        }
+        batch["state"] = self._read_states(slots)
+        if self.nstep == 1:
+            batch["next_state"] = self._read_states((slots + 1) % self._nslots)
+            return ReplayBatch(*[batch[name] for name in self._field_names])
+        rewards, terminals, next_slots, discounts = self._nstep_returns(slots)
+        batch["reward"] = rewards.astype(batch["reward"].dtype)
+        batch["done"] = terminals
+        batch["next_state"] = self._read_states(next_slots)
+        res = ReplayBatch(*[batch[name] for name in self._field_names])
+        return res._replace(discounts=discounts)
+
+    def _sample_many(self, n: int, batch_size: int) -> Array[int]:
+        """Sample slots of `n` batches, where slots in each batch are unique"""
+        if self.allow_overlap or n * batch_size <= self._len:
+            return self._sample_slots(n * batch_size)
+        return np.concatenate([self._sample_slots(batch_size) for _ in range(n)])
+
+    def sample(self, batch_size: int) -> ReplayBatch:
+        return self._gather(self._sample_slots(batch_size))
+
+    def sample_batch(
+        self, batch_size: int, extract: Optional[Callable[[State], Array]] = None
+    ) -> ReplayBatch:
+        return self.sample(batch_size)
+
+    def sample_batches(
+        self,
+        n: int,
+        batch_size: int,
+        extract: Optional[Callable[[State], Array]] = None,
+    ) -> List[ReplayBatch]:
+        """Sample and gather slots of all batches by one indexing"""
+        if n == 1:
+            return [self.sample(batch_size)]
+        return self._gather(self._sample_many(n, batch_size)).split(n)
+
+    def _slot_arrays(self) -> Dict[str, Array]:
+        """Arrays of slots other than fields and valid flags, saved in chunks"""
+        return {}
+
+    def _chunk_metadata(self) -> Dict[str, Any]:
+        return {}
+
+    def _load_chunk_metadata(self, meta: Dict[str, Any]) -> None:
+        pass
+
+    def save_chunks(self, directory: Path) -> dict:
+        directory.mkdir(parents=True, exist_ok=True)
+        if directory != self._chunk_dir:
+            # Chunks saved in the last directory are reused
+            clean = np.flatnonzero(~self._dirty[: -(-self._filled // self.chunk_size)])
+            missing = chunk.link_chunks(self._chunk_dir, directory, clean)
+            self._dirty[missing] = True
+            self._chunk_dir = directory
+        for index in np.flatnonzero(self._dirty):
+            span = slice(index * self.chunk_size, (index + 1) * self.chunk_size)
+            columns = {
+                name: self._to_numpy(column[span])
+                for name, column in self._columns.items()
+            }
+            for name, arr in self._slot_arrays().items():
+                columns[name] = self._to_numpy(arr[span])
+            states, valid = self._to_numpy(self._states[span]), self._valid[span]
+            chunk.save_chunk(directory, index, state=states, valid=valid, **columns)
+        self._dirty[:] = False
+        chunk.save_metadata(
+            directory,
+            nslots=self._nslots,
+            chunk_size=self.chunk_size,
+            cursor=self._cursor,
+            filled=self._filled,
+            len=self._len,
+            casts={name: dtype.str for name, dtype in self._casts.items()},
+            block_size=self._block_size,
+            next_block=self._next_block,
+            **self._chunk_metadata(),
+        )
+        return dict(path=directory.as_posix())
+
+    def load_chunks(self, saved: dict) -> None:
+        directory = Path(saved["path"])
+        meta = chunk.load_metadata(directory)
+        if meta["nslots"] != self._nslots:
+            raise ValueError(
+                f"Chunks in {directory} have {meta['nslots']} slots,"
+                f" but this buffer has {self._nslots} slots"
+            )
+        size = meta["chunk_size"]
+        self._load_chunk_metadata(meta)
+        for index in range(-(-meta["filled"] // size)):
+            arrays = chunk.load_chunk(directory, index)
+            if self._states is None:
+                for name in self._field_names:
+                    if name != "next_state":
+                        arr = arrays[name]
+                        column = self._allocate(name, arr.shape[1:], arr.dtype)
+                        self._columns[name] = column
+                self._states = self._columns.pop("state")
+            span = slice(index * size, (index + 1) * size)
+            for name, column in self._columns.items():
+                self._write(column, span, arrays[name])
+            self._write(self._states, span, arrays["state"])
+            for name, arr in self._slot_arrays().items():
+                self._write(arr, span, arrays[name])
+            self._valid[span] = arrays["valid"]
+        self._cursor = meta["cursor"]
+        self._filled = meta["filled"]
+        self._len = meta["len"]
+        self._casts = {name: np.dtype(d) for name, d in meta.get("casts", {}).items()}
+        self._load_blocks(meta)
+        self._continuing = False
+        self._dirty[:] = False
+        self._chunk_dir = directory if size == self.chunk_size else None
+
+    def _footprint_arrays(self) -> List[Any]:
+        return [self._states, *self._columns.values(), self._valid, self._dirty]
+
+    def _nbytes(self, arr: Any) -> int:
+        return arr.nbytes
+
+    # Bytes per slot used by the buffer other than fields
+    _overhead_per_slot = 1
+
+    def footprint(self) -> Dict[str, int]:
+        """Returns bytes of allocated arrays and an estimate of their resident bytes,
+        which is not measured. Since zero-filled arrays are backed by memory only
+        when written, the part of filled slots is assumed to be resident.
+        """
+        arrays = [arr for arr in self._footprint_arrays() if arr is not None]
+        allocated = sum(self._nbytes(arr) for arr in arrays)
+        resident = allocated * self._filled // self._nslots
+        return dict(allocated=allocated, resident_estimate=resident)
+
+    def stats(self) -> Dict[str, float]:
+        resident = self.footprint()["resident_estimate"]
+        return dict(replay_resident_estimate_mb=resident / 2 ** 20)
+
+    def _slot_bytes(self, spec: "EnvSpec", **examples: Any) -> int:
+        state = np.zeros(spec.state_dim, dtype=np.float32)
+        shape, dtype = self._state_spec(state)
+        nbytes = np.dtype(dtype).itemsize * int(np.prod(shape))
+        examples.setdefault("action", spec.random_action())
+        examples.setdefault("reward", 0.0)
+        examples.setdefault("done", False)
+        for name in self._field_names:
+            if name in ["state", "next_state"]:
+                continue
+            if name not in examples:
+                raise ValueError(f"Give an example of {name} to estimate its size")
+            shape, dtype = self._column_spec(name, examples[name])
+            nbytes += np.dtype(dtype).itemsize * int(np.prod(shape))
+        return nbytes + self._overhead_per_slot
+
+    def capacity_for(self, budget: int, spec: "EnvSpec", **examples: Any) -> int:
+        """Returns the capacity of this type of buffer that fits in `budget` bytes,
+        for environments with `spec`.
+        Fields other than state, action, reward and done need examples (e.g., masks).
+        """
+        capacity = budget // self._slot_bytes(spec, **examples) - 1 - self._history
+        if capacity < 1:
+            raise ValueError(f"{budget} bytes can't hold any transition")
+        return capacity
+
+    def __len__(self):
+        return self._len
@@ -1,9 +1,54 @@
 from abc import ABC, abstractmethod
-from typing import Generic, List, Type, TypeVar
+from pathlib import Path
+from typing import (
+    Callable,
+    Dict,
+    Generic,
+    List,
+    NamedTuple,
+    Optional,
+    Type,
+    TypeVar,
+    Union,
+)
+
+import numpy as np
+
+from ..prelude import Array, State
 
 ReplayFeed = TypeVar("ReplayFeed")
 
 
+class ReplayBatch(NamedTuple):
+    """Sampled transitions stacked field by field.
+    The order of fields is the same as `DQNReplayFeed` and `BootDQNReplayFeed`.
+    """
+
+    states: Array
+    actions: Array
+    next_states: Array
+    rewards: Array
+    terminals: Array
+    masks: Optional[Array] = None
+    # Discount factors per transition, used by n-step replay
+    discounts: Optional[Array[float]] = None
+    # Used by prioritized replay
+    indices: Optional[Array[int]] = None
+    weights: Optional[Array[float]] = None
+
+    def split(self, n: int) -> List["ReplayBatch"]:
+        """Split a batch gathered for `n` batches at once.
+        Fields are sliced, so that tensors on the device are also split as they are.
+        """
+        bs = len(self.states) // n
+        return [
+            ReplayBatch(
+                *[None if f is None else f[i * bs : (i + 1) * bs] for f in self]
+            )
+            for i in range(n)
+        ]
+
+
 class ReplayBuffer(ABC, Generic[ReplayFeed]):
     def __init__(self, feed: Type[ReplayFeed], allow_overlap: bool = False) -> None:
         self.feed = feed
@@ -13,10 +58,64 @@ class ReplayBuffer(ABC, Generic[ReplayFeed]):
     def append(self, *args) -> None:
         pass
 
+    def end_episode(self) -> None:
+        """Tell that the next `append` starts a new episode even if the last one
+        wasn't terminal, e.g., when the environment is reset after a time limit.
+        """
+        pass
+
+    def append_batch(self, *args, envids: Optional[Array[int]] = None) -> None:
+        """Append a batch of transitions, where each argument is a batch of a field.
+        `envids` are ids of environments that the transitions come from.
+        """
+        for transition in zip(*args):
+            self.append(*transition)
+
     @abstractmethod
-    def sample(self, batch_size: int) -> List[ReplayFeed]:
+    def sample(self, batch_size: int) -> Union[List[ReplayFeed], ReplayBatch]:
         pass
 
+    def sample_batch(
+        self, batch_size: int, extract: Callable[[State], Array]
+    ) -> ReplayBatch:
+        """Sample transitions and stack them into a `ReplayBatch`.
+        Buffers which store transitions as arrays should override this.
+        """
+        obs = [ob.to_array(extract) for ob in self.sample(batch_size)]
+        return ReplayBatch(*map(np.asarray, zip(*obs)))
+
+    def sample_batches(
+        self, n: int, batch_size: int, extract: Callable[[State], Array]
+    ) -> List[ReplayBatch]:
+        """Sample `n` batches for consecutive updates.
+        Buffers which store transitions as arrays sample them at once.
+        """
+        return [self.sample_batch(batch_size, extract) for _ in range(n)]
+
+    def update_priorities(self, indices: Array[int], td_errors: Array[float]) -> None:
+        """Update priorities of sampled transitions by their TD errors.
+        Only prioritized buffers, which return `indices` in the batch, use this.
+        """
+        pass
+
+    def stats(self) -> Dict[str, float]:
+        """Returns statistics for logging (e.g., time spent in sampling)"""
+        return {}
+
+    def close(self) -> None:
+        """Releases workers used by the buffer"""
+        pass
+
+    def save_chunks(self, directory: Path) -> dict:
+        """Save transitions to `directory` as chunks of arrays, and return a small
+        dict for `load_chunks`. Only chunks changed since the last call are written.
+        """
+        raise NotImplementedError(f"{type(self).__name__} can't be saved as chunks")
+
+    def load_chunks(self, saved: dict) -> None:
+        """Load transitions saved by `save_chunks`, chunk by chunk"""
+        raise NotImplementedError(f"{type(self).__name__} can't be loaded as chunks")
+
     @abstractmethod
     def __len__(self):
         pass
@@ -0,0 +1,75 @@
+"""Utilities to save replay buffers as chunks of numpy arrays
+"""
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from ..prelude import Array
+
+METADATA = "metadata.json"
+
+
+def _chunk_path(directory: Path, index: int) -> Path:
+    return directory.joinpath(f"chunk-{index:06d}.npz")
+
+
+def save_chunk(directory: Path, index: int, **arrays: Array) -> None:
+    path = _chunk_path(directory, index)
+    tmp = path.with_suffix(".tmp")
+    with tmp.open("wb") as f:
+        np.savez(f, **arrays)
+    # Not to leave a broken chunk when interrupted
+    os.replace(tmp, path)
+
+
+def load_chunk(directory: Path, index: int) -> Dict[str, Array]:
+    path = _chunk_path(directory, index)
+    if not path.exists():
+        raise FileNotFoundError(f"Replay chunk {index} is missing: {path}")
+    with np.load(path) as npz:
+        return dict(npz)
+
+
+def link_chunks(src: Optional[Path], dst: Path, indices: Iterable[int]) -> List[int]:
+    """Hard-link chunks saved in `src` to `dst`, and return indices of chunks that
+    `src` doesn't have. Since `save_chunk` replaces files instead of overwriting
+    them, linked chunks are never modified by saving to the other directory.
+    """
+    missing = []
+    for index in indices:
+        path = None if src is None else _chunk_path(src, index)
+        if path is None or not path.exists():
+            missing.append(index)
+            continue
+        target = _chunk_path(dst, index)
+        if target.exists():
+            target.unlink()
+        try:
+            os.link(path, target)
+        except OSError:
+            shutil.copyfile(path, target)
+    return missing
+
+
+def remove_chunks(directory: Path, stop: int) -> None:
+    """Remove chunks whose indices are smaller than `stop`"""
+    for path in directory.glob("chunk-*.npz"):
+        if int(path.stem[len("chunk-") :]) < stop:
+            path.unlink()
+
+
+def save_metadata(directory: Path, **kwargs: Any) -> None:
+    with directory.joinpath(METADATA).open("w") as f:
+        json.dump(kwargs, f)
+
+
+def load_metadata(directory: Path) -> Dict[str, Any]:
+    path = directory.joinpath(METADATA)
+    if not path.exists():
+        raise ValueError(f"{directory} doesn't have replay chunks")
+    with path.open() as f:
+        return json.load(f)
@@ -0,0 +1,134 @@
+"""Replay buffers which store states compressed by zlib, for memory-bound Atari replay
+"""
+import sys
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Generic, List, Optional, Type
+
+import numpy as np
+
+from ..prelude import Array
+from .array import ArrayReplayBuffer
+from .base import ReplayFeed
+from .frame import FrameReplayBuffer
+
+
+class CompressedReplayBuffer(ArrayReplayBuffer, Generic[ReplayFeed]):
+    """ArrayReplayBuffer that stores each state as bytes compressed by zlib.
+    States of a sampled batch are decompressed by `nworkers` threads, since zlib
+    releases the GIL, and each slot is decompressed only once per batch.
+    `stats` returns the compression ratio of stored states and the mean time to
+    decode a batch, so that the tradeoff can be seen in `network_log`.
+    """
+
+    def __init__(
+        self,
+        feed: Type[ReplayFeed],
+        capacity: int = 1000,
+        level: int = 1,
+        nworkers: int = 4,
+        **kwargs,
+    ) -> None:
+        super().__init__(feed, capacity, **kwargs)
+        self.level = level
+        self.nworkers = nworkers
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._state_shape: tuple = ()
+        self._state_dtype = np.dtype(np.float32)
+        self._nstored = 0
+        self._compressed_bytes = 0
+        self._ndecodes = 0
+        self._decode_time = 0.0
+
+    def _allocate(self, name: str, shape: tuple, dtype: np.dtype) -> Array:
+        if name != "state":
+            return super()._allocate(name, shape, dtype)
+        self._state_shape, self._state_dtype = shape, np.dtype(dtype)
+        arr = np.empty(self._nslots, dtype=object)
+        arr[:] = b""
+        return arr
+
+    def _map(self, fn: Callable[[Any], Any], items: Array) -> List[Any]:
+        if self.nworkers <= 1 or len(items) < 2 * self.nworkers:
+            return [fn(item) for item in items]
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(self.nworkers)
+        # One task per worker, since each (de)compression is only a few µs
+        chunks = np.array_split(np.arange(len(items)), self.nworkers)
+        results = self._pool.map(lambda c: [fn(items[i]) for i in c], chunks)
+        return [res for chunk in results for res in chunk]
+
+    def _compress(self, state: Array) -> bytes:
+        return zlib.compress(state.tobytes(), self.level)
+
+    def _decompress(self, blob: bytes) -> Array:
+        if len(blob) == 0:
+            # Slots which have never been written are only read as masked steps
+            return np.zeros(self._state_shape, dtype=self._state_dtype)
+        arr = np.frombuffer(zlib.decompress(blob), dtype=self._state_dtype)
+        return arr.reshape(self._state_shape)
+
+    def _write(self, arr: Array, index: Any, value: Any) -> None:
+        if arr is not self._states:
+            return super()._write(arr, index, value)
+        indices = np.atleast_1d(index)
+        states = np.asarray(value).astype(self._state_dtype, copy=False)
+        states = states.reshape(-1, *self._state_shape)
+        for slot, blob in zip(indices, self._map(self._compress, states)):
+            old = arr[slot]
+            self._nstored += len(old) == 0
+            self._compressed_bytes += len(blob) - len(old)
+            arr[slot] = blob
+
+    def _read(self, arr: Array, index: Any) -> Array:
+        if arr is not self._states:
+            return super()._read(arr, index)
+        start = time.perf_counter()
+        slots, inverse = np.unique(index, return_inverse=True)
+        states = np.stack(self._map(self._decompress, arr[slots]))
+        res = states[inverse.reshape(np.shape(index))]
+        self._decode_time += time.perf_counter() - start
+        self._ndecodes += 1
+        return res
+
+    def stats(self) -> Dict[str, float]:
+        """Returns the compression ratio and the mean time in seconds to decode
+        states of a batch since the last call
+        """
+        raw_bytes = self._nstored * self._state_dtype.itemsize
+        raw_bytes *= int(np.prod(self._state_shape))
+        res = super().stats()
+        res.update(
+            compression_ratio=raw_bytes / max(self._compressed_bytes, 1),
+            decode_latency=self._decode_time / max(self._ndecodes, 1),
+        )
+        self._ndecodes, self._decode_time = 0, 0.0
+        return res
+
+    def footprint(self) -> Dict[str, int]:
+        res = super().footprint()
+        blob_bytes = self._compressed_bytes + self._nstored * sys.getsizeof(b"")
+        res["allocated"] += blob_bytes
+        res["resident_estimate"] += blob_bytes
+        return res
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def save_chunks(self, directory: Path) -> dict:
+        raise NotImplementedError(f"{type(self).__name__} can't be saved as chunks")
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state["_pool"] = None
+        return state
+
+
+class CompressedFrameReplayBuffer(CompressedReplayBuffer, FrameReplayBuffer):
+    """FrameReplayBuffer that compresses each unique frame"""
+
+    pass
@@ -0,0 +1,60 @@
+"""Replay buffer for stacked frames, as used in dopamine
+"""
+from typing import Generic, Tuple, Type
+
+import numpy as np
+
+from ..prelude import Array
+from .array import ArrayReplayBuffer
+from .base import ReplayFeed
+
+
+class FrameReplayBuffer(ArrayReplayBuffer, Generic[ReplayFeed]):
+    """ArrayReplayBuffer for states that are stacks of the last `nstack` frames
+    (e.g., Atari with frame_stack=True), which stores each frame only once.
+    A frame is stored as `dtype` after multiplied by `scale`, to undo the scaling
+    by `TransposeObs`, and states are rebuilt from indices when sampling.
+    When a new episode starts, all frames of its first state are stored,
+    so zero-padded or repeated initial frames are reproduced exactly.
+    """
+
+    def __init__(
+        self,
+        feed: Type[ReplayFeed],
+        capacity: int = 1000,
+        nstack: int = 4,
+        scale: float = 255.0,
+        dtype: type = np.uint8,
+        **kwargs,
+    ) -> None:
+        self._history = nstack - 1
+        super().__init__(feed, capacity, **kwargs)
+        self.nstack = nstack
+        self.scale = scale
+        self.dtype = dtype
+        self._offsets = np.arange(-self._history, 1)
+
+    def _state_spec(self, state: Array) -> Tuple[tuple, np.dtype]:
+        if state.shape[0] != self.nstack:
+            raise ValueError(
+                f"FrameReplayBuffer expects {self.nstack} stacked frames,"
+                f" but the state has shape {state.shape}"
+            )
+        return state.shape[1:], self.dtype
+
+    def _scale(self, frames: Array) -> Array:
+        frames = frames * self.scale
+        return np.rint(frames) if np.issubdtype(self.dtype, np.integer) else frames
+
+    def _write_state(self, state: Array, new_episode: bool) -> None:
+        frames = state if new_episode else state[-1:]
+        for frame in frames:
+            self._write(self._states, self._advance(), self._scale(frame))
+
+    def _write_next_states(self, slots: Array[int], states: Array) -> None:
+        self._write(self._states, slots, self._scale(states[:, -1]))
+
+    def _read_states(self, slots: Array[int]) -> Array:
+        indices = (slots[..., np.newaxis] + self._offsets) % self._nslots
+        states = self._read(self._states, indices)
+        return np.multiply(states, 1.0 / self.scale, dtype=np.float32)
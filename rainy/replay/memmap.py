@@ -0,0 +1,151 @@
+"""Replay buffer stored in memory-mapped files, for capacities beyond RAM
+"""
+import json
+import tempfile
+from pathlib import Path
+from typing import Callable, Generic, Optional, Type, Union
+
+import numpy as np
+
+from ..prelude import Array
+from .array import ArrayReplayBuffer
+from .base import ReplayBatch, ReplayFeed
+
+PathLike = Union[str, Path]
+
+
+class MemmapReplayBuffer(ArrayReplayBuffer, Generic[ReplayFeed]):
+    """ArrayReplayBuffer that keeps each field array in a `.npy` file opened by
+    `np.memmap`, so that the OS page cache decides which parts are resident.
+    Since logger.logdir is decided when training starts, `directory` can be a
+    function that returns it (e.g., `lambda: config.logger.logdir`), and files are
+    created in `directory/name` when the first transition is appended.
+    If `directory` is None, files are created in a new temporary directory, so
+    that concurrent runs don't overwrite each other's files, and `close` removes it.
+    Config.replay_buffer sets `directory` to logger.logdir if it is None.
+    `state_dict` flushes the files and returns only their location and cursors,
+    so `Agent.load` reattaches to the files instead of unpickling transitions.
+    """
+
+    METADATA = "metadata.json"
+
+    def __init__(
+        self,
+        feed: Type[ReplayFeed],
+        capacity: int = 1000,
+        directory: Union[None, PathLike, Callable[[], PathLike]] = None,
+        name: str = "replay",
+        **kwargs,
+    ) -> None:
+        super().__init__(feed, capacity, **kwargs)
+        self._directory = directory
+        self.name = name
+        self.path = None
+        self._tempdir: Optional[tempfile.TemporaryDirectory] = None
+
+    def set_directory(
+        self, directory: Union[PathLike, Callable[[], PathLike]]
+    ) -> None:
+        """Sets the directory of files if it isn't given and files aren't created"""
+        if self._directory is None and self.path is None:
+            self._directory = directory
+
+    def _resolve_path(self) -> Path:
+        directory = self._directory
+        if directory is None:
+            self._tempdir = tempfile.TemporaryDirectory(prefix="rainy-replay-")
+            directory = self._tempdir.name
+        elif callable(directory):
+            directory = directory()
+        path = Path(directory).joinpath(self.name)
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def _allocate(self, name: str, shape: tuple, dtype: np.dtype) -> Array:
+        if self.path is None:
+            self.path = self._resolve_path()
+        return np.lib.format.open_memmap(
+            self.path.joinpath(name + ".npy"),
+            mode="w+",
+            dtype=dtype,
+            shape=(self._nslots, *shape),
+        )
+
+    def sample(self, batch_size: int) -> ReplayBatch:
+        # Gathering sorted slots reads pages in order
+        return self._gather(np.sort(self._sample_slots(batch_size)))
+
+    def _sample_many(self, n: int, batch_size: int) -> Array[int]:
+        # Sort each batch on its own, so that every batch still covers all slots
+        slots = super()._sample_many(n, batch_size).reshape(n, batch_size)
+        return np.sort(slots, axis=1).ravel()
+
+    def flush(self) -> None:
+        if self._states is None:
+            return
+        self._states.flush()
+        for column in self._columns.values():
+            column.flush()
+        np.save(self.path.joinpath("valid.npy"), self._valid)
+        metadata = dict(
+            cursor=self._cursor,
+            filled=self._filled,
+            len=self._len,
+            casts={name: dtype.str for name, dtype in self._casts.items()},
+            block_size=self._block_size,
+            next_block=self._next_block,
+        )
+        with self.path.joinpath(self.METADATA).open("w") as f:
+            json.dump(metadata, f)
+
+    def close(self) -> None:
+        """Removes files if they are in a temporary directory"""
+        if self._tempdir is None:
+            return
+        self._states, self._columns = None, {}
+        self._tempdir.cleanup()
+        self._tempdir = None
+        self.path = None
+
+    def state_dict(self) -> dict:
+        self.flush()
+        path = None if self.path is None else self.path.as_posix()
+        return dict(path=path, columns=list(self._columns.keys()))
+
+    def save_chunks(self, directory: Path) -> dict:
+        # Files are already on disk
+        return self.state_dict()
+
+    def load_chunks(self, saved: dict) -> None:
+        self.load_state_dict(saved)
+
+    def load_state_dict(self, state_dict: dict) -> None:
+        if state_dict["path"] is None:
+            return
+        path = Path(state_dict["path"])
+        if not path.joinpath(self.METADATA).exists():
+            raise ValueError(f"{path} doesn't have replay files")
+
+        def open_(name: str) -> Array:
+            arr = np.load(path.joinpath(name + ".npy"), mmap_mode="r+")
+            if len(arr) != self._nslots:
+                raise ValueError(
+                    f"{name}.npy has {len(arr)} slots, but {self._nslots} expected"
+                )
+            return arr
+
+        self.path = path
+        self._states = open_("state")
+        self._columns = {name: open_(name) for name in state_dict["columns"]}
+        self._valid = np.load(path.joinpath("valid.npy"))
+        with path.joinpath(self.METADATA).open() as f:
+            metadata = json.load(f)
+        self._cursor = metadata["cursor"]
+        self._filled = metadata["filled"]
+        self._len = metadata["len"]
+        casts = metadata.get("casts", {})
+        self._casts = {name: np.dtype(d) for name, d in casts.items()}
+        self._load_blocks(metadata)
+        # The files are the saved state, so no chunk is modified since saving
+        self._dirty[:] = False
+        self._continuing = False
@@ -0,0 +1,194 @@
+"""Replay buffer wrapper which samples batches in a background thread
+"""
+import queue
+import threading
+import time
+import weakref
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+
+from ..prelude import Array, State
+from .base import ReplayBatch, ReplayBuffer
+from .prioritized import PrioritizedReplayBuffer
+
+
+class PrefetchReplayBuffer(ReplayBuffer):
+    """Wraps a replay buffer and samples the next `nbatches` batches in a worker
+    thread, while the main thread runs gradient steps.
+    The worker gathers `nbatches` batches at once by `sample_batches` of the buffer,
+    and `sample_batches` takes `n` of them, so `nbatches` should be at least the
+    number of updates per step (e.g., `replay_ratio`) to sample them at once.
+    Fields of prefetched batches except indices are tensors, pinned if
+    `pin_memory`, and states are converted to float32.
+    If `sample_batch` is called with another batch size or extract function, the
+    worker is restarted and prefetched batches are discarded.
+    Appends, samplings and priority updates are serialized by a lock, so a batch
+    never mixes old and new transitions.
+    Prefetched batches can be up to `2 * nbatches` updates older than the buffer.
+    For prioritized buffers, priorities of transitions overwritten after being
+    prefetched are not updated, if `update_priorities` is called with the indices
+    of a returned batch.
+    """
+
+    def __init__(
+        self, replay: ReplayBuffer, nbatches: int = 2, pin_memory: bool = False
+    ) -> None:
+        super().__init__(replay.feed, allow_overlap=replay.allow_overlap)
+        self.replay = replay
+        self.nbatches = nbatches
+        self.pin_memory = pin_memory
+        self._lock = threading.Lock()
+        self._queue: queue.Queue = queue.Queue(maxsize=nbatches)
+        self._stop = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self._args: Optional[Tuple[int, Callable[[State], Array]]] = None
+        # Stamps of returned batches, keyed by id of their indices and removed
+        # when the indices are garbage-collected
+        self._stamps: Dict[int, Array[int]] = {}
+        self._ngets = 0
+        self._nstarved = 0
+        self._wait_time = 0.0
+
+    def append(self, *args) -> None:
+        with self._lock:
+            self.replay.append(*args)
+
+    def end_episode(self) -> None:
+        with self._lock:
+            self.replay.end_episode()
+
+    def append_batch(self, *args, envids: Optional[Array[int]] = None) -> None:
+        with self._lock:
+            self.replay.append_batch(*args, envids=envids)
+
+    def sample(self, batch_size: int) -> Any:
+        with self._lock:
+            return self.replay.sample(batch_size)
+
+    def _to_tensor(self, arr: Optional[Array], dtype: Any = None) -> torch.Tensor:
+        if arr is None:
+            return None
+        tensor = torch.from_numpy(np.ascontiguousarray(arr, dtype=dtype))
+        return tensor.pin_memory() if self.pin_memory else tensor
+
+    def _to_tensors(self, batch: ReplayBatch) -> ReplayBatch:
+        return batch._replace(
+            states=self._to_tensor(batch.states, np.float32),
+            actions=self._to_tensor(batch.actions),
+            next_states=self._to_tensor(batch.next_states, np.float32),
+            rewards=self._to_tensor(batch.rewards),
+            terminals=self._to_tensor(batch.terminals),
+            masks=self._to_tensor(batch.masks),
+            discounts=self._to_tensor(batch.discounts),
+            weights=self._to_tensor(batch.weights),
+        )
+
+    def _prefetch(self, batch_size: int, extract: Callable[[State], Array]) -> None:
+        prioritized = isinstance(self.replay, PrioritizedReplayBuffer)
+        while not self._stop.is_set():
+            try:
+                with self._lock:
+                    batches = self.replay.sample_batches(
+                        self.nbatches, batch_size, extract
+                    )
+                    stamps = [
+                        self.replay.stamps(batch.indices) if prioritized else None
+                        for batch in batches
+                    ]
+                items: List[Any] = [
+                    (self._to_tensors(batch), s) for batch, s in zip(batches, stamps)
+                ]
+            except Exception as e:
+                items = [e]
+            for item in items:
+                while not self._stop.is_set():
+                    try:
+                        self._queue.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+            if isinstance(items[-1], Exception):
+                return
+
+    def sample_batch(
+        self, batch_size: int, extract: Callable[[State], Array]
+    ) -> ReplayBatch:
+        if self._worker is not None and self._args != (batch_size, extract):
+            self._stop_worker()
+        if self._worker is None:
+            self._args = batch_size, extract
+            self._stop.clear()
+            self._worker = threading.Thread(
+                target=self._prefetch, args=(batch_size, extract), daemon=True
+            )
+            self._worker.start()
+        self._ngets += 1
+        if self._queue.empty():
+            self._nstarved += 1
+        start = time.perf_counter()
+        item = self._queue.get()
+        self._wait_time += time.perf_counter() - start
+        if isinstance(item, Exception):
+            self._worker = None
+            raise item
+        batch, stamps = item
+        if stamps is not None:
+            key = id(batch.indices)
+            self._stamps[key] = stamps
+            weakref.finalize(batch.indices, self._stamps.pop, key, None)
+        return batch
+
+    def sample_batches(
+        self, n: int, batch_size: int, extract: Callable[[State], Array]
+    ) -> List[ReplayBatch]:
+        """Takes `n` prefetched batches, which the worker gathers `nbatches` at once"""
+        return [self.sample_batch(batch_size, extract) for _ in range(n)]
+
+    def update_priorities(self, indices: Array[int], td_errors: Array[float]) -> None:
+        stamps = self._stamps.get(id(indices), None)
+        with self._lock:
+            if stamps is not None:
+                self.replay.update_priorities(indices, td_errors, stamps=stamps)
+            else:
+                self.replay.update_priorities(indices, td_errors)
+
+    def stats(self) -> Dict[str, float]:
+        """Returns the ratio of samplings that waited for the worker and the mean
+        waiting time in seconds since the last call, with stats of the buffer
+        """
+        ngets = max(self._ngets, 1)
+        res = self.replay.stats()
+        res.update(
+            prefetch_starved=self._nstarved / ngets,
+            prefetch_wait=self._wait_time / ngets,
+        )
+        self._ngets, self._nstarved, self._wait_time = 0, 0, 0.0
+        return res
+
+    def _stop_worker(self) -> None:
+        self._stop.set()
+        if self._worker is not None:
+            self._worker.join()
+            self._worker = None
+        while not self._queue.empty():
+            self._queue.get_nowait()
+
+    def close(self) -> None:
+        """Stops the worker and discards prefetched batches"""
+        self._stop_worker()
+        self.replay.close()
+
+    def save_chunks(self, directory: Path) -> dict:
+        with self._lock:
+            return self.replay.save_chunks(directory)
+
+    def load_chunks(self, saved: dict) -> None:
+        # Not close, which frees files and workers of the replay buffer
+        self._stop_worker()
+        self.replay.load_chunks(saved)
+
+    def __len__(self) -> int:
+        return len(self.replay)
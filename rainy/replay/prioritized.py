@@ -0,0 +1,197 @@
+"""Prioritized experience replay, which is described in
+- Prioritized Experience Replay
+  - https://arxiv.org/abs/1511.05952
+"""
+from typing import Any, Callable, Generic, List, Optional, Type, Union
+
+import numpy as np
+
+from ..prelude import Array, State
+from .array import ArrayReplayBuffer
+from .base import ReplayBatch, ReplayFeed
+from .frame import FrameReplayBuffer
+
+
+class SumTree:
+    """Array-based binary tree where each node has the sum of its children.
+    All operations take a batch of leaves and run in O(log n) per leaf, by
+    walking all of them through the same level at once.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self._offset = 1 << max(capacity - 1, 1).bit_length()
+        self._depth = self._offset.bit_length() - 1
+        self._tree = np.zeros(2 * self._offset, dtype=np.float64)
+
+    def total(self) -> float:
+        return self._tree[1]
+
+    def __getitem__(self, indices: Array[int]) -> Array[float]:
+        return self._tree[np.asarray(indices) + self._offset]
+
+    def update(self, indices: Array[int], values: Array[float]) -> None:
+        nodes = np.asarray(indices) + self._offset
+        self._tree[nodes] = values
+        for _ in range(self._depth):
+            # Duplicated nodes are fine, since parents are recomputed from children
+            nodes //= 2
+            self._tree[nodes] = self._tree[2 * nodes] + self._tree[2 * nodes + 1]
+
+    def update_one(self, index: int, value: float) -> None:
+        node = index + self._offset
+        self._tree[node] = value
+        while node > 1:
+            node //= 2
+            self._tree[node] = self._tree[2 * node] + self._tree[2 * node + 1]
+
+    def find(self, values: Array[float]) -> Array[int]:
+        """Returns the leftmost leaves where the prefix sums exceed values"""
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        for _ in range(self._depth):
+            nodes *= 2
+            left = self._tree[nodes]
+            go_right = values >= left
+            values -= left * go_right
+            nodes += go_right
+        return nodes - self._offset
+
+
+class PrioritizedReplayBuffer(ArrayReplayBuffer, Generic[ReplayFeed]):
+    """ArrayReplayBuffer that samples transitions in proportion to their priorities.
+    New transitions have the maximum priority so far, and priorities are updated
+    by `update_priorities` with the TD errors of the sampled batch.
+    The importance sampling exponent is annealed from `beta` to 1 over
+    `beta_steps` samplings, and weights are normalized by the maximum in the batch.
+    """
+
+    def __init__(
+        self,
+        feed: Type[ReplayFeed],
+        capacity: int = 1000,
+        alpha: float = 0.6,
+        beta: float = 0.4,
+        beta_steps: Optional[int] = None,
+        eps: float = 1e-6,
+        **kwargs,
+    ) -> None:
+        super().__init__(feed, capacity, **kwargs)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_steps = beta_steps
+        self.eps = eps
+        self._tree = SumTree(self._nslots)
+        self._max_priority = 1.0
+        self._nsampled = 0
+        # Stamps[i] is the number of transitions appended before the one in slot i
+        self._stamps = np.zeros(self._nslots, dtype=np.int64)
+        self._nappended = 0
+
+    def _validate(self, slots: Union[int, Array[int]]) -> None:
+        super()._validate(slots)
+        if np.ndim(slots) == 0:
+            self._tree.update_one(slots, self._max_priority)
+            self._stamps[slots] = self._nappended
+        else:
+            self._tree.update(slots, self._max_priority)
+            self._stamps[slots] = self._nappended + np.arange(len(slots))
+        self._nappended += int(np.size(slots))
+
+    def _invalidate(self, slots: Union[int, Array[int]]) -> None:
+        if np.ndim(slots) == 0:
+            if self._valid[slots]:
+                super()._invalidate(slots)
+                self._tree.update_one(slots, 0.0)
+        else:
+            slots = slots[self._valid[slots]]
+            super()._invalidate(slots)
+            self._tree.update(slots, 0.0)
+
+    # Valid flag, stamp and up to 4 nodes of the sum tree per slot
+    _overhead_per_slot = 1 + 8 + 32
+
+    def _footprint_arrays(self) -> List[Any]:
+        return [*super()._footprint_arrays(), self._tree._tree, self._stamps]
+
+    def _current_beta(self) -> float:
+        if self.beta_steps is None:
+            return self.beta
+        progress = min(1.0, self._nsampled / self.beta_steps)
+        return self.beta + (1.0 - self.beta) * progress
+
+    def _sample_slots(self, batch_size: int, n: int = 1) -> Array[int]:
+        if self._len == 0:
+            raise ValueError("[PrioritizedReplayBuffer::sample] Empty")
+        total = self._tree.total()
+        # Stratified sampling, where each of `n` batches spans the whole priorities
+        values = (np.arange(batch_size) + np.random.rand(n, batch_size)) / batch_size
+        values = values.reshape(-1)
+        slots = self._tree.find(np.minimum(values * total, np.nextafter(total, 0)))
+        # Rounding errors can lead to zero-priority leaves, which are very rare
+        invalid = self._invalid_leaves(slots)
+        while invalid.any():
+            values = np.random.rand(invalid.sum()) * total
+            slots[invalid] = self._tree.find(values)
+            invalid = self._invalid_leaves(slots)
+        return slots
+
+    def _invalid_leaves(self, slots: Array[int]) -> Array[bool]:
+        # Padding leaves of the tree are beyond the last slot
+        invalid = slots >= self._nslots
+        invalid[~invalid] = ~self._valid[slots[~invalid]]
+        return invalid
+
+    def _sample_many(self, n: int, batch_size: int) -> Array[int]:
+        return self._sample_slots(batch_size, n)
+
+    def sample(self, batch_size: int) -> ReplayBatch:
+        return self.sample_batches(1, batch_size)[0]
+
+    def sample_batches(
+        self,
+        n: int,
+        batch_size: int,
+        extract: Optional[Callable[[State], Array]] = None,
+    ) -> List[ReplayBatch]:
+        slots = self._sample_many(n, batch_size)
+        probs = self._tree[slots] / self._tree.total()
+        weights = (self._len * probs) ** -self._current_beta()
+        weights = weights.reshape(n, batch_size)
+        weights /= weights.max(axis=1, keepdims=True)
+        self._nsampled += n
+        batches = self._gather(slots).split(n)
+        return [
+            batch._replace(indices=s, weights=w.astype(np.float32))
+            for batch, s, w in zip(batches, np.split(slots, n), weights)
+        ]
+
+    def load_chunks(self, saved: dict) -> None:
+        # Priorities are not saved, so all transitions have the maximum priority
+        super().load_chunks(saved)
+        self._tree.update(np.flatnonzero(self._valid), self._max_priority)
+
+    def stamps(self, indices: Array[int]) -> Array[int]:
+        """Identifies transitions in slots, to detect overwrites after sampling"""
+        return self._stamps[indices].copy()
+
+    def update_priorities(
+        self,
+        indices: Array[int],
+        td_errors: Array[float],
+        stamps: Optional[Array[int]] = None,
+    ) -> None:
+        indices = np.asarray(indices)
+        priorities = (np.abs(td_errors) + self.eps) ** self.alpha
+        # Transitions overwritten after sampling must keep zero priorities
+        valid = self._valid[indices]
+        if stamps is not None:
+            valid &= self._stamps[indices] == stamps
+        self._tree.update(indices[valid], priorities[valid])
+        self._max_priority = max(self._max_priority, priorities.max())
+
+
+class PrioritizedFrameReplayBuffer(PrioritizedReplayBuffer, FrameReplayBuffer):
+    """PrioritizedReplayBuffer for frame-stacked states (e.g., Atari)"""
+
+    pass
@@ -0,0 +1,210 @@
+"""Replay buffer of fixed-length sequences for recurrent value functions, as in
+- Recurrent Experience Replay in Distributed Reinforcement Learning
+  - https://openreview.net/forum?id=r1lyTjAqYX
+"""
+
+import dataclasses
+from typing import Any, Dict, Generic, List, NamedTuple, Optional, Type, Union
+
+import numpy as np
+import torch
+from torch import Tensor
+
+from ..net import RnnState, recurrent
+from ..prelude import Array
+from ..utils import Device
+from .array import ArrayReplayBuffer
+from .base import ReplayFeed
+from .frame import FrameReplayBuffer
+
+
+class SequenceBatch(NamedTuple):
+    """Sampled sequences as (T, B, ...) tensors, which start with `burn_in` steps.
+    `states` has one more step than the others, for the next state of the last step.
+    `masks[t]` is False if step t is after the end of the episode or the data.
+    """
+
+    states: Tensor
+    actions: Tensor
+    rewards: Tensor
+    terminals: Tensor
+    masks: Tensor
+    # RNN states at the start of the sequences (None if not given when appending)
+    rnn_states: Optional[RnnState]
+    burn_in: int
+
+
+class SequenceReplayBuffer(ArrayReplayBuffer, Generic[ReplayFeed]):
+    """ArrayReplayBuffer that samples sequences of `burn_in + seq_len` steps.
+    Sequences start every `period` steps in each episode, so they overlap when
+    `period < burn_in + seq_len`, and the RNN state given by `append` at each
+    start step is stored with the sequence.
+    Sequences of parallel environments appended by `append_batch` end at the ends
+    of blocks of slots.
+    """
+
+    def __init__(
+        self,
+        feed: Type[ReplayFeed],
+        capacity: int = 1000,
+        seq_len: int = 40,
+        burn_in: int = 0,
+        period: Optional[int] = None,
+        device: Optional[Device] = None,
+        **kwargs,
+    ) -> None:
+        super().__init__(feed, capacity, **kwargs)
+        if self.nstep > 1:
+            raise ValueError("SequenceReplayBuffer doesn't support n-step returns")
+        self.seq_len = seq_len
+        self.burn_in = burn_in
+        self.period = period or max(1, (burn_in + seq_len) // 2)
+        self.device = Device() if device is None else device
+        self._is_start = np.zeros(self._nslots, dtype=np.bool_)
+        self._rnn: Dict[str, Array] = {}
+        self._rnn_cls: Optional[Type[RnnState]] = None
+        self._episode_step = 0
+
+    _overhead_per_slot = 2
+
+    def _footprint_arrays(self) -> List[Any]:
+        arrays = super()._footprint_arrays()
+        return [*arrays, self._is_start, *self._rnn.values()]
+
+    def _invalidate(self, slots: Union[int, Array[int]]) -> None:
+        super()._invalidate(slots)
+        self._is_start[slots] = False
+
+    def _write_rnn_states(self, slots: Array[int], rnn_states: RnnState) -> None:
+        if self._rnn_cls is None:
+            self._rnn_cls = type(rnn_states)
+            for field in dataclasses.fields(rnn_states):
+                value = getattr(rnn_states, field.name).cpu().numpy()
+                self._rnn[field.name] = self._allocate(
+                    "rnn_" + field.name, value.shape[1:], value.dtype
+                )
+        for name, arr in self._rnn.items():
+            self._write(arr, slots, getattr(rnn_states, name).cpu().numpy())
+
+    def append(
+        self,
+        state: Any,
+        action: Any,
+        next_state: Any,
+        reward: float,
+        done: bool,
+        rnn_state: Optional[RnnState] = None,
+    ) -> None:
+        """`rnn_state` is the input RNN state at `state`, without batch dimension"""
+        super().append(state, action, next_state, reward, done)
+        if self._episode_started:
+            self._episode_step = 0
+        slot = (self._cursor - 1) % self._nslots
+        if self._episode_step % self.period == 0:
+            self._is_start[slot] = True
+            if rnn_state is not None:
+                self._write_rnn_states(np.array([slot]), rnn_state.unsqueeze())
+        self._episode_step += 1
+
+    def append_batch(
+        self,
+        states: Any,
+        actions: Any,
+        next_states: Any,
+        rewards: Array[float],
+        dones: Array[bool],
+        rnn_states: Optional[RnnState] = None,
+        envids: Optional[Array[int]] = None,
+    ) -> None:
+        """`rnn_states` are the input RNN states at `states`, with batch dimension"""
+        args = states, actions, next_states, rewards, dones
+        slots, new_episode = self._append_lanes(args, envids)
+        envids = np.arange(len(slots)) if envids is None else np.asarray(envids)
+        n = len(self._lane_cursor)
+        if len(self._lane_steps) < n:
+            grown = np.zeros(n - len(self._lane_steps), dtype=np.int64)
+            self._lane_steps = np.concatenate((self._lane_steps, grown))
+        self._lane_steps[envids[new_episode]] = 0
+        starts = np.flatnonzero(self._lane_steps[envids] % self.period == 0)
+        self._is_start[slots[starts]] = True
+        if rnn_states is not None and len(starts) > 0:
+            self._write_rnn_states(slots[starts], rnn_states[torch.from_numpy(starts)])
+        self._lane_steps[envids] += 1
+
+    def _reset_lanes(self) -> None:
+        super()._reset_lanes()
+        # Episode steps of parallel environments
+        self._lane_steps = np.zeros(0, dtype=np.int64)
+
+    def _sample_starts(self, batch_size: int) -> Array[int]:
+        can_start = self._valid & self._is_start
+        if not can_start.any():
+            raise ValueError("[SequenceReplayBuffer::sample] No sequence")
+        starts = np.random.randint(self._filled, size=batch_size)
+        invalid = ~can_start[starts]
+        while invalid.any():
+            starts[invalid] = np.random.randint(self._filled, size=invalid.sum())
+            invalid = ~can_start[starts]
+        return starts
+
+    def sample(self, batch_size: int) -> SequenceBatch:
+        starts = self._sample_starts(batch_size)
+        length = self.burn_in + self.seq_len
+        # (length + 1, batch_size) slots, so that gathered arrays are time-major
+        window = (starts + np.arange(length + 1)[:, np.newaxis]) % self._nslots
+        dones = self._columns["done"][window[:-1]]
+        # Step t is used iff all steps before t are not terminal and step t exists
+        masks = self._valid[window[:-1]]
+        masks[1:] &= ~dones[:-1]
+        masks = np.logical_and.accumulate(masks, axis=0)
+        if self._rnn_cls is None:
+            rnn_states = None
+        else:
+            tensors = {n: self._tensor(a[starts]) for n, a in self._rnn.items()}
+            rnn_states = self._rnn_cls(**tensors)
+        return SequenceBatch(
+            self._tensor(self._read_states(window)),
+            self._tensor(self._cast("action", self._columns["action"][window[:-1]])),
+            self._tensor(self._cast("reward", self._columns["reward"][window[:-1]])),
+            self._tensor(dones & masks),
+            self._tensor(masks),
+            rnn_states,
+            self.burn_in,
+        )
+
+    def _tensor(self, arr: Array) -> Tensor:
+        tensor = torch.from_numpy(np.ascontiguousarray(arr))
+        return tensor.to(self.device.unwrapped)
+
+    def sample_batch(self, batch_size: int, extract: Any = None) -> SequenceBatch:
+        return self.sample(batch_size)
+
+    def sample_batches(
+        self, n: int, batch_size: int, extract: Any = None
+    ) -> List[SequenceBatch]:
+        return [self.sample(batch_size) for _ in range(n)]
+
+    def _slot_arrays(self) -> Dict[str, Array]:
+        arrays = dict(is_start=self._is_start)
+        arrays.update({"rnn_" + name: arr for name, arr in self._rnn.items()})
+        return arrays
+
+    def _chunk_metadata(self) -> Dict[str, Any]:
+        if self._rnn_cls is None:
+            return {}
+        rnn = {n: (arr.shape[1:], arr.dtype.str) for n, arr in self._rnn.items()}
+        return dict(rnn_cls=self._rnn_cls.__name__, rnn=rnn)
+
+    def _load_chunk_metadata(self, meta: Dict[str, Any]) -> None:
+        if "rnn_cls" not in meta or self._rnn_cls is not None:
+            return
+        self._rnn_cls = getattr(recurrent, meta["rnn_cls"])
+        for name, (shape, dtype) in meta["rnn"].items():
+            arr = self._allocate("rnn_" + name, tuple(shape), np.dtype(dtype))
+            self._rnn[name] = arr
+
+
+class SequenceFrameReplayBuffer(SequenceReplayBuffer, FrameReplayBuffer):
+    """SequenceReplayBuffer for frames (e.g., Atari with flicker_frame=True)"""
+
+    pass
@@ -0,0 +1,277 @@
+"""Replay buffer in shared memory, written by multiple actor processes
+"""
+import dataclasses
+import multiprocessing as mp
+import os
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Any, Callable, Dict, Generic, List, Optional, Tuple, Type
+
+import numpy as np
+
+from ..prelude import Array, State
+from ..utils import sample_indices
+from .array import ArrayReplayBuffer
+from .base import ReplayBatch, ReplayBuffer, ReplayFeed
+
+Spec = Tuple[tuple, Any]
+
+
+def _counter(index: int) -> property:
+    def get(self: "_Segment") -> int:
+        return 0 if self._counters is None else int(self._counters[index])
+
+    def set_(self: "_Segment", value: int) -> None:
+        if self._counters is not None:
+            self._counters[index] = value
+
+    return property(get, set_)
+
+
+class _Segment(ArrayReplayBuffer):
+    """ArrayReplayBuffer over views of shared arrays, written by one actor"""
+
+    _cursor = _counter(0)
+    _filled = _counter(1)
+    _len = _counter(2)
+
+    def __init__(
+        self,
+        feed: Type[ReplayFeed],
+        capacity: int,
+        arrays: Dict[str, Array],
+        valid: Array[bool],
+        counters: Array[int],
+        allow_overlap: bool,
+        extract: Callable[[State], Array],
+    ) -> None:
+        self._counters = None
+        super().__init__(feed, capacity, allow_overlap=allow_overlap, extract=extract)
+        # Not to reset counters of a running actor in other processes
+        self._counters = counters
+        self._valid = valid
+        self._columns = dict(arrays)
+        self._states = self._columns.pop("state")
+
+
+class SharedMemoryReplayBuffer(ReplayBuffer, Generic[ReplayFeed]):
+    """Replay buffer whose arrays are in `multiprocessing.shared_memory`, so that
+    `nactors` actor processes append transitions concurrently and a learner samples
+    batches from all of them without sending transitions through pipes.
+    Each actor owns a segment of `capacity / nactors` slots with its own cursor,
+    and a segment is locked only while its actor appends or a learner samples.
+    Since arrays are allocated before actors start, shapes and dtypes of fields
+    are given by `state_shape`, `action_shape` and `specs` for other fields
+    (`reward` and `done` are float32 and bool by default).
+    Pass the buffer to actor processes when starting them, and call
+    `for_actor(i)` to get a buffer that appends to the segment of actor i.
+    """
+
+    def __init__(
+        self,
+        feed: Type[ReplayFeed],
+        capacity: int = 1000,
+        nactors: int = 1,
+        state_shape: tuple = (),
+        state_dtype: Any = np.float32,
+        action_shape: tuple = (),
+        action_dtype: Any = np.int64,
+        specs: Optional[Dict[str, Spec]] = None,
+        allow_overlap: bool = False,
+        extract: Callable[[State], Array] = np.asarray,
+    ) -> None:
+        super().__init__(feed, allow_overlap=allow_overlap)
+        self.cap = capacity
+        self.nactors = nactors
+        self.extract = extract
+        self.actor_id = 0
+        self._field_names = [f.name for f in dataclasses.fields(feed)]
+        self._specs = dict(
+            state=(state_shape, state_dtype),
+            action=(action_shape, action_dtype),
+            reward=((), np.float32),
+            done=((), np.bool_),
+        )
+        self._specs.update(specs or {})
+        for name in self._field_names:
+            if name != "next_state" and name not in self._specs:
+                raise ValueError(f"SharedMemoryReplayBuffer needs a spec of {name}")
+        self._segment_cap = -(-capacity // nactors)
+        self._nslots = self._segment_cap + 1
+        self._shms: Dict[str, shared_memory.SharedMemory] = {}
+        shapes = self._shared_shapes()
+        for name, (shape, dtype) in shapes.items():
+            size = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+            self._shms[name] = shared_memory.SharedMemory(create=True, size=size)
+        self._shm_names = {name: shm.name for name, shm in self._shms.items()}
+        self._owner_pid = os.getpid()
+        self._original = True
+        self._attach(initialize=True)
+        # Semaphores of the spawn context can be passed to both spawned and forked
+        # processes
+        self._locks = [mp.get_context("spawn").Lock() for _ in range(nactors)]
+
+    def _shared_shapes(self) -> Dict[str, Spec]:
+        seg = self.nactors, self._nslots
+        shapes = {
+            name: ((*seg, *shape), dtype)
+            for name, (shape, dtype) in self._specs.items()
+            if name in self._field_names
+        }
+        shapes["valid"] = seg, np.bool_
+        shapes["counters"] = (self.nactors, 3), np.int64
+        return shapes
+
+    def _attach(self, initialize: bool = False) -> None:
+        self._arrays: Dict[str, Array] = {}
+        for name, (shape, dtype) in self._shared_shapes().items():
+            buf = self._shms[name].buf
+            self._arrays[name] = np.ndarray(shape, dtype=dtype, buffer=buf)
+        if initialize:
+            self._arrays["valid"][:] = False
+            self._arrays["counters"][:] = (-1, 0, 0)
+        fields = [n for n in self._field_names if n != "next_state"]
+        self._segments = [
+            _Segment(
+                self.feed,
+                self._segment_cap,
+                {name: self._arrays[name][i] for name in fields},
+                self._arrays["valid"][i],
+                self._arrays["counters"][i],
+                self.allow_overlap,
+                self.extract,
+            )
+            for i in range(self.nactors)
+        ]
+
+    def for_actor(self, actor_id: int) -> "SharedMemoryReplayBuffer":
+        """Returns a buffer sharing memory with this one, which appends transitions
+        to the segment of `actor_id`
+        """
+        if not 0 <= actor_id < self.nactors:
+            raise ValueError(f"actor_id must be in [0, {self.nactors})")
+        res = object.__new__(type(self))
+        res.__dict__.update(self.__dict__)
+        res._original = False
+        res.actor_id = actor_id
+        return res
+
+    def append(self, *args) -> None:
+        with self._locks[self.actor_id]:
+            self._segments[self.actor_id].append(*args)
+
+    def end_episode(self) -> None:
+        with self._locks[self.actor_id]:
+            self._segments[self.actor_id].end_episode()
+
+    def append_batch(self, *args, envids: Optional[Array[int]] = None) -> None:
+        with self._locks[self.actor_id]:
+            self._segments[self.actor_id].append_batch(*args, envids=envids)
+
+    def _sample_actors(self, n: int, batch_size: int) -> Array[int]:
+        """Returns the actor of each sample, in proportion to lengths of segments"""
+        lengths = self._arrays["counters"][:, 2].copy()
+        total = int(lengths.sum())
+        if self.allow_overlap:
+            if total == 0:
+                raise ValueError("[SharedMemoryReplayBuffer::sample] Empty")
+            indices = np.random.randint(total, size=(n, batch_size))
+        elif total < batch_size:
+            raise ValueError("[SharedMemoryReplayBuffer::sample] len < batch_size")
+        elif n * batch_size <= total:
+            indices = sample_indices(total, n * batch_size).reshape(n, batch_size)
+        else:
+            indices = np.stack([sample_indices(total, batch_size) for _ in range(n)])
+        return np.searchsorted(np.cumsum(lengths), indices, side="right")
+
+    def sample(self, batch_size: int) -> ReplayBatch:
+        return self.sample_batches(1, batch_size)[0]
+
+    def sample_batch(
+        self, batch_size: int, extract: Optional[Callable[[State], Array]] = None
+    ) -> ReplayBatch:
+        return self.sample(batch_size)
+
+    def sample_batches(
+        self,
+        n: int,
+        batch_size: int,
+        extract: Optional[Callable[[State], Array]] = None,
+    ) -> List[ReplayBatch]:
+        actors = self._sample_actors(n, batch_size)
+        # Batches share slots only if the buffer is too small
+        distinct = self.allow_overlap or n * batch_size <= len(self)
+        batch = {}
+        for name in self._field_names:
+            shape, dtype = self._specs["state" if name == "next_state" else name]
+            batch[name] = np.empty((n, batch_size, *shape), dtype=dtype)
+        for actor in np.unique(actors):
+            mask = actors == actor
+            segment = self._segments[actor]
+            # Only the segments read are locked, so that other actors keep appending
+            with self._locks[actor]:
+                if distinct:
+                    local = segment._sample_slots(int(mask.sum()))
+                else:
+                    counts = mask.sum(axis=1)
+                    local = np.concatenate(
+                        [segment._sample_slots(int(c)) for c in counts if c > 0]
+                    )
+                next_local = (local + 1) % self._nslots
+                for name in self._field_names:
+                    if name == "next_state":
+                        batch[name][mask] = self._arrays["state"][actor, next_local]
+                    else:
+                        batch[name][mask] = self._arrays[name][actor, local]
+        batch = {name: arr.reshape(-1, *arr.shape[2:]) for name, arr in batch.items()}
+        return ReplayBatch(*[batch[name] for name in self._field_names]).split(n)
+
+    def save_chunks(self, directory: Path) -> dict:
+        segments: List[dict] = []
+        for i, (segment, lock) in enumerate(zip(self._segments, self._locks)):
+            # Chunks modified by other processes are unknown, so all are saved
+            segment._chunk_dir = None
+            with lock:
+                segments.append(segment.save_chunks(directory.joinpath(f"actor-{i}")))
+        return dict(segments=segments)
+
+    def load_chunks(self, saved: dict) -> None:
+        if len(saved["segments"]) != self.nactors:
+            raise ValueError(f"Saved replay has {len(saved['segments'])} actors")
+        for segment, lock, seg_saved in zip(
+            self._segments, self._locks, saved["segments"]
+        ):
+            with lock:
+                segment.load_chunks(seg_saved)
+
+    def close(self) -> None:
+        """Closes shared memory, and frees it if called by the creator process.
+        In the creator process, only the original buffer closes shared memory.
+        In other processes, buffers returned by `for_actor` close it too.
+        """
+        owner = os.getpid() == self._owner_pid
+        if not self._shms or (owner and not self._original):
+            return
+        self._arrays.clear()
+        self._segments.clear()
+        for shm in self._shms.values():
+            shm.close()
+            if owner:
+                shm.unlink()
+        self._shms.clear()
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        del state["_shms"], state["_arrays"], state["_segments"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._shms = {
+            name: shared_memory.SharedMemory(name=shm_name)
+            for name, shm_name in self._shm_names.items()
+        }
+        self._attach()
+
+    def __len__(self) -> int:
+        return int(self._arrays["counters"][:, 2].sum())
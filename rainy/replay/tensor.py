@@ -0,0 +1,114 @@
+"""Replay buffer which keeps all transitions on the training device
+"""
+from typing import Any, Callable, Dict, Generic, Optional, Type, Union
+
+import numpy as np
+import torch
+from torch import Tensor
+
+from ..prelude import Array, State
+from ..utils import Device
+from .array import ArrayReplayBuffer
+from .base import ReplayBatch, ReplayFeed
+
+
+class TensorReplayBuffer(ArrayReplayBuffer, Generic[ReplayFeed]):
+    """ArrayReplayBuffer whose fields are preallocated tensors on `device`, for
+    low-dimensional states (e.g., PyBullet or MuJoCo).
+    Slots are sampled by `torch.randint` and gathered by `index_select`, so
+    sampled batches are tensors on the device and never copied from host.
+    Unlike ArrayReplayBuffer, transitions are sampled with replacement by default,
+    and `allow_overlap=False` samples them via `torch.multinomial` in O(capacity).
+    """
+
+    def __init__(
+        self,
+        feed: Type[ReplayFeed],
+        capacity: int = 1000,
+        device: Optional[Device] = None,
+        allow_overlap: bool = True,
+        extract: Callable[[State], Array] = np.asarray,
+        **kwargs,
+    ) -> None:
+        if kwargs.get("nstep", 1) > 1:
+            raise ValueError("TensorReplayBuffer doesn't support n-step returns")
+        super().__init__(feed, capacity, allow_overlap, extract, **kwargs)
+        self.device = Device() if device is None else device
+        self._valid_t = torch.zeros(
+            self._nslots, dtype=torch.bool, device=self.device.unwrapped
+        )
+
+    def _allocate(self, name: str, shape: tuple, dtype: np.dtype) -> Tensor:
+        dtype = torch.from_numpy(np.zeros(0, dtype=dtype)).dtype
+        return torch.zeros(
+            (self._nslots, *shape), dtype=dtype, device=self.device.unwrapped
+        )
+
+    def _write(self, arr: Tensor, index: Any, value: Any) -> None:
+        arr[index] = torch.as_tensor(value, dtype=arr.dtype, device=arr.device)
+
+    def _to_numpy(self, arr: Tensor) -> Array:
+        return arr.cpu().numpy()
+
+    def _cast(self, name: str, arr: Tensor) -> Tensor:
+        dtype = self._casts.get(name, None)
+        if dtype is None:
+            return arr
+        return arr.to(torch.from_numpy(np.zeros(0, dtype=dtype)).dtype)
+
+    def _nbytes(self, arr: Any) -> int:
+        if isinstance(arr, Tensor):
+            return arr.element_size() * arr.nelement()
+        return arr.nbytes
+
+    def _validate(self, slots: Union[int, Array[int]]) -> None:
+        super()._validate(slots)
+        self._valid_t[torch.as_tensor(slots)] = True
+
+    def _invalidate(self, slots: Union[int, Array[int]]) -> None:
+        super()._invalidate(slots)
+        self._valid_t[torch.as_tensor(slots)] = False
+
+    def _sample_slots(self, batch_size: int) -> Tensor:
+        device = self.device.unwrapped
+        if not self.allow_overlap:
+            if self._len < batch_size:
+                raise ValueError("[TensorReplayBuffer::sample] len < batch_size")
+            weights = self._valid_t[: self._filled].float()
+            return torch.multinomial(weights, batch_size)
+        if self._len == 0:
+            raise ValueError("[TensorReplayBuffer::sample] Empty")
+        slots = torch.randint(self._filled, (batch_size,), device=device)
+        invalid = ~self._valid_t.index_select(0, slots)
+        while invalid.any():
+            n = int(invalid.sum())
+            slots[invalid] = torch.randint(self._filled, (n,), device=device)
+            invalid = ~self._valid_t.index_select(0, slots)
+        return slots
+
+    def _sample_many(self, n: int, batch_size: int) -> Tensor:
+        if self.allow_overlap or n * batch_size <= self._len:
+            return self._sample_slots(n * batch_size)
+        return torch.cat([self._sample_slots(batch_size) for _ in range(n)])
+
+    def _read_states(self, slots: Tensor) -> Tensor:
+        return self._cast("state", self._states.index_select(0, slots))
+
+    def _gather(self, slots: Tensor) -> ReplayBatch:
+        batch = {
+            name: self._cast(name, column.index_select(0, slots))
+            for name, column in self._columns.items()
+        }
+        batch["state"] = self._read_states(slots)
+        batch["next_state"] = self._read_states((slots + 1) % self._nslots)
+        return ReplayBatch(*[batch[name] for name in self._field_names])
+
+    def footprint(self) -> Dict[str, int]:
+        # Tensors are filled with zeros on the device
+        res = super().footprint()
+        res["resident_estimate"] = res["allocated"]
+        return res
+
+    def load_chunks(self, saved: dict) -> None:
+        super().load_chunks(saved)
+        self._valid_t.copy_(torch.from_numpy(self._valid))
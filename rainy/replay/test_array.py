@@ -0,0 +1,260 @@
+import gym
+import numpy as np
+import pytest
+
+from ..envs import EnvSpec
+from .array import ArrayReplayBuffer
+from .frame import FrameReplayBuffer
+from .uniform import BootDQNReplayFeed, DQNReplayFeed
+
+
+def _fill(buf: ArrayReplayBuffer, n: int, episode_len: int = 5) -> None:
+    state = np.zeros(3, dtype=np.float32)
+    for i in range(n):
+        next_state = np.repeat(float(i + 1), 3).astype(np.float32)
+        done = (i + 1) % episode_len == 0
+        buf.append(state, i, next_state, float(i), done)
+        # Start a new object after the episode ends, like env.reset()
+        state = next_state.copy() if done else next_state
+
+
+@pytest.mark.parametrize("allow_overlap", [True, False])
+def test_array_sample(allow_overlap: bool) -> None:
+    buf = ArrayReplayBuffer(DQNReplayFeed, capacity=100, allow_overlap=allow_overlap)
+    _fill(buf, 40)
+    assert len(buf) == 40
+    batch = buf.sample(32)
+    assert batch.states.shape == (32, 3)
+    assert batch.states.dtype == np.float32
+    assert batch.actions.dtype == np.int64
+    if not allow_overlap:
+        assert np.unique(batch.actions).shape[0] == 32
+    np.testing.assert_array_equal(batch.states[:, 0], batch.actions)
+    np.testing.assert_array_equal(batch.next_states[:, 0], batch.actions + 1)
+    np.testing.assert_array_equal(batch.rewards, batch.actions)
+    np.testing.assert_array_equal(batch.terminals, (batch.actions + 1) % 5 == 0)
+
+
+def test_array_sample_all_shuffled() -> None:
+    buf = ArrayReplayBuffer(DQNReplayFeed, capacity=100)
+    _fill(buf, 40)
+    # Topped up since the first draw almost always hits invalid slots
+    actions = buf.sample(len(buf)).actions
+    np.testing.assert_array_equal(np.sort(actions), np.arange(40))
+    assert np.any(np.diff(actions) < 0)
+
+
+@pytest.mark.parametrize("n, allow_overlap", [(2, False), (8, False), (8, True)])
+def test_array_sample_batches(n: int, allow_overlap: bool) -> None:
+    buf = ArrayReplayBuffer(DQNReplayFeed, capacity=100, allow_overlap=allow_overlap)
+    _fill(buf, 40)
+    batches = buf.sample_batches(n, 16)
+    assert len(batches) == n
+    for batch in batches:
+        assert batch.states.shape == (16, 3)
+        if not allow_overlap:
+            assert np.unique(batch.actions).shape[0] == 16
+        np.testing.assert_array_equal(batch.states[:, 0], batch.actions)
+        np.testing.assert_array_equal(batch.next_states[:, 0], batch.actions + 1)
+    # Batches don't share transitions if possible
+    if n * 16 <= len(buf):
+        actions = np.concatenate([batch.actions for batch in batches])
+        assert np.unique(actions).shape[0] == n * 16
+
+
+def test_array_capacity() -> None:
+    buf = ArrayReplayBuffer(DQNReplayFeed, capacity=20)
+    _fill(buf, 100)
+    assert len(buf) <= 20
+    batch = buf.sample(len(buf))
+    assert batch.actions.min() >= 80
+    np.testing.assert_array_equal(batch.next_states[:, 0], batch.actions + 1)
+
+
+def test_array_mask() -> None:
+    buf = ArrayReplayBuffer(BootDQNReplayFeed, capacity=10)
+    state = np.ones(2)
+    for i in range(10):
+        mask = np.arange(4) < i % 4
+        buf.append(state, i, state, 0.0, False, mask)
+    batch = buf.sample(8)
+    assert batch.masks.shape == (8, 4)
+    np.testing.assert_array_equal(batch.masks.sum(axis=1), batch.actions % 4)
+
+
+def test_array_append_continuity() -> None:
+    buf = ArrayReplayBuffer(DQNReplayFeed, capacity=20)
+    next_state = np.ones(3)
+    buf.append(np.zeros(3), 0, next_state, 0.0, True)
+    # Reset by overwriting the same array, like environments returning views
+    next_state[:] = 10.0
+    buf.append(next_state, 1, np.full(3, 11.0), 0.0, False)
+    # A new object continues the episode if the last transition isn't terminal
+    buf.append(np.full(3, 11.0), 2, np.full(3, 12.0), 0.0, False)
+    assert buf._cursor == 4
+    buf.end_episode()
+    buf.append(np.full(3, 20.0), 3, np.full(3, 21.0), 0.0, False)
+    assert buf._cursor == 6
+    batch = buf.sample(len(buf))
+    states = np.array([0.0, 10.0, 11.0, 20.0])
+    np.testing.assert_array_equal(batch.states[:, 0], states[batch.actions])
+    np.testing.assert_array_equal(batch.next_states[:, 0], states[batch.actions] + 1)
+
+
+@pytest.mark.parametrize("gamma", [0.5, 0.0])
+def test_array_nstep(gamma: float) -> None:
+    buf = ArrayReplayBuffer(DQNReplayFeed, capacity=100, nstep=3, discount_factor=gamma)
+    _fill(buf, 12, episode_len=5)
+    # Transitions 0-11 are stored and episodes end after 4 and 9.
+    # The chain from 11 is not terminated, but ends since the data ends.
+    batch = buf.sample(len(buf))
+    for action, reward, next_state, done, discount in zip(
+        batch.actions,
+        batch.rewards,
+        batch.next_states,
+        batch.terminals,
+        batch.discounts,
+    ):
+        episode_end = (action // 5 + 1) * 5
+        end = min(action + 3, episode_end, 12)
+        expected = sum(r * gamma ** (r - action) for r in range(action, end))
+        assert reward == pytest.approx(expected)
+        assert done == (end == episode_end)
+        assert next_state[0] == end
+        if done:
+            assert discount == 0.0
+        else:
+            assert discount == pytest.approx(gamma ** (end - action))
+
+
+def _fill_batch(buf: ArrayReplayBuffer, nsteps: int, nenvs: int = 4) -> None:
+    """Steps parallel environments in turns, where environment i is stepped
+    only if step % (i + 1) == 0 and its state at t is i * 1000 + t
+    """
+    times = np.zeros(nenvs, dtype=np.int64)
+    for step in range(nsteps):
+        envids = np.flatnonzero(step % (np.arange(nenvs) + 1) == 0)
+        actions = envids * 1000 + times[envids]
+        states = np.repeat(actions[:, np.newaxis], 3, axis=1).astype(np.float32)
+        dones = (times[envids] + 1) % 5 == 0
+        buf.append_batch(
+            states, actions, states + 1, actions * 0.5, dones, envids=envids
+        )
+        times[envids] += 1
+
+
+def test_array_append_batch() -> None:
+    buf = ArrayReplayBuffer(DQNReplayFeed, capacity=100)
+    _fill_batch(buf, 60)
+    batch = buf.sample(len(buf))
+    np.testing.assert_array_equal(batch.states[:, 0], batch.actions)
+    np.testing.assert_array_equal(batch.next_states[:, 0], batch.actions + 1)
+    np.testing.assert_array_equal(batch.rewards, batch.actions * 0.5)
+    np.testing.assert_array_equal(batch.terminals, batch.actions % 1000 % 5 == 4)
+    # Transitions share states, except for the first transitions of episodes
+    assert len(buf) >= 60
+    # Oldest transitions of each environment are removed first
+    for envid in range(4):
+        actions = batch.actions[batch.actions // 1000 == envid]
+        assert np.all(np.diff(np.sort(actions)) == 1)
+
+
+@pytest.mark.parametrize("subsets", ["all", "halves", "random"])
+def test_array_append_batch_capacity(subsets: str) -> None:
+    buf = ArrayReplayBuffer(DQNReplayFeed, capacity=1000)
+    rng = np.random.default_rng(0)
+    states = np.zeros((8, 2), dtype=np.float32)
+    for step in range(1000):
+        if subsets == "all":
+            envids = np.arange(8)
+        elif subsets == "halves":
+            envids = np.arange(step % 2, 8, 2)
+        else:
+            envids = np.flatnonzero(rng.random(8) < 0.5)
+            if len(envids) == 0:
+                continue
+        next_states = states[envids] + 1.0
+        dones = next_states[:, 0] % 50 == 0
+        n = len(envids)
+        buf.append_batch(
+            states[envids], envids, next_states, np.zeros(n), dones, envids=envids
+        )
+        states[envids] = next_states
+    # Blocks are sized by the number of environments, not by the size of batches
+    assert len(buf) > 850
+    batch = buf.sample(len(buf))
+    np.testing.assert_array_equal(batch.next_states, batch.states + 1.0)
+
+
+def test_array_append_batch_nstep() -> None:
+    buf = ArrayReplayBuffer(DQNReplayFeed, capacity=200, nstep=3, discount_factor=0.5)
+    _fill_batch(buf, 40)
+    batch = buf.sample(len(buf))
+    times = batch.actions % 1000
+    episode_end = (times // 5 + 1) * 5
+    ntimes = np.array([40, 20, 14, 10])[batch.actions // 1000]
+    max_end = np.minimum(np.minimum(times + 3, episode_end), ntimes)
+    # Returns are truncated at the ends of blocks
+    end = times + (batch.next_states[:, 0] - batch.actions).astype(np.int64)
+    assert np.all((times < end) & (end <= max_end))
+    assert np.mean(end == max_end) > 0.8
+    for action, t, e, reward in zip(batch.actions, times, end, batch.rewards):
+        expected = sum((action + k) * 0.5 * 0.5 ** k for k in range(e - t))
+        assert reward == pytest.approx(expected)
+    np.testing.assert_array_equal(batch.terminals, end == episode_end)
+    discounts = 0.5 ** (end - times) * (end != episode_end)
+    np.testing.assert_array_almost_equal(batch.discounts, discounts)
+
+
+def test_frame_append_batch() -> None:
+    buf = FrameReplayBuffer(DQNReplayFeed, capacity=200, nstack=2)
+    frames = np.zeros((4, 2, 3, 3))
+    frames[:, 1] = (np.arange(4) * 20)[:, None, None] / 255.0
+    for step in range(20):
+        next_frames = frames.copy()
+        next_frames[:, 0] = frames[:, 1]
+        next_frames[:, 1] = (np.arange(4) * 20 + step + 1)[:, None, None] / 255.0
+        actions = np.arange(4) * 20 + step
+        buf.append_batch(frames, actions, next_frames, np.zeros(4), np.zeros(4, bool))
+        frames = next_frames
+    # Each frame is stored once, except for the first states of blocks
+    assert len(buf) == 80
+    batch = buf.sample(80)
+    frames = np.rint(batch.states[:, 1, 0, 0] * 255)
+    np.testing.assert_array_equal(frames, batch.actions)
+    next_frames = np.rint(batch.next_states[:, :, 0, 0] * 255)
+    np.testing.assert_array_equal(next_frames[:, 0], batch.actions)
+    np.testing.assert_array_equal(next_frames[:, 1], batch.actions + 1)
+
+
+def test_array_dtypes() -> None:
+    buf = ArrayReplayBuffer(
+        DQNReplayFeed, capacity=100, dtypes=dict(state=np.float16, action=np.uint8)
+    )
+    _fill(buf, 40)
+    assert buf._states.dtype == np.float16
+    assert buf._columns["action"].dtype == np.uint8
+    batch = buf.sample(16)
+    assert batch.states.dtype == np.float32
+    assert batch.actions.dtype == np.int64
+    np.testing.assert_array_equal(batch.states[:, 0], batch.actions)
+    footprint = buf.footprint()
+    # 3 float16 + uint8 + float32 + bool + valid flag + dirty flags
+    assert footprint["allocated"] == 101 * (6 + 1 + 4 + 1 + 1) + 1
+    assert footprint["resident_estimate"] == footprint["allocated"] * buf._filled // 101
+
+
+def test_array_capacity_for() -> None:
+    spec = EnvSpec((4, 84, 84), gym.spaces.Discrete(4))
+    buf = ArrayReplayBuffer(DQNReplayFeed, dtypes=dict(state=np.uint8))
+    # state + action + reward + done + valid flag
+    slot_bytes = 4 * 84 * 84 + 8 + 4 + 1 + 1
+    assert buf.capacity_for(2**20, spec) == 2**20 // slot_bytes - 1
+    frame_buf = FrameReplayBuffer(DQNReplayFeed, nstack=4)
+    slot_bytes = 84 * 84 + 8 + 4 + 1 + 1
+    assert frame_buf.capacity_for(2**20, spec) == 2**20 // slot_bytes - 4
+    boot_buf = ArrayReplayBuffer(BootDQNReplayFeed)
+    with pytest.raises(ValueError):
+        boot_buf.capacity_for(2**20, spec)
+    mask = np.zeros(2, dtype=np.uint8)
+    assert boot_buf.capacity_for(2**20, spec, ensemble_mask=mask) > 0
@@ -0,0 +1,104 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from .array import ArrayReplayBuffer
+from .frame import FrameReplayBuffer
+from .prioritized import PrioritizedReplayBuffer
+from .test_array import _fill
+from .uniform import DQNReplayFeed, UniformReplayBuffer
+
+
+def _mtimes(directory: Path) -> dict:
+    return {p.name: p.stat().st_mtime_ns for p in directory.glob("chunk-*.npz")}
+
+
+def test_uniform_chunks(tmp_path: Path) -> None:
+    buf = UniformReplayBuffer(DQNReplayFeed, capacity=50, chunk_size=8)
+    _fill(buf, 70)
+    saved = buf.save_chunks(tmp_path)
+    # Chunks before the 20th transition are removed
+    assert len(list(tmp_path.glob("chunk-*.npz"))) == 7
+    mtimes = _mtimes(tmp_path)
+    _fill(buf, 3)
+    buf.save_chunks(tmp_path)
+    new_mtimes = _mtimes(tmp_path)
+    unchanged = [name for name in mtimes if mtimes[name] == new_mtimes.get(name)]
+    assert len(unchanged) >= 5
+    new_buf = UniformReplayBuffer(DQNReplayFeed, capacity=50, chunk_size=8)
+    new_buf.load_chunks(saved)
+    assert len(new_buf) == 50
+    for exp, new_exp in zip(buf.buf, new_buf.buf):
+        assert exp.action == new_exp.action
+        np.testing.assert_array_equal(exp.state, new_exp.state)
+        np.testing.assert_array_equal(exp.next_state, new_exp.next_state)
+
+
+@pytest.mark.parametrize("cls", [ArrayReplayBuffer, PrioritizedReplayBuffer])
+def test_array_chunks(tmp_path: Path, cls: type) -> None:
+    buf = cls(DQNReplayFeed, capacity=50, chunk_size=8)
+    _fill(buf, 30)
+    buf.save_chunks(tmp_path)
+    mtimes = _mtimes(tmp_path)
+    _fill(buf, 5)
+    saved = buf.save_chunks(tmp_path)
+    new_mtimes = _mtimes(tmp_path)
+    assert sum(mtimes[name] == new_mtimes[name] for name in mtimes) >= 3
+    new_buf = cls(DQNReplayFeed, capacity=50, chunk_size=8)
+    new_buf.load_chunks(saved)
+    assert len(new_buf) == len(buf)
+    batch = new_buf.sample(len(new_buf))
+    np.testing.assert_array_equal(
+        np.sort(batch.actions), np.sort(buf.sample(len(buf)).actions)
+    )
+    np.testing.assert_array_equal(batch.states[:, 0], batch.actions)
+    np.testing.assert_array_equal(batch.next_states[:, 0], batch.actions + 1)
+
+
+@pytest.mark.parametrize("cls", [UniformReplayBuffer, ArrayReplayBuffer])
+def test_missing_chunk(tmp_path: Path, cls: type) -> None:
+    buf = cls(DQNReplayFeed, capacity=50, chunk_size=8)
+    _fill(buf, 30)
+    saved = buf.save_chunks(tmp_path)
+    tmp_path.joinpath("chunk-000002.npz").unlink()
+    with pytest.raises(FileNotFoundError, match="chunk 2"):
+        cls(DQNReplayFeed, capacity=50, chunk_size=8).load_chunks(saved)
+
+
+def test_frame_chunks(tmp_path: Path) -> None:
+    buf = FrameReplayBuffer(DQNReplayFeed, capacity=20, nstack=2, chunk_size=4)
+    state = np.zeros((2, 3, 3))
+    for i in range(30):
+        next_state = np.stack((state[1], np.full((3, 3), (i + 1) / 255.0)))
+        buf.append(state, i, next_state, 0.0, False)
+        state = next_state
+    new_buf = FrameReplayBuffer(DQNReplayFeed, capacity=20, nstack=2, chunk_size=4)
+    new_buf.load_chunks(buf.save_chunks(tmp_path))
+    batch = new_buf.sample(len(new_buf))
+    frames = np.rint(batch.states[:, 1, 0, 0] * 255)
+    np.testing.assert_array_equal(frames, batch.actions)
+    next_frames = np.rint(batch.next_states[:, 1, 0, 0] * 255)
+    np.testing.assert_array_equal(next_frames, batch.actions + 1)
+
+
+def test_array_chunks_linked(tmp_path: Path) -> None:
+    buf = ArrayReplayBuffer(DQNReplayFeed, capacity=50, chunk_size=8)
+    _fill(buf, 30)
+    old = buf.save_chunks(tmp_path.joinpath("old"))
+    _fill(buf, 3)
+    buf.save_chunks(tmp_path.joinpath("new"))
+    old_dir, new_dir = tmp_path.joinpath("old"), tmp_path.joinpath("new")
+    # Chunks unchanged since the last save are links to the same files
+    linked = [
+        p.name
+        for p in old_dir.glob("chunk-*.npz")
+        if p.samefile(new_dir.joinpath(p.name))
+    ]
+    assert len(linked) >= 2
+    _fill(buf, 20)
+    buf.save_chunks(new_dir)
+    old_buf = ArrayReplayBuffer(DQNReplayFeed, capacity=50, chunk_size=8)
+    old_buf.load_chunks(old)
+    assert len(old_buf) == 30
+    assert old_buf.sample(30).actions.max() == 29
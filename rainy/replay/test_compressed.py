@@ -0,0 +1,66 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from .compressed import CompressedFrameReplayBuffer, CompressedReplayBuffer
+from .prefetch import PrefetchReplayBuffer
+from .uniform import DQNReplayFeed
+
+NSTACK = 4
+
+
+def _frame(t: int) -> np.ndarray:
+    return np.full((8, 8), t % 256, dtype=np.float64) / 255.0
+
+
+@pytest.mark.parametrize("nworkers", [1, 4])
+def test_compressed_frame(nworkers: int) -> None:
+    buf = CompressedFrameReplayBuffer(
+        DQNReplayFeed, capacity=100, nstack=NSTACK, nworkers=nworkers
+    )
+    stored = {}
+    t = 0
+    for episode in range(20):
+        state = np.stack([_frame(t)] * NSTACK)
+        for step in range(9):
+            t += 1
+            next_state = np.concatenate((state[1:], _frame(t)[np.newaxis]))
+            stored[t] = state, next_state
+            buf.append(state, t, next_state, 0.0, step == 8)
+            state = next_state
+        t += 1
+    batch = buf.sample(64)
+    assert batch.states.shape == (64, NSTACK, 8, 8)
+    assert batch.states.dtype == np.float32
+    for state, action, next_state in zip(*batch[:3]):
+        expected_state, expected_next_state = stored[action]
+        np.testing.assert_array_almost_equal(state, expected_state)
+        np.testing.assert_array_almost_equal(next_state, expected_next_state)
+    stats = buf.stats()
+    assert stats["compression_ratio"] > 1.0
+    assert stats["decode_latency"] > 0.0
+    assert buf.stats()["decode_latency"] == 0.0
+    buf.close()
+
+
+def test_compressed_batch_and_pickle() -> None:
+    buf = CompressedReplayBuffer(DQNReplayFeed, capacity=100, nworkers=2)
+    states = np.arange(40, dtype=np.float32).reshape(10, 4)
+    actions = np.arange(10)
+    buf.append_batch(states, actions, states + 1.0, np.zeros(10), np.zeros(10, bool))
+    batch = buf.sample(10)
+    np.testing.assert_array_equal(batch.states[:, 0], batch.actions * 4)
+    np.testing.assert_array_equal(batch.next_states, batch.states + 1.0)
+    buf = pickle.loads(pickle.dumps(buf))
+    assert len(buf.sample(10).states) == 10
+
+
+def test_compressed_prefetch_stats() -> None:
+    buf = PrefetchReplayBuffer(CompressedReplayBuffer(DQNReplayFeed, capacity=10))
+    for i in range(10):
+        buf.append(np.zeros(4), i, np.zeros(4), 0.0, False)
+    buf.sample_batch(4, np.asarray)
+    stats = buf.stats()
+    assert "compression_ratio" in stats and "prefetch_wait" in stats
+    buf.close()
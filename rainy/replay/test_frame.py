@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from .frame import FrameReplayBuffer
+from .uniform import DQNReplayFeed
+
+NSTACK = 4
+
+
+def _frame(t: int) -> np.ndarray:
+    return np.full((3, 3), t % 256, dtype=np.float64) / 255.0
+
+
+@pytest.mark.parametrize("capacity", [10, 50, 1000])
+def test_frame_stack(capacity: int) -> None:
+    buf = FrameReplayBuffer(DQNReplayFeed, capacity=capacity, nstack=NSTACK)
+    stored = {}
+    t = 0
+    for episode in range(20):
+        # Repeat the first frame, like FrameStack.reset
+        state = np.stack([_frame(t)] * NSTACK)
+        for step in range(7 + episode % 3):
+            t += 1
+            next_state = np.concatenate((state[1:], _frame(t)[np.newaxis]))
+            stored[t] = state, next_state
+            buf.append(state, t, next_state, 0.0, step == 6 + episode % 3)
+            state = next_state
+        t += 1
+    assert 0 < len(buf) <= capacity
+    batch = buf.sample(len(buf))
+    assert batch.states.shape == (len(buf), NSTACK, 3, 3)
+    assert batch.states.dtype == np.float32
+    for state, action, next_state in zip(*batch[:3]):
+        expected_state, expected_next_state = stored[action]
+        np.testing.assert_array_almost_equal(state, expected_state)
+        np.testing.assert_array_almost_equal(next_state, expected_next_state)
+
+
+def test_frame_invalid_shape() -> None:
+    buf = FrameReplayBuffer(DQNReplayFeed, capacity=10, nstack=NSTACK)
+    with pytest.raises(ValueError):
+        buf.append(np.zeros((3, 3)), 0, np.zeros((3, 3)), 0.0, False)
@@ -0,0 +1,80 @@
+from pathlib import Path
+
+import numpy as np
+
+from .memmap import MemmapReplayBuffer
+from .test_array import _fill
+from .uniform import DQNReplayFeed
+
+
+def test_memmap_sample(tmp_path: Path) -> None:
+    buf = MemmapReplayBuffer(DQNReplayFeed, capacity=20, directory=lambda: tmp_path)
+    _fill(buf, 30)
+    assert isinstance(buf._states, np.memmap)
+    assert tmp_path.joinpath("replay/state.npy").exists()
+    batch = buf.sample(16)
+    assert batch.actions.min() >= 10
+    np.testing.assert_array_equal(batch.states[:, 0], batch.actions)
+    np.testing.assert_array_equal(batch.next_states[:, 0], batch.actions + 1)
+
+
+def test_memmap_reattach(tmp_path: Path) -> None:
+    buf = MemmapReplayBuffer(DQNReplayFeed, capacity=20, directory=tmp_path)
+    _fill(buf, 30)
+    state_dict = buf.state_dict()
+    new_buf = MemmapReplayBuffer(DQNReplayFeed, capacity=20, directory=tmp_path)
+    new_buf.load_state_dict(state_dict)
+    assert len(new_buf) == len(buf)
+    batch = new_buf.sample(len(new_buf))
+    np.testing.assert_array_equal(batch.actions, buf.sample(len(buf)).actions)
+    np.testing.assert_array_equal(batch.next_states[:, 0], batch.actions + 1)
+    # Appending after reattaching starts a new episode
+    new_buf.append(np.zeros(3), 100, np.ones(3), 0.0, False)
+    batch = new_buf.sample(len(new_buf))
+    assert batch.actions.max() == 100
+    np.testing.assert_array_equal(batch.states[batch.actions == 100], 0.0)
+
+
+def test_memmap_casts(tmp_path: Path) -> None:
+    dtypes = dict(state=np.float16)
+    buf = MemmapReplayBuffer(DQNReplayFeed, 20, directory=tmp_path, dtypes=dtypes)
+    _fill(buf, 30)
+    new_buf = MemmapReplayBuffer(DQNReplayFeed, 20, directory=tmp_path, dtypes=dtypes)
+    new_buf.load_state_dict(buf.state_dict())
+    assert new_buf._states.dtype == np.float16
+    assert new_buf.sample(4).states.dtype == np.float32
+    assert not new_buf._dirty.any()
+
+
+def test_memmap_tempdir() -> None:
+    bufs = [MemmapReplayBuffer(DQNReplayFeed, capacity=20) for _ in range(2)]
+    for buf in bufs:
+        _fill(buf, 10)
+    assert bufs[0].path != bufs[1].path
+    paths = [buf.path for buf in bufs]
+    for buf, path in zip(bufs, paths):
+        assert path.joinpath("state.npy").exists()
+        buf.close()
+        assert not path.parent.exists()
+
+
+def test_memmap_set_directory(tmp_path: Path) -> None:
+    buf = MemmapReplayBuffer(DQNReplayFeed, capacity=20)
+    buf.set_directory(lambda: tmp_path)
+    _fill(buf, 10)
+    assert buf.path == tmp_path.joinpath("replay")
+    # Files not in a temporary directory are kept
+    buf.close()
+    assert tmp_path.joinpath("replay/state.npy").exists()
+
+
+def test_memmap_sample_batches(tmp_path: Path) -> None:
+    np.random.seed(0)
+    buf = MemmapReplayBuffer(DQNReplayFeed, capacity=200, directory=tmp_path)
+    _fill(buf, 200)
+    for batch in buf.sample_batches(4, 32):
+        actions = batch.actions
+        assert np.all(np.diff(actions) > 0)
+        # Each batch covers the whole slot range, not a quarter of it
+        assert actions.min() < 50 and actions.max() >= 150
+        np.testing.assert_array_equal(batch.next_states[:, 0], actions + 1)
@@ -0,0 +1,91 @@
+import numpy as np
+import torch
+
+from .array import ArrayReplayBuffer
+from .prefetch import PrefetchReplayBuffer
+from .prioritized import PrioritizedReplayBuffer
+from .test_array import _fill
+from .uniform import DQNReplayFeed
+
+
+def test_prefetch_sample() -> None:
+    buf = PrefetchReplayBuffer(ArrayReplayBuffer(DQNReplayFeed, capacity=100))
+    _fill(buf, 40)
+    for _ in range(4):
+        batch = buf.sample_batch(16, np.asarray)
+        assert isinstance(batch.states, torch.Tensor)
+        assert batch.states.dtype == torch.float32
+        assert batch.actions.dtype == torch.int64
+        assert isinstance(batch.rewards, torch.Tensor)
+        assert isinstance(batch.terminals, torch.Tensor)
+        np.testing.assert_array_equal(batch.states[:, 0].numpy(), batch.actions)
+        _fill(buf, 5)
+    stats = buf.stats()
+    assert 0.0 <= stats["prefetch_starved"] <= 1.0
+    buf.close()
+
+
+def test_prefetch_overwritten_priorities() -> None:
+    per = PrioritizedReplayBuffer(DQNReplayFeed, capacity=20, alpha=1.0)
+    buf = PrefetchReplayBuffer(per, nbatches=1)
+    _fill(buf, 20)
+    batch = buf.sample_batch(8, np.asarray)
+    # Overwrite all transitions
+    _fill(buf, 30)
+    buf.update_priorities(batch.indices, np.zeros(8))
+    valid = np.flatnonzero(per._valid)
+    np.testing.assert_array_equal(per._tree[valid], per._max_priority)
+    buf.close()
+
+
+def test_prefetch_stamps_per_batch() -> None:
+    per = PrioritizedReplayBuffer(DQNReplayFeed, capacity=20, alpha=1.0)
+    buf = PrefetchReplayBuffer(per, nbatches=1)
+    _fill(buf, 20)
+    old = buf.sample_batch(8, np.asarray)
+    new = buf.sample_batch(8, np.asarray)
+    _fill(buf, 30)
+    # Both batches are older than the overwrites, even if the older is updated
+    # after the newer
+    buf.update_priorities(new.indices, np.zeros(8))
+    buf.update_priorities(old.indices, np.zeros(8))
+    valid = np.flatnonzero(per._valid)
+    np.testing.assert_array_equal(per._tree[valid], per._max_priority)
+    assert len(buf._stamps) == 2
+    del old, new
+    assert len(buf._stamps) == 0
+    buf.close()
+
+
+def test_prefetch_restart() -> None:
+    buf = PrefetchReplayBuffer(ArrayReplayBuffer(DQNReplayFeed, capacity=100))
+    _fill(buf, 40)
+    assert len(buf.sample_batch(16, np.asarray).actions) == 16
+    assert len(buf.sample_batch(8, np.asarray).actions) == 8
+    assert buf._queue.qsize() <= buf.nbatches
+    for _ in range(4):
+        assert len(buf.sample_batch(8, np.asarray).actions) == 8
+    buf.close()
+
+
+class _GatherCountingBuffer(ArrayReplayBuffer):
+    def sample_batches(self, n: int, *args, **kwargs) -> list:
+        self.gathered.append(n)
+        return super().sample_batches(n, *args, **kwargs)
+
+
+def test_prefetch_sample_batches() -> None:
+    replay = _GatherCountingBuffer(DQNReplayFeed, capacity=100)
+    replay.gathered = []
+    buf = PrefetchReplayBuffer(replay, nbatches=4)
+    _fill(buf, 80)
+    batches = buf.sample_batches(4, 16, np.asarray)
+    assert len(batches) == 4
+    for batch in batches:
+        assert isinstance(batch.states, torch.Tensor)
+        assert len(batch.actions) == 16
+        np.testing.assert_array_equal(batch.states[:, 0].numpy(), batch.actions)
+    # Batches are gathered by the buffer 4 at once
+    buf.close()
+    assert len(replay.gathered) > 0
+    assert all(n == 4 for n in replay.gathered)
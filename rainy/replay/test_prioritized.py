@@ -0,0 +1,93 @@
+import numpy as np
+
+from .prioritized import PrioritizedReplayBuffer, SumTree
+from .uniform import DQNReplayFeed
+
+
+def test_sumtree() -> None:
+    tree = SumTree(10)
+    tree.update(np.arange(10), np.arange(10, dtype=np.float64))
+    assert tree.total() == 45.0
+    np.testing.assert_array_equal(tree.find([0.0, 1.0, 2.5, 44.9]), [1, 2, 2, 9])
+    # Duplicated indices
+    tree.update(np.array([3, 3, 4]), np.array([0.0, 0.0, 0.0]))
+    assert tree.total() == 38.0
+    tree.update_one(9, 0.0)
+    assert tree.total() == 29.0
+    np.testing.assert_array_equal(tree[[3, 8]], [0.0, 8.0])
+
+
+def test_prioritized_sample() -> None:
+    buf = PrioritizedReplayBuffer(DQNReplayFeed, capacity=100, alpha=1.0, beta_steps=10)
+    state = np.zeros(2)
+    for i in range(50):
+        next_state = np.ones(2) * (i + 1)
+        buf.append(state, i, next_state, 0.0, False)
+        state = next_state
+    batch = buf.sample(16)
+    np.testing.assert_array_equal(batch.states[:, 0], batch.actions)
+    # All transitions have the same priority at first
+    np.testing.assert_array_almost_equal(batch.weights, np.ones(16))
+    target = batch.actions.max()
+    td_errors = np.zeros(16)
+    td_errors[batch.actions == target] = 100.0
+    buf.update_priorities(batch.indices, td_errors)
+    batch = buf.sample(32)
+    assert (batch.actions == target).sum() > 16
+    assert batch.weights.max() == 1.0
+    batches = buf.sample_batches(3, 32)
+    for batch in batches:
+        np.testing.assert_array_equal(batch.states[:, 0], batch.actions)
+        np.testing.assert_array_equal(batch.states[:, 0], batch.indices)
+        assert batch.weights.max() == 1.0
+    assert buf._nsampled == 5
+
+
+def test_prioritized_batches_stratified() -> None:
+    buf = PrioritizedReplayBuffer(DQNReplayFeed, capacity=100)
+    state = np.zeros(2)
+    for i in range(100):
+        next_state = np.ones(2) * (i + 1)
+        buf.append(state, i, next_state, 0.0, False)
+        state = next_state
+    # Each batch has one transition from each stratum of the whole buffer
+    for batch in buf.sample_batches(4, 10):
+        np.testing.assert_array_equal(np.sort(batch.actions) // 10, np.arange(10))
+
+
+def test_prioritized_overwrite() -> None:
+    buf = PrioritizedReplayBuffer(DQNReplayFeed, capacity=10)
+    state = np.zeros(2)
+    for i in range(30):
+        next_state = np.ones(2) * (i + 1)
+        buf.append(state, i, next_state, 0.0, False)
+        state = next_state
+    batch = buf.sample(64)
+    assert batch.actions.min() >= 20
+
+
+def test_prioritized_padding_leaf(monkeypatch) -> None:
+    buf = PrioritizedReplayBuffer(DQNReplayFeed, capacity=5, alpha=1.0, eps=0.0)
+    state = np.zeros(2)
+    for i in range(6):
+        next_state = np.ones(2) * (i + 1)
+        buf.append(state, i, next_state, 0.0, False)
+        state = next_state
+    np.testing.assert_array_equal(np.flatnonzero(buf._valid), np.arange(1, 6))
+    # With these priorities, the prefix sums of leaves round below the total
+    buf.update_priorities(np.arange(1, 6), np.array([1 / 3, 0.1, 0.001, 0.7, 1 / 3]))
+    total = buf._tree.total()
+    assert buf._tree.find([np.nextafter(total, 0)])[0] >= buf._nslots
+    rand = np.random.rand
+    calls = []
+
+    def rand_once_at_total(*shape):
+        calls.append(shape)
+        return np.ones(shape) if len(calls) == 1 else rand(*shape)
+
+    # The first value is right at the total, which finds a padding leaf
+    monkeypatch.setattr(np.random, "rand", rand_once_at_total)
+    batch = buf.sample(1)
+    assert len(calls) > 1
+    assert 1 <= batch.indices[0] <= 5
+    assert np.isfinite(batch.weights).all()
@@ -0,0 +1,122 @@
+from pathlib import Path
+
+import numpy as np
+import torch
+
+from ..net.recurrent import GruState, LstmState
+from ..utils import Device
+from .sequence import SequenceFrameReplayBuffer, SequenceReplayBuffer
+from .uniform import DQNReplayFeed
+
+
+def _fill(buf: SequenceReplayBuffer, n: int, episode_len: int = 13) -> None:
+    state = np.zeros(3, dtype=np.float32)
+    for i in range(n):
+        next_state = np.repeat(float(i + 1), 3).astype(np.float32)
+        done = (i + 1) % episode_len == 0
+        rnn_state = GruState(torch.full((4,), float(i)))
+        buf.append(state, i, next_state, float(i), done, rnn_state)
+        state = next_state.copy() if done else next_state
+
+
+def test_sequence_sample() -> None:
+    buf = SequenceReplayBuffer(
+        DQNReplayFeed,
+        capacity=100,
+        seq_len=4,
+        burn_in=2,
+        period=3,
+        device=Device(use_cpu=True),
+    )
+    _fill(buf, 60)
+    batch = buf.sample(32)
+    assert isinstance(batch.states, torch.Tensor)
+    assert batch.states.shape == (7, 32, 3)
+    assert batch.actions.shape == (6, 32)
+    assert batch.burn_in == 2
+    states, actions = batch.states.numpy(), batch.actions.numpy()
+    masks = batch.masks.numpy()
+    starts = actions[0]
+    # Sequences start every 3 steps in each episode
+    assert np.all((starts % 13) % 3 == 0)
+    np.testing.assert_array_equal(batch.rnn_states.h[:, 0].numpy(), starts)
+    for t in range(6):
+        m = masks[t]
+        np.testing.assert_array_equal(actions[t][m], starts[m] + t)
+        np.testing.assert_array_equal(states[t][m][:, 0], starts[m] + t)
+        np.testing.assert_array_equal(states[t + 1][m][:, 0], starts[m] + t + 1)
+    # Sequences are masked after the end of episodes
+    episode_end = (starts // 13 + 1) * 13
+    expected = np.arange(6)[:, np.newaxis] < np.minimum(episode_end, 60) - starts
+    np.testing.assert_array_equal(masks, expected)
+    np.testing.assert_array_equal(
+        batch.terminals.numpy(), masks & ((actions + 1) % 13 == 0)
+    )
+
+
+def test_sequence_lstm_frame() -> None:
+    buf = SequenceFrameReplayBuffer(
+        DQNReplayFeed, capacity=50, seq_len=5, nstack=1, device=Device(use_cpu=True)
+    )
+    state = np.zeros((1, 2, 2))
+    for i in range(30):
+        next_state = np.full((1, 2, 2), (i + 1) / 255.0)
+        lstm = LstmState(torch.full((3,), float(i)), torch.full((3,), -float(i)))
+        buf.append(state, i, next_state, 0.0, False, lstm)
+        state = next_state
+    batch = buf.sample(8)
+    assert batch.states.shape == (6, 8, 1, 2, 2)
+    actions = batch.actions.numpy()
+    # Steps after the last transition are masked
+    expected = actions[0] + np.arange(5)[:, np.newaxis] < 30
+    np.testing.assert_array_equal(batch.masks.numpy(), expected)
+    frames = np.rint(batch.states[:, :, 0, 0, 0].numpy() * 255)
+    np.testing.assert_array_equal(frames[:-1][expected], actions[expected])
+    np.testing.assert_array_equal(batch.rnn_states.c[:, 0].numpy(), -actions[0])
+
+
+def test_sequence_append_batch() -> None:
+    buf = SequenceReplayBuffer(
+        DQNReplayFeed, capacity=200, seq_len=4, period=2, device=Device(use_cpu=True)
+    )
+    # Environment i has episodes of 7 + i steps, and its state at step t of episode
+    # k is i * 1000 + k * 50 + t
+    times = np.zeros(3, dtype=np.int64)
+    for _ in range(30):
+        actions = np.arange(3) * 1000 + times
+        states = np.repeat(actions[:, np.newaxis], 3, axis=1).astype(np.float32)
+        dones = (times % 50 + 1) % (7 + np.arange(3)) == 0
+        rnn_states = GruState(torch.from_numpy(actions[:, np.newaxis]).float())
+        buf.append_batch(states, actions, states + 1, np.zeros(3), dones, rnn_states)
+        # Parallel environments reset themselves
+        times = np.where(dones, (times // 50 + 1) * 50, times + 1)
+    batch = buf.sample(16)
+    actions, masks = batch.actions.numpy(), batch.masks.numpy()
+    starts = actions[0]
+    np.testing.assert_array_equal(batch.rnn_states.h[:, 0].numpy(), starts)
+    # Sequences start every 2 steps in each episode
+    assert np.all((starts % 50) % 2 == 0)
+    states = batch.states.numpy()
+    for t in range(4):
+        m = masks[t]
+        np.testing.assert_array_equal(actions[t][m], starts[m] + t)
+        np.testing.assert_array_equal(states[t + 1][m][:, 0], starts[m] + t + 1)
+    # Sequences are masked after the end of episodes
+    episode_len = 7 + starts // 1000
+    expected = np.arange(4)[:, np.newaxis] < episode_len - starts % 50
+    assert np.all(masks <= expected)
+
+
+def test_sequence_chunks(tmp_path: Path) -> None:
+    def make() -> SequenceReplayBuffer:
+        return SequenceReplayBuffer(
+            DQNReplayFeed, capacity=100, seq_len=4, device=Device(use_cpu=True)
+        )
+
+    buf = make()
+    _fill(buf, 60)
+    new_buf = make()
+    new_buf.load_chunks(buf.save_chunks(tmp_path))
+    np.testing.assert_array_equal(new_buf._is_start, buf._is_start)
+    batch = new_buf.sample(16)
+    np.testing.assert_array_equal(batch.rnn_states.h[:, 0].numpy(), batch.actions[0])
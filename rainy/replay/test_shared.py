@@ -0,0 +1,103 @@
+import multiprocessing as mp
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from .shared import SharedMemoryReplayBuffer
+from .uniform import BootDQNReplayFeed, DQNReplayFeed
+
+
+def _act(buf: SharedMemoryReplayBuffer, actor_id: int, n: int) -> None:
+    buf = buf.for_actor(actor_id)
+    state = np.full(2, actor_id * 1000, dtype=np.float32)
+    for i in range(n):
+        next_state = state + 1.0
+        buf.append(state, actor_id, next_state, float(i), i % 10 == 9)
+        state = next_state
+    buf.close()
+
+
+@pytest.mark.parametrize("method", ["fork", "spawn"])
+def test_shared_actors(method: str) -> None:
+    buf = SharedMemoryReplayBuffer(
+        DQNReplayFeed, capacity=300, nactors=3, state_shape=(2,)
+    )
+    ctx = mp.get_context(method)
+    actors = [ctx.Process(target=_act, args=(buf, i, 50 + 50 * i)) for i in range(3)]
+    for actor in actors:
+        actor.start()
+    for actor in actors:
+        actor.join()
+        assert actor.exitcode == 0
+    assert len(buf) == 50 + 100 + 100
+    batch = buf.sample(200)
+    assert batch.states.shape == (200, 2)
+    assert len(np.unique(batch.states[:, 0] + batch.actions * 0.5)) == 200
+    np.testing.assert_array_equal(batch.next_states, batch.states + 1.0)
+    np.testing.assert_array_equal(batch.states[:, 0] // 1000, batch.actions)
+    # The actor 2 overwrote its first transitions
+    assert batch.states[batch.actions == 2, 0].min() >= 2050
+    buf.close()
+
+
+def _act_and_close(buf: SharedMemoryReplayBuffer, actor_id: int, n: int) -> None:
+    actor = buf.for_actor(actor_id)
+    _act(buf, actor_id, n)
+    # A buffer of an actor closes shared memory in the actor process
+    assert not actor._shms and not buf._arrays
+
+
+@pytest.mark.parametrize("allow_overlap", [False, True])
+def test_shared_sample_while_acting(allow_overlap: bool) -> None:
+    buf = SharedMemoryReplayBuffer(
+        DQNReplayFeed,
+        capacity=600,
+        nactors=3,
+        state_shape=(2,),
+        allow_overlap=allow_overlap,
+    )
+    ctx = mp.get_context("spawn")
+    actors = [ctx.Process(target=_act_and_close, args=(buf, i, 900)) for i in range(3)]
+    for actor in actors:
+        actor.start()
+    nsampled = 0
+    while any(actor.is_alive() for actor in actors) or nsampled == 0:
+        if len(buf) < 64:
+            continue
+        for batch in buf.sample_batches(2, 32):
+            np.testing.assert_array_equal(batch.next_states, batch.states + 1.0)
+            np.testing.assert_array_equal(batch.states[:, 0] // 1000, batch.actions)
+            if not allow_overlap:
+                assert len(np.unique(batch.states[:, 0])) == 32
+        nsampled += 1
+    for actor in actors:
+        actor.join()
+        assert actor.exitcode == 0
+    assert len(buf) == 600
+    batches = buf.sample_batches(3, 200)
+    assert [len(np.unique(b.actions)) for b in batches] == [3, 3, 3]
+    buf.close()
+
+
+def test_shared_save_and_load(tmp_path: Path) -> None:
+    buf = SharedMemoryReplayBuffer(
+        DQNReplayFeed, capacity=40, nactors=2, state_shape=(2,)
+    )
+    for i in range(2):
+        _act(buf, i, 15)
+    saved = buf.save_chunks(tmp_path)
+    loaded = SharedMemoryReplayBuffer(
+        DQNReplayFeed, capacity=40, nactors=2, state_shape=(2,)
+    )
+    loaded.load_chunks(saved)
+    assert len(loaded) == 30
+    batch = loaded.sample(30)
+    assert sorted(batch.states[:, 0]) == sorted([*range(15), *range(1000, 1015)])
+    for b in [buf, loaded]:
+        b.close()
+
+
+def test_shared_spec() -> None:
+    with pytest.raises(ValueError):
+        SharedMemoryReplayBuffer(BootDQNReplayFeed)
@@ -0,0 +1,75 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+import torch
+
+from ..utils import Device
+from .tensor import TensorReplayBuffer
+from .test_array import _fill
+from .uniform import BootDQNReplayFeed, DQNReplayFeed
+
+
+@pytest.mark.parametrize("allow_overlap", [True, False])
+def test_tensor_sample(allow_overlap: bool) -> None:
+    buf = TensorReplayBuffer(
+        DQNReplayFeed,
+        capacity=20,
+        device=Device(use_cpu=True),
+        allow_overlap=allow_overlap,
+    )
+    _fill(buf, 30)
+    batch = buf.sample(16)
+    assert isinstance(batch.states, torch.Tensor)
+    assert batch.states.dtype == torch.float32
+    assert batch.terminals.dtype == torch.bool
+    if not allow_overlap:
+        assert len(batch.actions.unique()) == 16
+    assert batch.actions.min().item() >= 10
+    assert torch.equal(batch.states[:, 0].long(), batch.actions)
+    assert torch.equal(batch.next_states[:, 0].long(), batch.actions + 1)
+    assert torch.equal(batch.terminals, (batch.actions + 1) % 5 == 0)
+
+
+def test_tensor_mask() -> None:
+    buf = TensorReplayBuffer(
+        BootDQNReplayFeed, capacity=10, device=Device(use_cpu=True)
+    )
+    state = np.ones(2)
+    for i in range(10):
+        buf.append(state, i, state, 0.0, False, np.arange(4) < i % 4)
+    batch = buf.sample(8)
+    assert torch.equal(batch.masks.sum(dim=1), batch.actions % 4)
+
+
+def test_tensor_chunks(tmp_path: Path) -> None:
+    buf = TensorReplayBuffer(DQNReplayFeed, capacity=20, device=Device(use_cpu=True))
+    _fill(buf, 30)
+    new_buf = TensorReplayBuffer(
+        DQNReplayFeed, capacity=20, device=Device(use_cpu=True)
+    )
+    new_buf.load_chunks(buf.save_chunks(tmp_path))
+    assert len(new_buf) == len(buf)
+    batch = new_buf.sample(16)
+    assert torch.equal(batch.next_states[:, 0].long(), batch.actions + 1)
+
+
+@pytest.mark.parametrize("allow_overlap", [True, False])
+def test_tensor_sample_batches(allow_overlap: bool) -> None:
+    buf = TensorReplayBuffer(
+        DQNReplayFeed,
+        capacity=20,
+        device=Device(use_cpu=True),
+        allow_overlap=allow_overlap,
+    )
+    _fill(buf, 30)
+    batches = buf.sample_batches(4, 4)
+    assert len(batches) == 4
+    for batch in batches:
+        assert isinstance(batch.states, torch.Tensor)
+        assert batch.states.shape == (4, 3)
+        assert batch.masks is None
+        assert torch.equal(batch.next_states[:, 0].long(), batch.actions + 1)
+    if not allow_overlap:
+        actions = torch.cat([batch.actions for batch in batches])
+        assert len(actions.unique()) == 16
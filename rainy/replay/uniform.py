@@ -1,34 +1,86 @@
 import dataclasses
-from typing import Callable, Generic, List, Tuple, Type
+from pathlib import Path
+from typing import Callable, Generic, List, Optional, Tuple, Type
 
 import numpy as np
 
 from ..prelude import Array, State
-from ..utils import sample_indices
+from . import chunk
 from .array_deque import ArrayDeque
 from .base import ReplayBuffer, ReplayFeed
 
 
 class UniformReplayBuffer(ReplayBuffer, Generic[ReplayFeed]):
     def __init__(
-        self, feed: Type[ReplayFeed], capacity: int = 1000, allow_overlap: bool = False
+        self,
+        feed: Type[ReplayFeed],
+        capacity: int = 1000,
+        allow_overlap: bool = False,
+        chunk_size: int = 4096,
     ) -> None:
         super().__init__(feed, allow_overlap=allow_overlap)
         self.buf = ArrayDeque(capacity=capacity)
         self.cap = capacity
+        self.chunk_size = chunk_size
+        # Transition i in buf is the (_count - len(buf) + i)th appended one
+        self._count = 0
+        self._saved_count = 0
+        self._chunk_dir: Optional[Path] = None
 
     def append(self, *args) -> None:
         exp = self.feed(*args)
         self.buf.push_back(exp)
+        self._count += 1
         if len(self) > self.cap:
             self.buf.pop_front()
 
     def sample(self, batch_size: int) -> List[ReplayFeed]:
         if self.allow_overlap:
             indices = np.random.randint(len(self.buf), size=batch_size)
+            return [self.buf[idx] for idx in indices]
         else:
-            indices = sample_indices(len(self.buf), batch_size)
-        return [self.buf[idx] for idx in indices]
+            return self.buf.sample(batch_size)
+
+    def save_chunks(self, directory: Path) -> dict:
+        """Since transitions are appended in order, chunks are filled one by one and
+        only the last saved chunk and new ones are written.
+        """
+        directory.mkdir(parents=True, exist_ok=True)
+        first, size = self._count - len(self.buf), self.chunk_size
+        if directory != self._chunk_dir:
+            # Complete chunks saved in the last directory are reused
+            saved = range(first // size, max(self._saved_count, first) // size)
+            missing = chunk.link_chunks(self._chunk_dir, directory, saved)
+            self._chunk_dir = directory
+            self._saved_count = max(self._saved_count, first)
+            if len(missing) > 0:
+                self._saved_count = max(missing[0] * size, first)
+        names = [f.name for f in dataclasses.fields(self.feed)]
+        for index in range(self._saved_count // size, (self._count - 1) // size + 1):
+            start = max(index * size, first)
+            stop = min((index + 1) * size, self._count)
+            exps = [self.buf[i - first] for i in range(start, stop)]
+            arrays = {n: np.asarray([getattr(e, n) for e in exps]) for n in names}
+            chunk.save_chunk(directory, index, start=start, **arrays)
+        chunk.remove_chunks(directory, first // size)
+        chunk.save_metadata(directory, first=first, count=self._count, chunk_size=size)
+        self._saved_count = self._count
+        return dict(path=directory.as_posix())
+
+    def load_chunks(self, saved: dict) -> None:
+        directory = Path(saved["path"])
+        meta = chunk.load_metadata(directory)
+        first, count, size = meta["first"], meta["count"], meta["chunk_size"]
+        names = [f.name for f in dataclasses.fields(self.feed)]
+        self.buf.clear()
+        for index in range(first // size, (count - 1) // size + 1):
+            arrays = chunk.load_chunk(directory, index)
+            start = int(arrays["start"])
+            lo, hi = max(first, start), min(count, (index + 1) * size)
+            for i in range(lo - start, hi - start):
+                self.append(*[arrays[name][i] for name in names])
+        self._count, self._saved_count = count, count
+        self._chunk_dir = directory if size == self.chunk_size else None
 
     def __len__(self):
         return len(self.buf)
@@ -61,6 +113,7 @@ class BootDQNReplayFeed(Generic[State]):
     next_state: State
     reward: float
     done: bool
+    # BootDQNAgent stores masks packed into bits by np.packbits
     ensemble_mask: Array[bool]
 
     def to_array(
@@ -7,26 +7,20 @@ from ..prelude import Array
 
 
 def sample_indices(n: int, k: int) -> Array:
-    """Sample k numbers from [0, n)
-       Based on
-    https://github.com/chainer/chainerrl/blob/master/chainerrl/misc/random.py
+    """Sample k numbers from [0, n) without replacement.
+    If k is small, draws a few more than k numbers with replacement and takes the
+    first k unique ones, which are also in random order.
     """
     if 3 * k >= n:
         return np.random.choice(n, k, replace=False)
-    else:
-        selected = np.repeat(False, n)
-        rands = np.random.randint(0, n, size=k * 2)
-        j = k
-        for i in range(k):
-            x = rands[i]
-            while selected[x]:
-                if j == 2 * k:
-                    rands[k:] = np.random.randint(0, n, size=k)
-                    j = k
-                x = rands[i] = rands[j]
-                j += 1
-            selected[x] = True
-        return rands[:k]
+    # The expected number of duplicates is about k^2 / 2n
+    size = k + k * k // n + 4
+    while True:
+        candidates = np.random.randint(0, n, size=size)
+        _, first = np.unique(candidates, return_index=True)
+        if len(first) >= k:
+            first.sort()
+            return candidates[first[:k]]
 
 
 class FeedForwardBatchSampler(BatchSampler):
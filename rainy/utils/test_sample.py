@@ -13,6 +13,15 @@ def test_sample_small():
     assert np.unique(arr).shape[0] == 100
 
 
+def test_sample_uniform():
+    counts = np.zeros(10)
+    for _ in range(3000):
+        arr = sample_indices(10, 3)
+        assert np.unique(arr).shape[0] == 3
+        counts[arr] += 1
+    np.testing.assert_allclose(counts / 3000, 0.3, atol=0.05)
+
+
 def test_recurrent_batch_sampler():
     NSTEPS, NWORKERS = 12, 16
     r = RecurrentBatchSampler(NSTEPS, NWORKERS, 24)
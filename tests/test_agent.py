@@ -1,11 +1,26 @@
 from functools import partial
+from pathlib import Path
+from typing import Optional
 
+import numpy as np
 import pytest
+import torch
+from torch import optim
 from test_env import DummyEnvDeterministic
 
 import rainy
-from rainy import net
-from rainy.agents import A2CAgent, AOCAgent, PPOAgent
+from rainy import lib, net, replay
+from rainy.agents import (
+    A2CAgent,
+    ACTCAgent,
+    AOCAgent,
+    BootDQNAgent,
+    DoubleDQNAgent,
+    DQNAgent,
+    DQNLikeParallel,
+    PPOAgent,
+    bootdqn,
+)
 
 
 @pytest.mark.parametrize(
@@ -29,8 +44,9 @@ def test_eval_parallel(n: int, make_ag: callable) -> None:
 
 
 @pytest.mark.parametrize("make_ag", [A2CAgent, PPOAgent, AOCAgent])
-def test_nstep_train(make_ag: callable) -> None:
+def test_nstep_train(make_ag: callable, tmp_path: Path) -> None:
     c = rainy.Config()
+    c.logger.logdir = tmp_path
     c.logger.setup_logdir()
     c.nworkers = 6
     c.nsteps = 4
@@ -43,3 +59,456 @@ def test_nstep_train(make_ag: callable) -> None:
     res = next(ag.train_episodes(1))
     assert len(res) == c.nworkers
     ag.close()
+
+
+def test_actc_train(tmp_path: Path) -> None:
+    c = rainy.Config()
+    c.logger.logdir = tmp_path
+    c.logger.setup_logdir()
+    c.nworkers = 6
+    c.nsteps = 4
+    c.set_parallel_env(rainy.envs.DummyParallelEnv)
+    c.set_optimizer(lambda params: optim.Adam(params), key="termination")
+    c.set_explorer(lambda: lib.explore.EpsGreedy(0.1))
+    c.set_net_fn("actor-critic", net.termination_critic.oac_fc_shared(num_options=2))
+    c.set_net_fn("termination-critic", net.termination_critic.tc_fc_shared(2))
+    c.set_env(partial(DummyEnvDeterministic, flatten=True))
+    ag = ACTCAgent(c)
+    # Runs _one_step nsteps times and trains
+    res = next(ag.train_episodes(1))
+    assert len(res) == c.nworkers
+    ag.close()
+
+
+class StatesRecordingA2C(A2CAgent):
+    def train(self, last_states: np.ndarray) -> None:
+        states = [self.penv.extract(s) for s in self.storage.states]
+        self.rollout_states.append(np.stack(states))
+        self.rollout_rewards.append(np.stack(self.storage.rewards))
+        super().train(last_states)
+
+
+def _expected_rollout_states(nsteps: int) -> np.ndarray:
+    env = DummyEnvDeterministic(flatten=True)
+    expected = [env.extract(env.reset())]
+    expected += [env.extract(env.step(None).state) for _ in range(2)]
+    # Environments are reset after 3 steps
+    return np.stack([expected[i % 3] for i in range(nsteps + 1)])
+
+
+@pytest.mark.parametrize(
+    "make_penv",
+    [
+        rainy.envs.DummyParallelEnv,
+        rainy.envs.MultiProcEnv,
+        partial(rainy.envs.ThreadedParallelEnv, nthreads=3),
+    ],
+)
+def test_nstep_env_batch(make_penv: callable, tmp_path: Path) -> None:
+    c = rainy.Config()
+    c.logger.logdir = tmp_path
+    c.logger.setup_logdir()
+    c.nworkers = 6
+    c.nsteps = 5
+    c.env_batch_size = 2
+    c.set_parallel_env(make_penv)
+    c.set_net_fn("actor-critic", net.actor_critic.fc_shared(units=[32, 32]))
+    c.set_env(partial(DummyEnvDeterministic, flatten=True))
+    ag = StatesRecordingA2C(c)
+    ag.rollout_states, ag.rollout_rewards = [], []
+    res = next(ag.train_episodes(1))
+    assert len(res) == c.nworkers
+    for r in res:
+        assert r.return_ == 20.0
+        assert r.length == 3
+    # Each environment's rollout is the same as the one stepped synchronously
+    expected = _expected_rollout_states(c.nsteps)
+    for states in ag.rollout_states[0].transpose(1, 0, 2):
+        np.testing.assert_array_equal(states, expected)
+    for rewards in ag.rollout_rewards[0].T:
+        np.testing.assert_array_equal(rewards, [0.0, 0.0, 20.0, 0.0, 0.0])
+    ag.close()
+
+
+@pytest.mark.parametrize("make_ag", [PPOAgent, AOCAgent])
+def test_nstep_train_env_batch(make_ag: callable, tmp_path: Path) -> None:
+    c = rainy.Config()
+    c.logger.logdir = tmp_path
+    c.logger.setup_logdir()
+    c.nworkers = 6
+    c.nsteps = 4
+    c.env_batch_size = 4
+    c.ppo_minibatch_size = 12
+    c.set_parallel_env(rainy.envs.MultiProcEnv)
+    c.set_net_fn("actor-critic", net.actor_critic.fc_shared(units=[32, 32]))
+    c.set_net_fn("option-critic", net.option_critic.fc_shared(units=[32, 32]))
+    c.set_env(partial(DummyEnvDeterministic, flatten=True))
+    ag = make_ag(c)
+    res = next(ag.train_episodes(1))
+    assert len(res) == c.nworkers
+    ag.close()
+
+
+@pytest.mark.parametrize(
+    "make_penv",
+    [
+        partial(rainy.envs.MultiProcEnv, shared_memory=True),
+        rainy.envs.SpinProcEnv,
+        rainy.envs.ThreadedParallelEnv,
+    ],
+)
+def test_nstep_train_shared_states(make_penv: callable, tmp_path: Path) -> None:
+    c = rainy.Config()
+    c.logger.logdir = tmp_path
+    c.logger.setup_logdir()
+    c.nworkers = 4
+    c.nsteps = 5
+    c.set_parallel_env(make_penv)
+    c.set_net_fn("actor-critic", net.actor_critic.fc_shared(units=[32, 32]))
+    c.set_env(partial(DummyEnvDeterministic, flatten=True))
+    ag = StatesRecordingA2C(c)
+    ag.rollout_states, ag.rollout_rewards = [], []
+    next(ag.train_episodes(1))
+    # Stored states are not overwritten
+    expected = _expected_rollout_states(c.nsteps)
+    for states in ag.rollout_states[0].transpose(1, 0, 2):
+        np.testing.assert_array_equal(states, expected)
+    ag.close()
+
+
+@pytest.mark.parametrize(
+    "make_ag, feed, make_replay",
+    [
+        (DQNAgent, replay.DQNReplayFeed, replay.UniformReplayBuffer),
+        (DQNAgent, replay.DQNReplayFeed, replay.ArrayReplayBuffer),
+        (BootDQNAgent, replay.BootDQNReplayFeed, replay.ArrayReplayBuffer),
+        (DQNAgent, replay.DQNReplayFeed, replay.PrioritizedReplayBuffer),
+        (DoubleDQNAgent, replay.DQNReplayFeed, replay.PrioritizedReplayBuffer),
+        (BootDQNAgent, replay.BootDQNReplayFeed, replay.PrioritizedReplayBuffer),
+        (DQNAgent, replay.DQNReplayFeed, partial(replay.ArrayReplayBuffer, nstep=3)),
+        (DQNAgent, replay.DQNReplayFeed, replay.TensorReplayBuffer),
+        (BootDQNAgent, replay.BootDQNReplayFeed, replay.TensorReplayBuffer),
+        (DQNAgent, replay.DQNReplayFeed, replay.CompressedReplayBuffer),
+        (
+            DQNAgent,
+            replay.DQNReplayFeed,
+            partial(replay.SharedMemoryReplayBuffer, nactors=2, state_shape=(256,)),
+        ),
+    ],
+)
+def test_dqn_train(make_ag: callable, feed: type, make_replay: callable) -> None:
+    c = rainy.Config()
+    c.train_start = 10
+    c.replay_batch_size = 8
+    c.set_env(partial(DummyEnvDeterministic, flatten=True))
+    extract = DummyEnvDeterministic(flatten=True).extract
+    if make_replay is not replay.UniformReplayBuffer:
+        c.set_replay_buffer(lambda cap: make_replay(feed, cap, extract=extract))
+    else:
+        c.set_replay_buffer(lambda cap: make_replay(feed, cap))
+    c.set_net_fn("dqn", net.value.fc(units=[16, 16]))
+    c.set_net_fn("bootdqn", net.bootstrap.fc_separated(4, units=[16, 16]))
+    c.num_ensembles = 4
+    ag = make_ag(c)
+    for _ in ag.train_episodes(30):
+        pass
+    assert ag.update_steps > 1
+    ag.close()
+
+
+@pytest.mark.parametrize(
+    "make_ag, feed, make_replay",
+    [
+        (DQNAgent, replay.DQNReplayFeed, replay.UniformReplayBuffer),
+        (BootDQNAgent, replay.BootDQNReplayFeed, replay.PrioritizedReplayBuffer),
+    ],
+)
+def test_dqn_prefetch(make_ag: callable, feed: type, make_replay: callable) -> None:
+    c = rainy.Config()
+    c.train_start = 10
+    c.replay_batch_size = 8
+    c.replay_prefetch = 2
+    c.set_env(partial(DummyEnvDeterministic, flatten=True))
+    extract = DummyEnvDeterministic(flatten=True).extract
+    if make_replay is not replay.UniformReplayBuffer:
+        c.set_replay_buffer(lambda cap: make_replay(feed, cap, extract=extract))
+    else:
+        c.set_replay_buffer(lambda cap: make_replay(feed, cap))
+    c.set_net_fn("dqn", net.value.fc(units=[16, 16]))
+    c.set_net_fn("bootdqn", net.bootstrap.fc_separated(4, units=[16, 16]))
+    c.num_ensembles = 4
+    ag = make_ag(c)
+    assert isinstance(ag.replay, replay.PrefetchReplayBuffer)
+    for _ in ag.train_episodes(30):
+        pass
+    assert ag.update_steps > 1
+    stats = ag.replay.stats()
+    assert {"prefetch_starved", "prefetch_wait"} <= set(stats.keys())
+    ag.close()
+    assert ag.replay._worker is None
+
+
+@pytest.mark.parametrize("make_ag", [DQNAgent, BootDQNAgent])
+def test_replay_budget(make_ag: callable) -> None:
+    c = rainy.Config()
+    c.replay_budget = 2**20
+    c.set_env(partial(DummyEnvDeterministic, flatten=True))
+    c.set_net_fn("dqn", net.value.fc(units=[16, 16]))
+    c.set_net_fn("bootdqn", net.bootstrap.fc_separated(10, units=[16, 16]))
+    feed = replay.BootDQNReplayFeed if make_ag is BootDQNAgent else replay.DQNReplayFeed
+    extract = DummyEnvDeterministic(flatten=True).extract
+    dtypes = dict(state=np.float16)
+    c.set_replay_buffer(
+        lambda cap: replay.ArrayReplayBuffer(feed, cap, extract=extract, dtypes=dtypes)
+    )
+    ag = make_ag(c)
+    # float16 states + action + reward + done + valid flag (+ 2 bytes of masks)
+    slot_bytes = 256 * 2 + 8 + 4 + 1 + 1 + 2 * (make_ag is BootDQNAgent)
+    assert ag.replay.cap == 2**20 // slot_bytes - 1
+    for _ in ag.train_episodes(20):
+        pass
+    assert ag.replay.footprint()["allocated"] <= 2**20
+    ag.close()
+
+
+def test_replay_discount_factor() -> None:
+    c = rainy.Config()
+    c.discount_factor = 0.9
+    c.set_replay_buffer(
+        lambda cap: replay.ArrayReplayBuffer(replay.DQNReplayFeed, cap, nstep=3)
+    )
+    assert c.replay_buffer().discount_factor == 0.9
+    c.set_replay_buffer(
+        lambda cap: replay.ArrayReplayBuffer(
+            replay.DQNReplayFeed, cap, nstep=3, discount_factor=0.5
+        )
+    )
+    with pytest.raises(ValueError):
+        c.replay_buffer()
+
+
+def test_memmap_replay_logdir(tmp_path: Path) -> None:
+    c = rainy.Config()
+    c.logger.logdir = tmp_path
+    c.set_replay_buffer(partial(replay.MemmapReplayBuffer, replay.DQNReplayFeed))
+    buf = c.replay_buffer()
+    buf.append(np.zeros(2), 0, np.ones(2), 0.0, False)
+    assert buf.path == tmp_path.joinpath("replay")
+    buf.close()
+
+
+class ReplaySavingDQN(DQNAgent):
+    SAVED_MEMBERS = DQNAgent.SAVED_MEMBERS + ("replay",)
+
+
+@pytest.mark.parametrize(
+    "make_replay", [replay.UniformReplayBuffer, replay.ArrayReplayBuffer]
+)
+def test_dqn_save_replay(tmp_path: Path, make_replay: callable) -> None:
+    def make_ag() -> DQNAgent:
+        c = rainy.Config()
+        c.set_replay_buffer(
+            lambda cap: make_replay(replay.DQNReplayFeed, cap, chunk_size=8)
+        )
+        return ReplaySavingDQN(c)
+
+    def actions(ag: DQNAgent) -> np.ndarray:
+        batch = ag.replay.sample(len(ag.replay))
+        if isinstance(batch, list):
+            return np.sort([exp.action for exp in batch])
+        return np.sort(batch.actions)
+
+    ag = make_ag()
+    for _ in ag.train_episodes(2):
+        pass
+    ag.save("old.pth", tmp_path)
+    old_actions = actions(ag)
+    for _ in ag.train_episodes(4):
+        pass
+    ag.save("new.pth", tmp_path)
+    new_actions = actions(ag)
+    ag.close()
+    assert len(new_actions) > len(old_actions)
+    for name, expected in [("old.pth", old_actions), ("new.pth", new_actions)]:
+        loaded = make_ag()
+        assert loaded.load(tmp_path.joinpath(name))
+        np.testing.assert_array_equal(actions(loaded), expected)
+        loaded.close()
+
+
+@pytest.mark.parametrize("num_ensembles", [4, 10, 64])
+def test_bootdqn_masks(num_ensembles: int) -> None:
+    masks = np.random.rand(32, num_ensembles) < 0.5
+    packed = torch.from_numpy(np.packbits(masks, axis=-1))
+    unpacked = bootdqn.unpack_masks(packed, num_ensembles)
+    np.testing.assert_array_equal(unpacked.numpy(), masks)
+    c = rainy.Config()
+    c.num_ensembles = num_ensembles
+    c.set_env(partial(DummyEnvDeterministic, flatten=True))
+    c.set_net_fn("bootdqn", net.bootstrap.fc_separated(num_ensembles, units=[16, 16]))
+    c.set_replay_buffer(
+        lambda cap: replay.ArrayReplayBuffer(replay.BootDQNReplayFeed, cap)
+    )
+    ag = BootDQNAgent(c)
+    assert ag._masks(100).shape == (100, -(-num_ensembles // 8))
+    assert ag._masks(100).dtype == np.uint8
+    ag.close()
+
+
+@pytest.mark.parametrize(
+    "make_replay, double_buffered, env_batch_size, make_penv",
+    [
+        (replay.UniformReplayBuffer, False, None, rainy.envs.DummyParallelEnv),
+        (replay.ArrayReplayBuffer, False, None, rainy.envs.DummyParallelEnv),
+        (replay.ArrayReplayBuffer, True, None, rainy.envs.DummyParallelEnv),
+        (replay.ArrayReplayBuffer, False, 2, rainy.envs.DummyParallelEnv),
+        (replay.ArrayReplayBuffer, False, 2, rainy.envs.MultiProcEnv),
+    ],
+)
+def test_dqn_parallel(
+    make_replay: callable,
+    double_buffered: bool,
+    env_batch_size: Optional[int],
+    make_penv: callable,
+) -> None:
+    c = rainy.Config()
+    c.nworkers = 4
+    c.double_buffered_env = double_buffered
+    c.env_batch_size = env_batch_size
+    c.train_start = 16
+    c.replay_batch_size = 8
+    c.set_env(partial(DummyEnvDeterministic, flatten=True))
+    c.set_parallel_env(make_penv)
+    extract = DummyEnvDeterministic(flatten=True).extract
+    if make_replay is not replay.UniformReplayBuffer:
+        c.set_replay_buffer(
+            lambda cap: make_replay(replay.DQNReplayFeed, cap, extract=extract)
+        )
+    else:
+        c.set_replay_buffer(lambda cap: make_replay(replay.DQNReplayFeed, cap))
+    c.set_net_fn("dqn", net.value.fc(units=[16, 16]))
+    ag = DQNLikeParallel(DQNAgent(c))
+    for results in ag.train_episodes(100):
+        for r in results:
+            assert r.return_ == 20.0
+            assert r.length == 3
+    assert ag.total_steps >= 100
+    # All steps are stored, including the last half stepped asynchronously
+    assert len(ag.agent.replay) == ag.total_steps
+    assert ag.update_steps > 1
+    ag.close()
+
+
+@pytest.mark.parametrize(
+    "double_buffered, env_batch_size", [(False, None), (True, None), (False, 2)]
+)
+def test_bootdqn_parallel(double_buffered: bool, env_batch_size: Optional[int]) -> None:
+    c = rainy.Config()
+    c.nworkers = 4
+    c.double_buffered_env = double_buffered
+    c.env_batch_size = env_batch_size
+    c.train_start = 16
+    c.replay_batch_size = 8
+    c.set_env(partial(DummyEnvDeterministic, flatten=True))
+    c.set_parallel_env(rainy.envs.DummyParallelEnv)
+    extract = DummyEnvDeterministic(flatten=True).extract
+    c.set_replay_buffer(
+        lambda cap: replay.ArrayReplayBuffer(
+            replay.BootDQNReplayFeed, cap, extract=extract
+        )
+    )
+    c.set_net_fn("bootdqn", net.bootstrap.fc_separated(c.num_ensembles, units=[16]))
+    ag = DQNLikeParallel(BootDQNAgent(c))
+    for results in ag.train_episodes(100):
+        for r in results:
+            assert r.return_ == 20.0
+    assert ag.total_steps >= 100
+    # All steps are stored, including the last half stepped asynchronously
+    assert len(ag.agent.replay) == ag.total_steps
+    assert ag.update_steps > 1
+    # Each environment acts by its own head
+    boot = ag.agent
+    boot.policy = lib.explore.Greedy()
+    boot.active_heads[:] = np.arange(c.nworkers) % c.num_ensembles
+    states = ag.penv.reset()
+    x = ag.penv.extract(states)
+    expected = [
+        boot.net.q_i_s(head, x[i : i + 1]).argmax(-1).item()
+        for i, head in enumerate(boot.active_heads)
+    ]
+    np.testing.assert_array_equal(boot.batch_actions(states, ag.penv), expected)
+    # Only heads of environments whose episodes end are re-drawn
+    heads = boot.active_heads.copy()
+    boot.store_transitions(
+        states[:2],
+        np.zeros(2, dtype=np.int64),
+        states[:2],
+        np.zeros(2),
+        np.array([False, True]),
+        np.array([1, 3]),
+    )
+    np.testing.assert_array_equal(boot.active_heads[:3], heads[:3])
+    ag.close()
+
+
+def test_dqn_double_buffered_spin() -> None:
+    c = rainy.Config()
+    c.nworkers = 4
+    c.double_buffered_env = True
+    c.set_env(partial(DummyEnvDeterministic, flatten=True))
+    c.set_net_fn("dqn", net.value.fc(units=[16, 16]))
+    # A process would have environments of both halves
+    c.set_parallel_env(partial(rainy.envs.SpinProcEnv, envs_per_worker=3))
+    with pytest.raises(ValueError):
+        DQNLikeParallel(DQNAgent(c))
+    c.set_parallel_env(partial(rainy.envs.SpinProcEnv, envs_per_worker=2))
+    ag = DQNLikeParallel(DQNAgent(c))
+    for _ in ag.train_episodes(20):
+        pass
+    assert len(ag.agent.replay) == ag.total_steps
+    ag.close()
+
+
+@pytest.mark.parametrize("env_batch_size", [None, 2])
+def test_dqn_parallel_reward_monitor(env_batch_size: Optional[int]) -> None:
+    c = rainy.Config()
+    c.nworkers = 4
+    c.env_batch_size = env_batch_size
+    c.train_start = 16
+    c.replay_batch_size = 8
+    c.set_env(partial(DummyEnvDeterministic, flatten=True, monitor=True))
+    c.set_parallel_env(rainy.envs.MultiProcEnv)
+    c.set_net_fn("dqn", net.value.fc(units=[16, 16]))
+    ag = DQNLikeParallel(DQNAgent(c))
+    nepisodes = 0
+    for results in ag.train_episodes(60):
+        for r in results:
+            assert r.return_ == 20.0
+            assert r.length == 3
+        nepisodes += len(results)
+    assert nepisodes >= 16
+    ag.close()
+
+
+@pytest.mark.parametrize("nworkers, ratio", [(1, 0.25), (1, 4.0), (4, 0.5), (4, 2.0)])
+def test_dqn_replay_ratio(nworkers: int, ratio: float) -> None:
+    c = rainy.Config()
+    c.nworkers = nworkers
+    c.train_start = 16
+    c.replay_batch_size = 8
+    c.replay_ratio = ratio
+    c.set_env(partial(DummyEnvDeterministic, flatten=True))
+    c.set_parallel_env(rainy.envs.DummyParallelEnv)
+    extract = DummyEnvDeterministic(flatten=True).extract
+    c.set_replay_buffer(
+        lambda cap: replay.ArrayReplayBuffer(replay.DQNReplayFeed, cap, extract=extract)
+    )
+    c.set_net_fn("dqn", net.value.fc(units=[16, 16]))
+    ag = DQNAgent(c)
+    if nworkers > 1:
+        ag = DQNLikeParallel(ag)
+    for _ in ag.train_episodes(64):
+        pass
+    # Updates start when total_steps reaches train_start
+    assert ag.update_steps - 1 == int((64 - 16) * ratio)
+    ag.close()
@@ -1,9 +1,24 @@
+import os
+import time
+from functools import partial
+
+import gym
 import numpy as np
 import pytest
 from numpy.testing import assert_array_almost_equal
 
 from rainy import envs
-from rainy.envs import DummyParallelEnv, FrameStackParallel, MultiProcEnv, ParallelEnv
+from rainy.envs import (
+    DummyParallelEnv,
+    EnvExt,
+    FrameStackParallel,
+    MultiProcEnv,
+    ParallelEnv,
+    ScaleObs,
+    SpinProcEnv,
+    ThreadedParallelEnv,
+)
+from rainy.envs.cartpole_ext import CartPoleSwingUp, CartPoleSwingUpContinuous
 from rainy.envs.testing import DummyEnv, DummyEnvDeterministic, State
 
 
@@ -54,6 +69,310 @@ def test_frame_stack(penv: ParallelEnv, nstack: int) -> None:
     penv.close()
 
 
+@pytest.mark.parametrize("views", [False, True])
+def test_multiproc_shared_memory(views: bool) -> None:
+    penv = MultiProcEnv(
+        lambda: DummyEnvDeterministic(), 4, shared_memory=True, views=views
+    )
+    expected = DummyParallelEnv(lambda: DummyEnvDeterministic(), 4)
+    states = penv.reset()
+    assert states.shape == (4, 16, 16)
+    assert_array_almost_equal(states, expected.extract(expected.reset()))
+    assert penv.extract(states) is states
+    for i in range(6):
+        transition = penv.step([None] * 4)
+        expected_transition = expected.step([None] * 4)
+        assert_array_almost_equal(
+            transition.states, expected.extract(expected_transition.states)
+        )
+        assert_array_almost_equal(transition.rewards, expected_transition.rewards)
+        np.testing.assert_array_equal(
+            transition.terminals, expected_transition.terminals
+        )
+        assert transition.infos is None
+        # Transitions are views of 2 buffers used in turn only if `views`
+        shared = np.shares_memory(transition.states, states)
+        assert shared == (views and i % 2 == 1)
+        # Unpacking doesn't copy states
+        unpacked_states, *_ = transition
+        assert unpacked_states is transition.states
+    penv.close()
+
+
+@pytest.mark.parametrize("shared_memory", [False, True])
+def test_multiproc_envs_per_worker(shared_memory: bool) -> None:
+    penv = MultiProcEnv(
+        lambda: DummyEnvDeterministic(),
+        5,
+        shared_memory=shared_memory,
+        envs_per_worker=2,
+    )
+    assert len(penv.envs) == 3
+    expected = DummyParallelEnv(lambda: DummyEnvDeterministic(), 5)
+    states = penv.extract(penv.reset())
+    assert_array_almost_equal(states, expected.extract(expected.reset()))
+    for _ in range(6):
+        transition = penv.step([None] * 5)
+        expected_transition = expected.step([None] * 5)
+        assert_array_almost_equal(
+            penv.extract(transition.states),
+            expected.extract(expected_transition.states),
+        )
+        assert_array_almost_equal(transition.rewards, expected_transition.rewards)
+        assert transition.infos is None
+    assert len(penv.do_any("reset")) == 5
+    penv.close()
+
+
+@pytest.mark.parametrize("shared_memory", [False, True])
+def test_multiproc_step_async(shared_memory: bool) -> None:
+    penv = FrameStackParallel(
+        MultiProcEnv(
+            lambda: DummyEnvDeterministic(),
+            5,
+            shared_memory=shared_memory,
+            envs_per_worker=2,
+        )
+    )
+    expected = FrameStackParallel(DummyParallelEnv(lambda: DummyEnvDeterministic(), 5))
+    assert_array_almost_equal(penv.reset(), expected.reset())
+    halves = np.array([0, 1, 4]), np.array([2, 3])
+    penv.step_async([None] * 3, halves[0])
+    expected.step_async([None] * 3, halves[0])
+    for i in range(1, 8):
+        # Two halves are in flight and returned in order
+        indices = halves[i % 2]
+        penv.step_async([None] * len(indices), indices)
+        expected.step_async([None] * len(indices), indices)
+        transition, expected_transition = penv.step_wait(), expected.step_wait()
+        assert transition.states.shape == (len(halves[1 - i % 2]), 4, 16, 16)
+        assert_array_almost_equal(transition.states, expected_transition.states)
+        assert_array_almost_equal(transition.rewards, expected_transition.rewards)
+    penv.step_wait()
+    transition = penv.step([None] * 5)
+    assert transition.states.shape == (5, 4, 16, 16)
+    penv.close()
+
+
+class SlowEnv(DummyEnvDeterministic):
+    def __init__(self, delay: float) -> None:
+        super().__init__()
+        self.delay = delay
+
+    def step(self, action):
+        time.sleep(self.delay)
+        return super().step(action)
+
+
+class ChildOnlyEnv(DummyEnvDeterministic):
+    """Breaks when reset in the parent process, as PyBullet after fork"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.parent = os.getpid()
+
+    def reset(self) -> State:
+        assert os.getpid() != self.parent, "reset in the parent process"
+        return super().reset()
+
+
+@pytest.mark.parametrize(
+    "make_penv",
+    [partial(MultiProcEnv, shared_memory=True, envs_per_worker=2), SpinProcEnv],
+)
+def test_no_reset_in_parent(make_penv: callable) -> None:
+    penv = make_penv(ChildOnlyEnv, 4)
+    expected = DummyParallelEnv(lambda: DummyEnvDeterministic(), 4)
+    assert_array_almost_equal(penv.reset(), expected.extract(expected.reset()))
+    penv.close()
+    if isinstance(penv, SpinProcEnv):
+        assert not any(worker.is_alive() for worker in penv.workers)
+
+
+@pytest.mark.parametrize(
+    "make_penv",
+    [
+        partial(MultiProcEnv, envs_per_worker=2),
+        partial(MultiProcEnv, shared_memory=True, envs_per_worker=2),
+        partial(ThreadedParallelEnv, nthreads=3),
+    ],
+)
+def test_send_recv(make_penv: callable) -> None:
+    delays = iter([1.0, 0.0, 0.0, 0.0, 0.0])
+    penv = FrameStackParallel(make_penv(lambda: SlowEnv(next(delays)), 5))
+    expected = FrameStackParallel(DummyParallelEnv(lambda: DummyEnvDeterministic(), 5))
+    assert_array_almost_equal(penv.reset(), expected.reset())
+    penv.send([None] * 5)
+    for i in range(4):
+        # Environments 0 and 1 in the slow process or thread aren't ready
+        envids, transition = penv.recv(3)
+        assert sorted(envids) == [2, 3, 4]
+        expected.step_async([None] * 3, envids)
+        expected_transition = expected.step_wait()
+        assert_array_almost_equal(transition.states, expected_transition.states)
+        assert_array_almost_equal(transition.rewards, expected_transition.rewards)
+        if i < 3:
+            penv.send([None] * 3, envids)
+    envids, transition = penv.recv(2)
+    assert sorted(envids) == [0, 1]
+    expected.step_async([None] * 2, envids)
+    assert_array_almost_equal(transition.states, expected.step_wait().states)
+    with pytest.raises(RuntimeError):
+        penv.recv(1)
+    penv.close()
+
+
+@pytest.mark.parametrize(
+    "make_penv",
+    [
+        DummyParallelEnv,
+        partial(MultiProcEnv, envs_per_worker=2),
+        partial(MultiProcEnv, shared_memory=True, envs_per_worker=2),
+        SpinProcEnv,
+        ThreadedParallelEnv,
+    ],
+)
+def test_episode_stats(make_penv: callable) -> None:
+    penv = make_penv(lambda: DummyEnvDeterministic(monitor=True), 4)
+    assert penv.use_reward_monitor
+    penv.reset()
+    actions = np.zeros(4, dtype=np.int64)
+    for i in range(1, 7):
+        transition = penv.step(actions)
+        episodes = transition.episodes
+        # Each episode has 3 steps
+        assert_array_almost_equal(episodes.done, [i % 3 == 0] * 4)
+        if i % 3 == 0:
+            assert_array_almost_equal(episodes.returns, [20.0] * 4)
+            assert_array_almost_equal(episodes.lengths, [3] * 4)
+            assert np.all(episodes.times > 0.0)
+    penv.send(actions)
+    envids, transition = penv.recv(4)
+    assert sorted(envids) == [0, 1, 2, 3]
+    assert not np.any(transition.episodes.done)
+    penv.close()
+
+
+@pytest.mark.parametrize("make_penv", [MultiProcEnv, DummyParallelEnv])
+def test_multiproc_infos(make_penv: callable) -> None:
+    penv = make_penv(lambda: DummyEnvDeterministic(monitor=True), 2, infos=True)
+    penv.reset()
+    for _ in range(3):
+        transition = penv.step([None] * 2)
+    assert [info["episode"]["l"] for info in transition.infos] == [3, 3]
+    penv.close()
+    penv = make_penv(lambda: DummyEnvDeterministic(monitor=True), 2)
+    penv.reset()
+    assert penv.step([None] * 2).infos is None
+    penv.close()
+
+
+@pytest.mark.parametrize("envs_per_worker, spin", [(1, 0), (2, 100)])
+def test_spin_proc_env(envs_per_worker: int, spin: int) -> None:
+    penv = SpinProcEnv(
+        lambda: DummyEnvDeterministic(), 5, envs_per_worker=envs_per_worker, spin=spin
+    )
+    expected = DummyParallelEnv(lambda: DummyEnvDeterministic(), 5)
+    assert_array_almost_equal(penv.reset(), expected.extract(expected.reset()))
+    for _ in range(6):
+        transition = penv.step(np.zeros(5, dtype=np.int64))
+        expected_transition = expected.step([None] * 5)
+        assert_array_almost_equal(
+            transition.states, expected.extract(expected_transition.states)
+        )
+        assert_array_almost_equal(transition.rewards, expected_transition.rewards)
+        np.testing.assert_array_equal(
+            transition.terminals, expected_transition.terminals
+        )
+        assert transition.infos is None
+    penv.step_async([0, 0], [1, 4])
+    expected.step_async([None] * 2, [1, 4])
+    transition, expected_transition = penv.step_wait(), expected.step_wait()
+    assert_array_almost_equal(transition.rewards, expected_transition.rewards)
+    penv.seed(range(5))
+    assert_array_almost_equal(penv.do_any("state_reward", (4,)), [20.0] * 5)
+    penv.close()
+
+
+@pytest.mark.parametrize("continuous", [False, True])
+def test_swingup_vector(continuous: bool) -> None:
+    penv = envs.swingup_vector(continuous=continuous, max_steps=20)(None, 8)
+    penv.seed(range(8))
+    states = penv.reset()
+    assert states.shape == (8, 5)
+    envs_ = [
+        CartPoleSwingUpContinuous() if continuous else CartPoleSwingUp()
+        for _ in range(8)
+    ]
+    for env, state in zip(envs_, penv.state):
+        env.reset()
+        env.state = tuple(state)
+    for t in range(20):
+        if continuous:
+            actions = np.random.uniform(-1.0, 1.0, size=(8, 1))
+        else:
+            actions = np.random.randint(2, size=8)
+        transition = penv.step(actions)
+        assert transition.infos is None
+        for i, env in enumerate(envs_):
+            obs, reward, done, _ = env.step(actions[i])
+            assert transition.rewards[i] == pytest.approx(reward)
+            if t < 19:
+                assert transition.terminals[i] == done
+            if not transition.terminals[i]:
+                assert_array_almost_equal(transition.states[i], obs)
+    # All episodes are truncated by max_steps and reset
+    assert transition.terminals.all()
+    assert_array_almost_equal(penv._episode_steps, np.zeros(8))
+
+
+@pytest.mark.parametrize("size", [8, 70])
+def test_deepsea_vector(size: int) -> None:
+    penv = envs.DeepSeaVector(6, size)
+    deepseas = [envs.DeepSeaGymEnv(size) for _ in range(6)]
+    states = penv.reset()
+    assert states.shape == (6, size ** 2)
+    assert_array_almost_equal(states, [env.reset() for env in deepseas])
+    for _ in range(size * 3):
+        actions = np.random.randint(2, size=6)
+        transition = penv.step(actions)
+        for i, env in enumerate(deepseas):
+            obs, reward, done, _ = env.step(actions[i])
+            if done:
+                obs = env.reset()
+            assert_array_almost_equal(transition.states[i], obs)
+            assert transition.rewards[i] == pytest.approx(reward)
+            assert transition.terminals[i] == done
+
+
+@pytest.mark.parametrize("infos", [False, True])
+def test_threaded_parallel_env(infos: bool) -> None:
+    penv = FrameStackParallel(
+        ThreadedParallelEnv(lambda: DummyEnvDeterministic(), 5, nthreads=2, infos=infos)
+    )
+    expected = FrameStackParallel(
+        DummyParallelEnv(lambda: DummyEnvDeterministic(), 5)
+    )
+    assert_array_almost_equal(penv.reset(), expected.reset())
+    for _ in range(6):
+        transition = penv.step([None] * 5)
+        expected_transition = expected.step([None] * 5)
+        assert_array_almost_equal(transition.states, expected_transition.states)
+        assert_array_almost_equal(transition.rewards, expected_transition.rewards)
+        if infos:
+            assert len(transition.infos) == 5
+        else:
+            assert transition.infos is None
+    penv.step_async([None] * 2, [4, 1])
+    expected.step_async([None] * 2, [4, 1])
+    with pytest.raises(RuntimeError):
+        penv.step_async([None] * 2, [0, 1])
+    transition, expected_transition = penv.step_wait(), expected.step_wait()
+    assert_array_almost_equal(transition.states, expected_transition.states)
+    assert_array_almost_equal(penv.do_any("state_reward", (4,)), [20.0] * 5)
+    penv.close()
+
+
 @pytest.mark.parametrize("style", ["dopamine", "deepmind", "baselines"])
 def test_atari(style: str):
     atari = envs.Atari("Pong", style=style)
@@ -65,3 +384,40 @@ def test_atari(style: str):
     assert s.shape == STATE_DIM
     frame_stack = atari.as_cls("FrameStack")
     assert isinstance(frame_stack, envs.atari_wrappers.FrameStack)
+
+
+class ByteImageEnv(gym.Env):
+    """Returns uint8 images, whose values are the number of steps"""
+
+    observation_space = gym.spaces.Box(0, 255, shape=(4, 4), dtype=np.uint8)
+    action_space = gym.spaces.Discrete(2)
+
+    def reset(self) -> np.ndarray:
+        self.nsteps = 0
+        return np.full((4, 4), 100, dtype=np.uint8)
+
+    def step(self, _action) -> tuple:
+        self.nsteps += 1
+        return np.full((4, 4), 100 + self.nsteps, dtype=np.uint8), 0.0, False, {}
+
+
+@pytest.mark.parametrize(
+    "make_penv",
+    [
+        partial(MultiProcEnv, shared_memory=True),
+        SpinProcEnv,
+        ThreadedParallelEnv,
+    ],
+)
+def test_scaled_obs_buffers(make_penv: callable) -> None:
+    penv = make_penv(lambda: EnvExt(ScaleObs(ByteImageEnv())), 4)
+    # Buffers hold scaled observations as float32, not as uint8
+    assert penv._spec.state_dtype == np.float32
+    states = penv.reset()
+    assert states.dtype == np.float32
+    assert_array_almost_equal(states, np.full((4, 4, 4), 100 / 255))
+    for i in range(1, 3):
+        transition = penv.step(np.zeros(4, dtype=np.int64))
+        expected = np.full((4, 4, 4), (100 + i) / 255)
+        assert_array_almost_equal(transition.states, expected)
+    penv.close()
@@ -42,6 +42,55 @@ def test_storage(penv: ParallelEnv) -> None:
     penv.close()
 
 
+def test_storage_push_ragged() -> None:
+    penv = DummyParallelEnv(lambda: DummyEnv(array_dim=(16, 16)), 6)
+    NWORKERS = penv.nworkers
+    lockstep = RolloutStorage(NSTEP, NWORKERS, Device())
+    ragged = RolloutStorage(NSTEP, NWORKERS, Device())
+    initial_states = penv.reset()
+    rnn_state = recurrent.LstmState(torch.zeros(NWORKERS, 2), torch.zeros(NWORKERS, 2))
+    lockstep.set_initial_state(initial_states, rnn_state)
+    ragged.set_initial_state(initial_states, rnn_state)
+    policy_dist = CategoricalDist(ACTION_DIM)
+    transitions = []
+    for _ in range(NSTEP):
+        state, reward, done, _ = penv.step([None] * NWORKERS)
+        policy = policy_dist(torch.rand(NWORKERS, ACTION_DIM))
+        policy.action()
+        outputs = dict(
+            rnn_state=recurrent.LstmState(
+                torch.randn(NWORKERS, 2), torch.randn(NWORKERS, 2)
+            ),
+            policy=policy,
+            value=torch.rand(NWORKERS),
+        )
+        lockstep.push(state, reward, done, **outputs)
+        transitions.append((state, reward, done, outputs))
+    # Environments push their rows in a different order
+    order = [[0, 1], [0, 1], [2, 3, 4], [0], [5], [2, 5], [1, 3, 4], [5], [0]]
+    order += [[1, 2, 3, 4, 5], [2, 3, 4]]
+    steps = [0] * NWORKERS
+    for envids in order:
+        for i in envids:
+            state, reward, done, outputs = transitions[steps[i]]
+            ragged.push_ragged(
+                [i], steps[i], state[[i]], reward[[i]], done[[i]], **outputs
+            )
+            steps[i] += 1
+    assert steps == [NSTEP] * NWORKERS
+    for i in range(NSTEP + 1):
+        assert (
+            penv.extract(ragged.states[i]) == penv.extract(lockstep.states[i])
+        ).all()
+        assert torch.equal(ragged.masks[i], lockstep.masks[i])
+        assert torch.equal(ragged.rnn_states[i].h, lockstep.rnn_states[i].h)
+    for i in range(NSTEP):
+        assert (ragged.rewards[i] == lockstep.rewards[i]).all()
+        assert torch.equal(ragged.values[i], lockstep.values[i])
+        assert torch.equal(ragged.policies[i].action(), lockstep.policies[i].action())
+    penv.close()
+
+
 def test_oc_storage() -> None:
     penv = DummyParallelEnv(lambda: DummyEnv(array_dim=(16, 16)), 6)
     NWORKERS = penv.nworkers
@@ -47,6 +47,31 @@ def test_getitem(policy: P.Policy) -> None:
     assert_array(best[3:8].numpy(), partial.numpy())
 
 
+@pytest.mark.parametrize(
+    "policy, other",
+    [
+        (
+            P.BernoulliPolicy(logits=torch.randn(10)),
+            P.BernoulliPolicy(logits=torch.randn(10)),
+        ),
+        (
+            P.CategoricalPolicy(logits=torch.randn(10, 10)),
+            P.CategoricalPolicy(logits=torch.randn(10, 10)),
+        ),
+        (
+            P.GaussianPolicy(torch.zeros(10), torch.ones(10)),
+            P.GaussianPolicy(torch.randn(10), torch.ones(10)),
+        ),
+    ],
+)
+def test_setitem(policy: P.Policy, other: P.Policy) -> None:
+    action, other_action = policy.action(), other.action()
+    policy[3:8] = other
+    assert_array(policy.best_action()[3:8].numpy(), other.best_action()[3:8].numpy())
+    assert_array(policy.action()[3:8].numpy(), other_action[3:8].numpy())
+    assert_array(policy.action()[:3].numpy(), action[:3].numpy())
+
+
 @pytest.mark.parametrize(
     "policy",
     [
@@ -77,3 +102,18 @@ def test_detach(policy: P.Policy) -> None:
     assert log_pi.requires_grad
     detached = policy.detach()
     assert not detached.log_prob().requires_grad
+
+
+@pytest.mark.parametrize(
+    "policy",
+    [
+        P.CategoricalPolicy(logits=torch.randn(10, 4)),
+        P.GaussianPolicy(torch.randn(10, 2), torch.ones(10, 2)),
+    ],
+)
+def test_take(policy: P.Policy) -> None:
+    action = policy.action()
+    rows = torch.tensor([2, 2, 5, 0])
+    taken = policy.take(rows)
+    assert_array(taken.action().numpy(), action[rows].numpy())
+    assert_array(taken.best_action().numpy(), policy.best_action()[rows].numpy())
@@ -4,8 +4,9 @@ import pytest
 from torch.optim import Adam
 
 from rainy import Config
-from rainy.agents import PPOAgent
+from rainy.agents import DDPGAgent, PPOAgent
 from rainy.envs import MultiProcEnv, PyBullet, pybullet_parallel
+from rainy.lib.explore import GaussianNoise
 
 LOG_DIR = Path("/tmp/rainy-test/")
 
@@ -62,3 +63,25 @@ def test_rms_save() -> None:
     mean = ppo.penv.as_cls("NormalizeObsParallel")._rms.mean.mean()
     assert 9.999 <= mean <= 10.001
     ppo.close()
+
+
+@pytest.mark.skipif(not HAS_PYBULLET, reason="PyBullet is an optional dependency")
+def test_ddpg_replay_save() -> None:
+    c = config()
+    c.set_env(lambda: PyBullet("Hopper"))
+    c.set_explorer(lambda: GaussianNoise())
+    c.set_optimizer(lambda params: Adam(params, lr=1e-3), key="actor")
+    c.set_optimizer(lambda params: Adam(params, lr=1e-3), key="critic")
+    ddpg = DDPGAgent(c)
+    state = ddpg.env.reset()
+    for _ in range(10):
+        action = ddpg.env.spec.random_action()
+        transition = ddpg.env.step(action)
+        ddpg.store_transition(state, action, transition)
+        state = transition.state
+    ddpg.save("ddpg-agent.pth")
+    ddpg.close()
+    ddpg = DDPGAgent(c)
+    ddpg.load(c.logger.logdir.joinpath("ddpg-agent.pth"))
+    assert len(ddpg.replay) == 10
+    ddpg.close()